@@ -0,0 +1,209 @@
+# Azure AI Agent Service のエージェント定義を実行ごとに作り直さずに再利用する
+#
+# consoleapp_groupchat.py は実行のたびに create_agent を3回呼び、finally で3つとも削除していたため、
+# 最初のメッセージの前に毎回コントロールプレーンへの往復が何回も発生していました。
+# AgentDefinitionCache は作成したエージェントのメタデータに定義 (モデル・指示・ツール) のハッシュを保存し、
+# 次回は list_agents 1回で名前とハッシュが一致するエージェントを見つけてそのまま使います。
+# 定義が変わったときだけ update_agent、見つからないときだけ create_agent を呼びます。
+# 削除は実行ごとではなく cleanup() で明示的に行います。
+#
+#   cache = AgentDefinitionCache(client.agents, scope="consoleapp_groupchat")
+#   definition = await cache.ensure(name="Director", model="gpt-4o", instructions=REVIEWER_INSTRUCTIONS)
+#   agent = AzureAIAgent(client=client, definition=definition)
+#   ...
+#   await cache.cleanup()   # このスコープで作ったエージェントをすべて削除
+
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import unittest
+
+logger = logging.getLogger(__name__)
+
+# エージェントのメタデータに保存するキー
+HASH_KEY = "definition_hash"
+SCOPE_KEY = "definition_scope"
+
+
+def _tool_dict(tool) -> dict:
+    # azure の Model は as_dict()、それ以外は dict とみなす
+    return tool.as_dict() if hasattr(tool, "as_dict") else dict(tool)
+
+
+def definition_hash(model: str, instructions: str | None, tools=None) -> str:
+    """A short hash of everything that makes two agent definitions different."""
+    definition = {
+        "model": model,
+        "instructions": instructions or "",
+        "tools": [_tool_dict(tool) for tool in tools or []],
+    }
+    text = json.dumps(definition, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+async def _list_agents(agents_client, page_size: int = 100):
+    """Yields every agent, for both the paged (azure-ai-agents) and list-result (azure-ai-projects 1.0) APIs."""
+    result = agents_client.list_agents(limit=page_size)
+    if not inspect.isawaitable(result):
+        async for agent in result:
+            yield agent
+        return
+    page = await result
+    while True:
+        for agent in page.data:
+            yield agent
+        if not page.has_more:
+            return
+        page = await agents_client.list_agents(limit=page_size, after=page.last_id)
+
+
+class AgentDefinitionCache:
+    """
+    Finds, creates or updates Azure AI agents by name and definition hash.
+
+    Args:
+        agents_client: `client.agents` of an AIProjectClient (or an AgentsClient).
+        scope: Stored in each agent's metadata; only agents of this scope are reused or cleaned up.
+    """
+
+    def __init__(self, agents_client, scope: str = "default"):
+        self.agents_client = agents_client
+        self.scope = scope
+        self._agents = None
+        self._lock = asyncio.Lock()
+        self.stats = {"created": 0, "updated": 0, "reused": 0}
+
+    async def _managed_agents(self) -> dict:
+        # 1回の list_agents で、このスコープのエージェントを名前で引けるようにする
+        async with self._lock:
+            if self._agents is None:
+                agents = {}
+                async for agent in _list_agents(self.agents_client):
+                    if (agent.metadata or {}).get(SCOPE_KEY) == self.scope:
+                        # 一覧は新しい順なので、同じ名前が重複していれば最新を使う
+                        agents.setdefault(agent.name, agent)
+                self._agents = agents
+            return self._agents
+
+    async def ensure(self, name: str, model: str, instructions: str | None = None, tools=None, **kwargs):
+        """
+        Returns the agent definition for `name`, creating or updating it only when it changed.
+        Extra keyword arguments (e.g. headers) are passed to create_agent / update_agent.
+        """
+        digest = definition_hash(model, instructions, tools)
+        agents = await self._managed_agents()
+        existing = agents.get(name)
+        if existing is not None and (existing.metadata or {}).get(HASH_KEY) == digest:
+            self.stats["reused"] += 1
+            return existing
+        previous = existing.metadata if existing is not None else None
+        metadata = {**(previous or {}), SCOPE_KEY: self.scope, HASH_KEY: digest}
+        if existing is None:
+            agent = await self.agents_client.create_agent(
+                model=model, name=name, instructions=instructions, tools=tools, metadata=metadata, **kwargs
+            )
+            self.stats["created"] += 1
+        else:
+            logger.info("Agent definition for '%s' changed; updating %s.", name, existing.id)
+            agent = await self.agents_client.update_agent(
+                existing.id, model=model, name=name, instructions=instructions, tools=tools or [], metadata=metadata, **kwargs
+            )
+            self.stats["updated"] += 1
+        agents[name] = agent
+        return agent
+
+    async def cleanup(self, names=None) -> list[str]:
+        """Deletes the agents of this scope (only those in `names`, if given) and returns their ids."""
+        async with self._lock:
+            self._agents = None
+        # 一覧のページ送りが削除の影響を受けないよう、先に全部集めてから削除する
+        deleted = [
+            agent.id
+            async for agent in _list_agents(self.agents_client)
+            if (agent.metadata or {}).get(SCOPE_KEY) == self.scope and (names is None or agent.name in names)
+        ]
+        for agent_id in deleted:
+            await self.agents_client.delete_agent(agent_id)
+        return deleted
+
+
+class TestAgentDefinitionCache(unittest.TestCase):
+    class FakeAgentsClient:
+        """Stands in for client.agents with the azure-ai-projects 1.0 list result."""
+
+        def __init__(self, agents=None):
+            from types import SimpleNamespace
+
+            self.ns = SimpleNamespace
+            self.agents = list(agents or [])
+            self.calls = []
+
+        async def list_agents(self, limit=20, after=None):
+            self.calls.append("list")
+            start = next((i + 1 for i, a in enumerate(self.agents) if a.id == after), 0) if after else 0
+            data = self.agents[start:start + limit]
+            return self.ns(data=data, has_more=start + limit < len(self.agents), last_id=data[-1].id if data else None)
+
+        async def create_agent(self, model, name, instructions=None, tools=None, metadata=None, **kwargs):
+            self.calls.append("create")
+            agent = self.ns(id=f"asst_{len(self.calls)}", name=name, model=model, instructions=instructions, metadata=metadata)
+            self.agents.insert(0, agent)
+            return agent
+
+        async def update_agent(self, agent_id, model, name, instructions=None, tools=None, metadata=None, **kwargs):
+            self.calls.append("update")
+            agent = next(a for a in self.agents if a.id == agent_id)
+            agent.instructions, agent.metadata = instructions, metadata
+            return agent
+
+        async def delete_agent(self, agent_id):
+            self.calls.append("delete")
+            self.agents = [a for a in self.agents if a.id != agent_id]
+
+    def test_reuses_updates_and_cleans_up(self):
+        from types import SimpleNamespace
+
+        tools = [{"type": "bing_grounding", "bing_grounding": {"connection_id": "conn"}}]
+        # 同じ名前でも、このスコープ以外のエージェントには触れない
+        others = [SimpleNamespace(id=f"other_{i}", name="CopyWriter", metadata={}) for i in range(3)]
+        client = self.FakeAgentsClient(others)
+
+        async def run_app(instructions):
+            cache = AgentDefinitionCache(client, scope="test")
+            client.calls.clear()
+            ids = [
+                (await cache.ensure("CopyWriter", "gpt-4o", instructions)).id,
+                (await cache.ensure("IPChecker", "gpt-4o", "check", tools=tools, headers={"x-ms-enable-preview": "true"})).id,
+            ]
+            return ids, list(client.calls), cache.stats
+
+        async def run():
+            first = await run_app("write")
+            second = await run_app("write")
+            third = await run_app("write better")
+            deleted = await AgentDefinitionCache(client, scope="test").cleanup()
+            return first, second, third, deleted, [a.id for a in client.agents]
+
+        first, second, third, deleted, remaining = asyncio.run(run())
+        self.assertEqual(first[2], {"created": 2, "updated": 0, "reused": 0})
+        # 2回目は一覧1回だけで、同じエージェントを使う
+        self.assertEqual(second[0], first[0])
+        self.assertEqual(second[1], ["list"])
+        self.assertEqual(second[2]["reused"], 2)
+        # 指示が変わったものだけ更新
+        self.assertEqual(third[0], first[0])
+        self.assertEqual(third[2], {"created": 0, "updated": 1, "reused": 1})
+        self.assertEqual(sorted(deleted), sorted(first[0]))
+        self.assertEqual(remaining, ["other_0", "other_1", "other_2"])
+
+    def test_definition_hash(self):
+        tools = [{"type": "bing_grounding"}]
+        self.assertEqual(definition_hash("gpt-4o", "a", tools), definition_hash("gpt-4o", "a", [dict(tools[0])]))
+        self.assertNotEqual(definition_hash("gpt-4o", "a"), definition_hash("gpt-4o", "a", tools))
+        self.assertNotEqual(definition_hash("gpt-4o", "a"), definition_hash("gpt-4o-mini", "a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+# 多数の WebAPIAgent を1つの HTTP セッションと1つの LLM クライアントで動かすレジストリ
+#
+# REST エンドポイントごとに WebAPIAgent を作ると、エージェントごとにセッションや Kernel ができ、
+# LLM クライアントはモジュールのグローバル変数に頼ることになります。
+# ApiAgentRegistry は接続数に上限のある aiohttp セッション、その上の ApiResponseCache、
+# AsyncAzureOpenAI、Kernel をそれぞれ1つだけ持ち、登録するエージェントはそれを参照するだけにします。
+# エンドポイント (scheme://host:port) ごとに同時取得数も制限できます。
+#
+#   async with ApiAgentRegistry(ttl=600) as registry:
+#       registry.register("TokyoWeather", "...", "https://www.jma.go.jp/bosai/forecast/data/forecast/130000.json",
+#                         reducer=reduce_jma_forecast, concurrency=4)
+#       registry.register("OsakaWeather", "...", "https://www.jma.go.jp/bosai/forecast/data/forecast/270000.json",
+#                         reducer=reduce_jma_forecast)
+#       async for chunk in registry["TokyoWeather"].invoke_stream("明日の天気は?"):
+#           ...
+#       print(registry.format_report())
+
+import asyncio
+import unittest
+
+from openai import AsyncAzureOpenAI
+from semantic_kernel import Kernel
+
+from webapi_agent import WebAPIAgent, make_openai_client
+from webapi_cache import ApiResponseCache, PayloadReducer, endpoint_of
+
+
+class ApiAgentRegistry:
+    """
+    Creates WebAPIAgents that share one HTTP session, response cache, LLM client and kernel.
+
+    close() closes the HTTP session, and the LLM client if the registry built it.
+
+    Args:
+        client: The LLM client, owned by the caller; when omitted the registry
+            builds its own AsyncAzureOpenAI from the environment.
+        model: The deployment name passed to the client.
+        ttl: Seconds an API response stays in the shared cache.
+        max_connections: Total sockets of the shared HTTP session.
+        max_connections_per_host: Sockets per host of the shared HTTP session.
+        default_concurrency: Concurrent fetches per endpoint unless register() says otherwise; None means no limit.
+    """
+
+    def __init__(
+        self,
+        client: AsyncAzureOpenAI = None,
+        model: str = None,
+        ttl: float = 300.0,
+        max_connections: int = 100,
+        max_connections_per_host: int = 10,
+        default_concurrency: int | None = None,
+    ):
+        # 渡されたクライアントは呼び出し側のものなので閉じない
+        self._owns_client = client is None
+        self.client = client or make_openai_client()
+        self.model = model
+        self.default_concurrency = default_concurrency
+        self.cache = ApiResponseCache(
+            ttl=ttl, max_connections=max_connections, max_connections_per_host=max_connections_per_host
+        )
+        self.kernel = Kernel()
+        self.agents = {}
+        self._limited = set()
+
+    def set_concurrency(self, endpoint: str, limit: int):
+        """Allows at most `limit` concurrent fetches to `endpoint` across all agents; a later call resizes it."""
+        self.cache.set_concurrency(endpoint, limit)
+        self._limited.add(endpoint_of(endpoint))
+
+    def register(
+        self,
+        name: str,
+        instructions: str,
+        api_url: str,
+        reducer: PayloadReducer = None,
+        concurrency: int | None = None,
+    ) -> WebAPIAgent:
+        """Creates an agent for `api_url`; `concurrency` limits its endpoint for every agent sharing it."""
+        if name in self.agents:
+            raise ValueError(f"Agent '{name}' is already registered.")
+        endpoint = endpoint_of(api_url)
+        if concurrency is not None:
+            self.set_concurrency(endpoint, concurrency)
+        elif self.default_concurrency is not None and endpoint not in self._limited:
+            self.set_concurrency(endpoint, self.default_concurrency)
+        agent = WebAPIAgent(
+            name, instructions, api_url,
+            client=self.client, model=self.model, cache=self.cache, reducer=reducer, kernel=self.kernel,
+        )
+        self.agents[name] = agent
+        return agent
+
+    def unregister(self, name: str):
+        self.agents.pop(name, None)
+
+    def __getitem__(self, name: str) -> WebAPIAgent:
+        return self.agents[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.agents
+
+    def __iter__(self):
+        return iter(self.agents.values())
+
+    def __len__(self):
+        return len(self.agents)
+
+    def report(self) -> dict:
+        totals = {"calls": 0, "api_failures": 0, "api_seconds": 0.0, "raw_tokens": 0, "prompt_tokens": 0}
+        for agent in self.agents.values():
+            for key in totals:
+                totals[key] += agent.stats[key]
+        return {"agents": len(self.agents), **totals, **self.cache.stats}
+
+    def format_report(self) -> str:
+        r = self.report()
+        saved = 1 - r["prompt_tokens"] / r["raw_tokens"] if r["raw_tokens"] else 0.0
+        return (
+            f"{r['agents']} agents, {r['calls']} calls ({r['api_failures']} API failures), cache {r['hits']} hits / {r['misses']} fetches, "
+            f"API payload {r['prompt_tokens']} of {r['raw_tokens']} tokens ({saved:.0%} saved)"
+        )
+
+    async def close(self):
+        await self.cache.close()
+        if self._owns_client:
+            await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class TestApiAgentRegistry(unittest.TestCase):
+    class FakeClient:
+        """Stands in for AsyncAzureOpenAI.chat.completions."""
+
+        def __init__(self):
+            self.chat = self
+            self.completions = self
+            self.calls = 0
+            self.closed = False
+
+        async def create(self, model, messages, stream=False):
+            from types import SimpleNamespace
+
+            self.calls += 1
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="晴れです。"))])
+
+        async def close(self):
+            self.closed = True
+
+    def test_agents_share_pools_and_limits(self):
+        from jma_stub_server import JMAStubServer
+        from webapi_cache import reduce_jma_forecast
+
+        async def run():
+            async with JMAStubServer(latency=0.05) as server:
+                client = self.FakeClient()
+                async with ApiAgentRegistry(client=client, model="test", default_concurrency=3) as registry:
+                    # 30 エージェント: 同じ予報 URL を共有するものと、エンドポイントは同じで URL が違うもの
+                    for i in range(30):
+                        code = ("130000", "270000")[i % 2] if i < 10 else f"{i:06d}"
+                        registry.register(f"Agent{i}", "天気予報を作成してください。",
+                                          f"{server.forecast_base_url}{code}.json", reducer=reduce_jma_forecast)
+                    await asyncio.gather(*(self.ask(agent) for agent in registry))
+                    # 2回目は予報の2件がキャッシュから返る
+                    await asyncio.gather(*(self.ask(registry[f"Agent{i}"]) for i in range(10)))
+                    agents = list(registry)
+                    result = (
+                        server.stats["requests"], registry.cache.peak_in_flight, registry.report(),
+                        {id(agent.client) for agent in agents}, {id(agent.kernel) for agent in agents}, client.calls,
+                    )
+                # 渡したクライアントは閉じられない
+                return (*result, client.closed)
+
+        requests, peaks, report, clients, kernels, llm_calls, client_closed = asyncio.run(run())
+        # 予報2件 + 存在しない20件 (404 はキャッシュせず、LLM も呼ばない)
+        self.assertEqual(requests, 22)
+        self.assertEqual(list(peaks.values()), [3])
+        self.assertEqual(report["agents"], 30)
+        self.assertEqual((report["calls"], report["api_failures"]), (20, 20))
+        self.assertEqual((len(clients), len(kernels)), (1, 1))
+        self.assertEqual(llm_calls, 20)
+        self.assertFalse(client_closed)
+
+    @staticmethod
+    async def ask(agent):
+        async for _ in agent.invoke("東京の天気"):
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
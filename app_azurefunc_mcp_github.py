@@ -4,23 +4,80 @@ import os
 import json
 import httpx
 import asyncio
-from typing import Dict, List, Any, Optional, AsyncGenerator
+import importlib.util
+import time
+import unittest
+import json_offload
+from prompt_builder import ChatPromptBuilder
+from http_resilience import CircuitBreaker, RateLimiter, ResilientTransport, RetryPolicy
+from typing import Dict, List, Any, Optional, AsyncGenerator, Iterable
 import semantic_kernel as sk
 from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
 from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
 from semantic_kernel.connectors.ai.text_completion_client_base import TextCompletionClientBase
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.streaming_chat_message_content import StreamingChatMessageContent
+from semantic_kernel.contents.streaming_text_content import StreamingTextContent
 from semantic_kernel.contents.text_content import TextContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
 from semantic_kernel.services.ai_service_selector import AIServiceSelector
 from semantic_kernel.functions.kernel_function_metadata import KernelFunctionMetadata
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 from dotenv import load_dotenv
 from datetime import datetime
 import os
 
 load_dotenv("./.env_azurefunc_mcp_github", override=True)
 
+# HTTP/2 は h2 パッケージ (pip install httpx[http2]) があるときだけ使い、なければ HTTP/1.1 の keep-alive で接続を再利用する
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class CompletionResult:
+    """complete_many の1プロンプト分の結果 (失敗した場合は content が None で error に例外が入る)"""
+
+    def __init__(self, index: int, prompt: str, content: TextContent = None, error: Exception = None, elapsed: float = 0.0):
+        self.index = index
+        self.prompt = prompt
+        self.content = content
+        self.error = error
+        self.elapsed = elapsed
+
+
+class BatchReport:
+    """complete_many の件数と処理速度"""
+
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.started = None
+        self.finished = None
+
+    def add(self, result: CompletionResult):
+        if result.error is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def prompts_per_sec(self) -> float:
+        elapsed = self.elapsed
+        return (self.completed + self.failed) / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.completed + self.failed} prompts ({self.failed} failed) in {self.elapsed:.2f}s: "
+            f"{self.prompts_per_sec:.1f} prompts/sec"
+        )
+
+
 class GitHubMCPClient(ChatCompletionClientBase, TextCompletionClientBase):
     """GitHub Machine Completion Protocol クライアント (Semantic Kernel と統合)"""
     
@@ -28,13 +85,46 @@ class GitHubMCPClient(ChatCompletionClientBase, TextCompletionClientBase):
     base_url: str = "https://api.github.com/mcp/v1"
     auth_token: str = None
     headers: Dict[str, str] = None
+
+    # 全リクエストで共有する HTTP クライアント (最初のリクエストで作成し、aclose() で閉じる)
+    _http_client: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+    _http_options: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    # リトライ・レート制限・サーキットブレーカーは HTTP クライアントを作り直しても引き継ぐ
+    _retry_policy: RetryPolicy = PrivateAttr(default=None)
+    _rate_limiter: RateLimiter = PrivateAttr(default=None)
+    _circuit_breaker: CircuitBreaker = PrivateAttr(default=None)
+    # チャット履歴ごとに変換済みのプロンプトを覚えておく
+    _prompt_builder: ChatPromptBuilder = PrivateAttr(default=None)
     
-    def __init__(self, auth_token: str = None):
+    def __init__(
+        self,
+        auth_token: str = None,
+        base_url: str = None,
+        max_connections: int = 20,
+        max_keepalive_connections: int = None,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 60.0,
+        http2: bool = None,
+        max_prompt_tokens: Optional[int] = 8000,
+        retry_policy: RetryPolicy = None,
+        rate_limiter: RateLimiter = None,
+        circuit_breaker: CircuitBreaker = None,
+    ):
         """
         GitHub MCP クライアントの初期化
         
         Args:
             auth_token: GitHub Personal Access Token
+            base_url: API のベース URL (省略時は GITHUB_MCP_BASE_URL かクラスの既定値)
+            max_connections: 同時に使う接続数の上限 (同時リクエスト数に合わせる)
+            max_keepalive_connections: アイドル状態で保持する接続数 (省略時は max_connections と同じ)
+            keepalive_expiry: アイドル接続を保持する秒数
+            timeout: 1リクエストのタイムアウト (秒)
+            http2: HTTP/2 を使うか (省略時は h2 がインストールされていれば使う)
+            max_prompt_tokens: チャット履歴から作るプロンプトのトークン上限 (None で無制限)
+            retry_policy: 再試行の設定 (省略時は RetryPolicy())
+            rate_limiter: レート制限の残数の管理 (省略時は RateLimiter())
+            circuit_breaker: 上流の障害時にすぐ失敗させる設定 (省略時は CircuitBreaker())
         """
         # 親クラスを初期化
         ChatCompletionClientBase.__init__(self, ai_model_id="github-copilot")
@@ -52,6 +142,58 @@ class GitHubMCPClient(ChatCompletionClientBase, TextCompletionClientBase):
             "Accept": "application/vnd.github+json",
             "X-GitHub-Api-Version": "2022-11-28"
         }
+        self.base_url = base_url or os.environ.get("GITHUB_MCP_BASE_URL") or self.base_url
+        self._http_options = {
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections or max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(timeout, connect=10.0),
+            "http2": HTTP2_AVAILABLE if http2 is None else http2,
+        }
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._prompt_builder = ChatPromptBuilder(max_tokens=max_prompt_tokens)
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """接続プールを持つ HTTP クライアントを返す (初回に作成)"""
+        if self._http_client is None or self._http_client.is_closed:
+            options = self._http_options
+            transport = ResilientTransport(
+                httpx.AsyncHTTPTransport(http2=options["http2"], limits=options["limits"]),
+                retry=self._retry_policy,
+                rate_limiter=self._rate_limiter,
+                breaker=self._circuit_breaker,
+            )
+            self._http_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=options["timeout"],
+                transport=transport,
+            )
+        return self._http_client
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        return self._rate_limiter
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        return self._circuit_breaker
+
+    async def aclose(self):
+        """接続プールを閉じる"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
 
     async def get_chat_message_contents(
         self, 
@@ -67,26 +209,14 @@ class GitHubMCPClient(ChatCompletionClientBase, TextCompletionClientBase):
             settings: プロンプト実行設定
         """
         # チャット履歴からプロンプトを構築
-        prompt = ""
-        for message in chat_history.messages:
-            role = "user" if message.role.lower() == "user" else "assistant"
-            prompt += f"{role}: {message.content}\n"
-        
-        prompt += "assistant: "
-        
-        # MCPサーバーにリクエスト
-        temperature = settings.temperature if settings.temperature is not None else 0.7
-        top_p = settings.top_p if settings.top_p is not None else 1.0
-        max_tokens = settings.max_tokens if settings.max_tokens is not None else 1000
+        prompt = self._build_chat_prompt(chat_history)
         
         try:
             # 実際のMCPリクエスト
             response = await self._create_completion(
                 prompt=prompt,
                 model=self.ai_model_id,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p
+                **self._completion_params(settings)
             )
             
             content = response.get("choices", [{}])[0].get("text", "")
@@ -125,17 +255,11 @@ class GitHubMCPClient(ChatCompletionClientBase, TextCompletionClientBase):
             prompt: 入力プロンプト
             settings: プロンプト実行設定
         """
-        temperature = settings.temperature if settings.temperature is not None else 0.7
-        top_p = settings.top_p if settings.top_p is not None else 1.0
-        max_tokens = settings.max_tokens if settings.max_tokens is not None else 1000
-        
         try:
             response = await self._create_completion(
                 prompt=prompt,
                 model=self.ai_model_id,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p
+                **self._completion_params(settings)
             )
             
             content = response.get("choices", [{}])[0].get("text", "")
@@ -158,6 +282,196 @@ class GitHubMCPClient(ChatCompletionClientBase, TextCompletionClientBase):
             )
             yield error_content
     
+    async def complete_many(
+        self,
+        prompts: Iterable[str],
+        settings: PromptExecutionSettings,
+        window: int = None,
+        ordered: bool = False,
+        report: BatchReport = None,
+    ) -> AsyncGenerator[CompletionResult, None]:
+        """
+        多数のプロンプトを同時実行数を抑えて補完し、終わったものから順に返す
+        
+        Args:
+            prompts: 入力プロンプト (ジェネレーターも可。window 分ずつ読み進める)
+            settings: プロンプト実行設定
+            window: 同時に送るリクエスト数の上限 (省略時は接続プールの max_connections)
+            ordered: True なら入力の順に返す (先に終わった結果は最大 window 件まで保留する)
+            report: 件数と prompts/sec を記録する BatchReport
+        
+        レート制限の残数は共有の RateLimiter が管理し、上限に近づくと送信を待たせる。
+        """
+        params = self._completion_params(settings)
+        window = window or self._http_options["limits"].max_connections
+        report = report if report is not None else BatchReport()
+        report.started = time.perf_counter()
+        report.finished = None
+        pending = set()
+        buffered = {}
+        next_index = 0
+        source = enumerate(prompts)
+
+        async def run(index: int, prompt: str) -> CompletionResult:
+            started = time.perf_counter()
+            try:
+                response = await self._create_completion(prompt=prompt, model=self.ai_model_id, **params)
+                content = TextContent(text=response.get("choices", [{}])[0].get("text", ""), ai_model_id=self.ai_model_id)
+                return CompletionResult(index, prompt, content=content, elapsed=time.perf_counter() - started)
+            except Exception as e:
+                return CompletionResult(index, prompt, error=e, elapsed=time.perf_counter() - started)
+
+        def fill():
+            # 入力順で返すときは保留中の結果も window に含め、遅い1件の後ろに結果がたまり続けないようにする
+            while len(pending) < window and (not ordered or len(pending) + len(buffered) < 2 * window):
+                item = next(source, None)
+                if item is None:
+                    return
+                pending.add(asyncio.create_task(run(*item)))
+
+        try:
+            fill()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending.difference_update(done)
+                results = sorted((task.result() for task in done), key=lambda r: r.index)
+                for result in results:
+                    report.add(result)
+                    if ordered:
+                        buffered[result.index] = result
+                if ordered:
+                    results = []
+                    while next_index in buffered:
+                        results.append(buffered.pop(next_index))
+                        next_index += 1
+                fill()
+                for result in results:
+                    yield result
+        finally:
+            # 途中で反復をやめた場合は送信中のリクエストを止める
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            report.finished = time.perf_counter()
+
+    async def _inner_get_streaming_chat_message_contents(
+        self,
+        chat_history: ChatHistory,
+        settings: PromptExecutionSettings,
+        function_invoke_attempt: int = 0,
+    ) -> AsyncGenerator[List[StreamingChatMessageContent], Any]:
+        """
+        チャットの応答を届いた分から順に返す (get_streaming_chat_message_contents から呼ばれる)
+        
+        Args:
+            chat_history: チャットの履歴
+            settings: プロンプト実行設定
+        """
+        prompt = self._build_chat_prompt(chat_history)
+        try:
+            async for choice in self._stream_completion(prompt=prompt, model=self.ai_model_id, **self._completion_params(settings)):
+                yield [StreamingChatMessageContent(
+                    role=AuthorRole.ASSISTANT,
+                    choice_index=choice.get("index", 0),
+                    content=self._choice_text(choice),
+                    finish_reason=choice.get("finish_reason"),
+                    ai_model_id=self.ai_model_id
+                )]
+        except Exception as e:
+            print(f"Error: {e}")
+            yield [StreamingChatMessageContent(
+                role=AuthorRole.ASSISTANT,
+                choice_index=0,
+                content=f"Error in GitHub MCP client: {str(e)}",
+                ai_model_id=self.ai_model_id
+            )]
+
+    async def _inner_get_streaming_text_contents(
+        self,
+        prompt: str,
+        settings: PromptExecutionSettings,
+    ) -> AsyncGenerator[List[StreamingTextContent], Any]:
+        """
+        テキスト補完を届いた分から順に返す (get_streaming_text_contents から呼ばれる)
+        
+        Args:
+            prompt: 入力プロンプト
+            settings: プロンプト実行設定
+        """
+        try:
+            async for choice in self._stream_completion(prompt=prompt, model=self.ai_model_id, **self._completion_params(settings)):
+                yield [StreamingTextContent(
+                    choice_index=choice.get("index", 0),
+                    text=self._choice_text(choice),
+                    ai_model_id=self.ai_model_id
+                )]
+        except Exception as e:
+            print(f"Error: {e}")
+            yield [StreamingTextContent(
+                choice_index=0,
+                text=f"Error in GitHub MCP client: {str(e)}",
+                ai_model_id=self.ai_model_id
+            )]
+
+    def _build_chat_prompt(self, chat_history: ChatHistory) -> str:
+        """チャット履歴を "role: content" 形式のプロンプトにする (古いメッセージから上限まで削る)"""
+        return self._prompt_builder.build(chat_history)
+
+    @staticmethod
+    def _completion_params(settings: PromptExecutionSettings) -> Dict[str, Any]:
+        """設定から生成パラメータを取り出す (PromptExecutionSettings では extension_data に入る)"""
+        def get(name, default):
+            value = getattr(settings, name, None)
+            if value is None:
+                value = settings.extension_data.get(name)
+            return default if value is None else value
+        
+        return {
+            "max_tokens": get("max_tokens", 1000),
+            "temperature": get("temperature", 0.7),
+            "top_p": get("top_p", 1.0),
+        }
+
+    @staticmethod
+    def _choice_text(choice: Dict[str, Any]) -> str:
+        # 補完形式 (text) とチャット形式 (delta.content) のどちらにも対応する
+        if "text" in choice:
+            return choice["text"] or ""
+        return (choice.get("delta") or {}).get("content") or ""
+
+    async def _stream_completion(self, prompt: str, **params) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        "stream": true で補完を要求し、server-sent events の choice を届いた順に返す
+        
+        呼び出し側が途中で反復をやめる (キャンセルを含む) と、応答を読み切らずに上流の接続を閉じる。
+        """
+        payload = {"prompt": prompt, "stream": True, **params}
+        async with self._get_http_client().stream("POST", "/completions", json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise Exception(f"Error from MCP server: {response.status_code} - {response.text}")
+            
+            data_lines = []
+            done = False
+            async for line in response.aiter_lines():
+                if done:
+                    # 接続をプールに戻せるように応答の終わりまで読む
+                    continue
+                if line.startswith("data:"):
+                    data_lines.append(line[5:].lstrip())
+                    continue
+                if line or not data_lines:
+                    # event: / id: / コメント行は使わない
+                    continue
+                # 空行でイベントが終わる
+                data, data_lines = "\n".join(data_lines), []
+                if data == "[DONE]":
+                    done = True
+                    continue
+                event = json.loads(data)
+                for choice in event.get("choices", []):
+                    yield choice
+
     async def _create_completion(self, 
                           prompt: str, 
                           model: str = "copilot", 
@@ -190,88 +504,137 @@ class GitHubMCPClient(ChatCompletionClientBase, TextCompletionClientBase):
         if stop:
             payload["stop"] = stop
             
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/completions",
-                headers=self.headers,
-                json=payload,
-                timeout=60.0
-            )
+        response = await self._get_http_client().post("/completions", json=payload)
+        
+        if response.status_code != 200:
+            raise Exception(f"Error from MCP server: {response.status_code} - {response.text}")
             
-            if response.status_code != 200:
-                raise Exception(f"Error from MCP server: {response.status_code} - {response.text}")
-                
-            return response.json()
+        return await json_offload.loads(response.content)
     
     async def get_models(self) -> List[Dict[str, Any]]:
         """利用可能なモデル一覧を取得"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/models",
-                headers=self.headers
-            )
+        response = await self._get_http_client().get("/models")
+        
+        if response.status_code != 200:
+            raise Exception(f"Error fetching models: {response.status_code} - {response.text}")
             
-            if response.status_code != 200:
-                raise Exception(f"Error fetching models: {response.status_code} - {response.text}")
-                
-            return response.json()
+        return await json_offload.loads(response.content)
 
 
 # Semantic Kernelと統合して使用する例
 async def main():
     """基本的な使用例"""
     try:
-        # GitHub MCP クライアントを初期化
-        mcp_client = GitHubMCPClient()
-        
-        # Semantic Kernel を初期化
-        kernel = sk.Kernel()
-        
-        # AI サービスを登録
-        mcp_client.service_id = "github-copilot"  # 明示的に設定する場合
-        kernel.add_service(service=mcp_client)
-        
-        # チャット履歴の作成
-        chat_history = ChatHistory()
-        chat_history.add_user_message("Write a Python function to calculate the Fibonacci sequence")
-        
-        # チャット完了機能を呼び出し
-        settings = PromptExecutionSettings(
-            service_id="github-copilot",
-            temperature=0.7,
-            max_tokens=500
-        )
-        
-        # await は削除して、AsyncGenerator を直接取得
-        result = kernel.invoke_stream(
-            chat_history, 
-            settings=settings
-        )
-        
-        # async for で反復処理
-        async for chunk in result:
-            print(chunk.content, end="", flush=True)
-        print("\n")
-        
-        # テキスト完了の例
-        prompt = "Write a function that sorts an array using quicksort:"
-        
-        # await は削除して、AsyncGenerator を直接取得
-        text_result = kernel.invoke_stream(
-            prompt, 
-            settings=settings
-        )
-        
-        print("\nText completion result:")
-        # async for で反復処理
-        async for chunk in text_result:
-            print(chunk.text, end="", flush=True)
-        
+        # GitHub MCP クライアントを初期化 (終了時に接続プールを閉じる)
+        async with GitHubMCPClient() as mcp_client:
+            # Semantic Kernel を初期化
+            kernel = sk.Kernel()
+
+            # AI サービスを登録
+            mcp_client.service_id = "github-copilot"  # 明示的に設定する場合
+            kernel.add_service(service=mcp_client)
+
+            # チャット履歴の作成
+            chat_history = ChatHistory()
+            chat_history.add_user_message("Write a Python function to calculate the Fibonacci sequence")
+
+            # チャット完了機能を呼び出し
+            settings = PromptExecutionSettings(
+                service_id="github-copilot",
+                temperature=0.7,
+                max_tokens=500
+            )
+
+            # 応答は server-sent events で届いた分から順に表示する
+            result = mcp_client.get_streaming_chat_message_contents(
+                chat_history, 
+                settings=settings
+            )
+
+            # async for で反復処理
+            async for chunks in result:
+                print(chunks[0].content, end="", flush=True)
+            print("\n")
+
+            # テキスト完了の例
+            prompt = "Write a function that sorts an array using quicksort:"
+
+            text_result = mcp_client.get_streaming_text_contents(
+                prompt, 
+                settings=settings
+            )
+
+            print("\nText completion result:")
+            # async for で反復処理
+            async for chunks in text_result:
+                print(chunks[0].text, end="", flush=True)
+
     except Exception as e:
         import traceback
         print(f"Error: {e}")
         traceback.print_exc()  # スタックトレースを表示
 
 
+class TestGitHubMCPClientStreaming(unittest.TestCase):
+    def test_streams_deltas_and_closes_on_cancel(self):
+        from github_mcp_stub_server import GitHubMCPStubServer
+
+        async def run():
+            async with GitHubMCPStubServer(chunk_size=4, chunk_delay=0.02) as server:
+                async with GitHubMCPClient(auth_token="test", base_url=server.base_url) as client:
+                    chat_history = ChatHistory()
+                    chat_history.add_user_message("fibonacci")
+                    chunks = []
+                    async for contents in client.get_streaming_chat_message_contents(chat_history, PromptExecutionSettings()):
+                        chunks.append(contents[0].content)
+
+                    # 途中でキャンセルすると上流の接続も閉じる
+                    async def consume():
+                        async for _ in client.get_streaming_text_contents("fibonacci", PromptExecutionSettings()):
+                            pass
+
+                    task = asyncio.create_task(consume())
+                    await asyncio.sleep(0.1)
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    await asyncio.sleep(0.1)
+                return chunks, server.text, dict(server.stats)
+
+        chunks, text, stats = asyncio.run(run())
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual("".join(chunks), text)
+        self.assertEqual(stats["streams"], 2)
+        self.assertEqual(stats["streams_aborted"], 1)
+
+
+class TestGitHubMCPClientBatch(unittest.TestCase):
+    def run_batch(self, count, **options):
+        from github_mcp_stub_server import GitHubMCPStubServer
+
+        async def run():
+            async with GitHubMCPStubServer(latency=0.005, jitter=0.02, seed=1) as server:
+                async with GitHubMCPClient(auth_token="test", base_url=server.base_url) as client:
+                    report = BatchReport()
+                    prompts = (f"prompt {i}" for i in range(count))
+                    results = [r async for r in client.complete_many(prompts, PromptExecutionSettings(), report=report, **options)]
+                return results, report, dict(server.stats)
+
+        return asyncio.run(run())
+
+    def test_bounded_window_in_completion_order(self):
+        results, report, stats = self.run_batch(60, window=5)
+        self.assertEqual(sorted(r.index for r in results), list(range(60)))
+        self.assertTrue(all(r.error is None and r.content.text for r in results))
+        self.assertLessEqual(stats["max_in_flight"], 5)
+        self.assertEqual(report.completed, 60)
+        self.assertGreater(report.prompts_per_sec, 0)
+
+    def test_input_order(self):
+        results, _, stats = self.run_batch(40, window=8, ordered=True)
+        self.assertEqual([r.index for r in results], list(range(40)))
+        self.assertEqual([r.prompt for r in results], [f"prompt {i}" for i in range(40)])
+        self.assertLessEqual(stats["connections"], 8)
+
+
 if __name__ == "__main__":
     asyncio.run(main())
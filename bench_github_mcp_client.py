@@ -0,0 +1,126 @@
+# GitHubMCPClient の1リクエストあたりのオーバーヘッドを測るベンチマーク
+#
+# ローカルの代替サーバー (github_mcp_stub_server.py) に対して、次の2通りで補完リクエストを繰り返します。
+#   per-request  リクエストごとに httpx.AsyncClient を作る (以前の GitHubMCPClient の実装)
+#   pooled       GitHubMCPClient が持つ1つの AsyncClient の接続プールを使う
+#
+# 同時実行数ごとに calls/sec、レイテンシのパーセンタイル、サーバーが受けた TCP 接続数を表示します。
+# 代替サーバーは平文の HTTP なので、本番の TLS ハンドシェイクの分は差がさらに大きくなります。
+# 代替サーバーはベンチマークと同じイベントループで動くため、同時実行数が大きいと数値はサーバー側で頭打ちになります。
+# --batch を付けると complete_many の window ごとの prompts/sec も測ります。
+#
+#   python bench_github_mcp_client.py --calls 500 --concurrency 1 8 32 --latency 0.005
+#   python bench_github_mcp_client.py --batch 2000 --windows 1 8 32 --latency 0.02
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import json_offload
+
+from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+
+from app_azurefunc_mcp_github import HTTP2_AVAILABLE, BatchReport, GitHubMCPClient
+from github_mcp_stub_server import GitHubMCPStubServer
+
+PAYLOAD = {"prompt": "user: hello\nassistant: ", "model": "github-copilot", "max_tokens": 100, "temperature": 0.7, "top_p": 1.0}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def per_request_call(client: GitHubMCPClient):
+    # 変更前の _create_completion と同じ手順
+    async with httpx.AsyncClient() as http:
+        response = await http.post(f"{client.base_url}/completions", headers=client.headers, json=PAYLOAD, timeout=60.0)
+        response.raise_for_status()
+        return await json_offload.loads(response.content)
+
+
+async def pooled_call(client: GitHubMCPClient):
+    return await client._create_completion(**PAYLOAD)
+
+
+async def run_level(mode, base_url, concurrency, calls, server):
+    client = GitHubMCPClient(auth_token="bench", base_url=base_url, max_connections=max(concurrency, 1))
+    call = pooled_call if mode == "pooled" else per_request_call
+    async with client:
+        # ウォームアップ
+        await asyncio.gather(*(call(client) for _ in range(concurrency)))
+        connections_before = server.stats["connections"]
+        queue = asyncio.Queue()
+        for _ in range(calls):
+            queue.put_nowait(None)
+        latencies = []
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                result = await call(client)
+                latencies.append(time.perf_counter() - started)
+                assert result["choices"][0]["text"], "unexpected completion"
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "calls_per_sec": calls / elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "connections": server.stats["connections"] - connections_before,
+    }
+
+
+async def run_batch(base_url, window, count, ordered):
+    async with GitHubMCPClient(auth_token="bench", base_url=base_url, max_connections=window) as client:
+        report = BatchReport()
+        prompts = (f"prompt {i}" for i in range(count))
+        async for _ in client.complete_many(prompts, PromptExecutionSettings(max_tokens=100), window=window, ordered=ordered, report=report):
+            pass
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="GitHubMCPClient の接続プールのベンチマーク")
+    parser.add_argument("--calls", type=int, default=500, help="同時実行数ごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency", type=float, default=0.0, help="代替サーバーの応答遅延 (秒)")
+    parser.add_argument("--batch", type=int, default=0, help="complete_many に渡すプロンプト数 (0 で測らない)")
+    parser.add_argument("--windows", type=int, nargs="+", default=[1, 8, 32], help="complete_many の window")
+    args = parser.parse_args()
+
+    async with GitHubMCPStubServer(latency=args.latency) as server:
+        rows = []
+        for concurrency in args.concurrency:
+            for mode in ("per-request", "pooled"):
+                rows.append((mode, concurrency, await run_level(mode, server.base_url, concurrency, args.calls, server)))
+        batch_rows = []
+        for window in args.windows if args.batch else []:
+            for ordered in (False, True):
+                batch_rows.append((window, ordered, await run_batch(server.base_url, window, args.batch, ordered)))
+
+    print(f"calls={args.calls} latency={args.latency * 1000:.0f}ms http2={'on' if HTTP2_AVAILABLE else 'off (h2 not installed)'}")
+    print(f"{'mode':>12} {'conc':>5} {'calls/s':>8} {'mean ms':>8} {'p50 ms':>7} {'p99 ms':>7} {'conns':>6}")
+    for mode, concurrency, r in rows:
+        print(
+            f"{mode:>12} {concurrency:>5} {r['calls_per_sec']:>8.0f} {r['mean_ms']:>8.2f} "
+            f"{r['p50_ms']:>7.2f} {r['p99_ms']:>7.2f} {r['connections']:>6}"
+        )
+    if batch_rows:
+        print(f"\ncomplete_many: {args.batch} prompts")
+        print(f"{'window':>7} {'order':>11} {'prompts/s':>10} {'failed':>7}")
+        for window, ordered, report in batch_rows:
+            print(f"{window:>7} {'input' if ordered else 'completion':>11} {report.prompts_per_sec:>10.0f} {report.failed:>7}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
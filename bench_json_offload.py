@@ -0,0 +1,97 @@
+# JSON デコードがイベントループに与える遅延 (event-loop lag) を計測するベンチマーク
+#
+# 大きなペイロード (area.json 相当) と小さなペイロード (WebSocket メッセージ相当) を
+# 混ぜてデコードしながら、1ms 間隔のティッカーがどれだけ遅れるかを測ります。
+#
+#   python bench_json_offload.py --large 20 --small 2000 --modes inline thread process
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import json_offload
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def ticker(stop: asyncio.Event, interval: float, lags: list):
+    """Measures how late each `interval` sleep wakes up."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run_mode(mode: str, large_payload: bytes, small_payload: str, large: int, small: int) -> dict:
+    json_offload.configure(new_mode=mode)
+    stop = asyncio.Event()
+    lags = []
+    ticker_task = asyncio.create_task(ticker(stop, 0.001, lags))
+    await asyncio.sleep(0.05)
+
+    async def decode_large():
+        for _ in range(large):
+            await json_offload.loads(large_payload)
+            await json_offload.dumps(json.loads(small_payload))
+
+    async def decode_small():
+        for _ in range(small):
+            await json_offload.loads(small_payload)
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(decode_large(), decode_large(), decode_small())
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker_task
+
+    lags.sort()
+    return {
+        "mode": mode,
+        "elapsed": elapsed,
+        "ticks": len(lags),
+        "p50": percentile(lags, 50),
+        "p99": percentile(lags, 99),
+        "max": lags[-1] if lags else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Event-loop lag while decoding JSON payloads")
+    parser.add_argument("--large", type=int, default=10, help="large payloads decoded per worker")
+    parser.add_argument("--small", type=int, default=2000, help="small payloads decoded")
+    parser.add_argument("--scale", type=int, default=4, help="copies of area_codes.json in the large payload")
+    parser.add_argument("--modes", nargs="+", default=list(json_offload.MODES))
+    args = parser.parse_args()
+
+    with open(os.path.join(base_dir, "area_codes.json"), "r", encoding="utf-8") as f:
+        area = json.load(f)
+    large_payload = json.dumps([area] * args.scale, ensure_ascii=False).encode("utf-8")
+    small_payload = json.dumps({"type": "message", "message": "What is the special soup?"})
+    print(f"large payload: {len(large_payload) / 1024:.0f} KiB, small payload: {len(small_payload)} B, "
+          f"threshold: {json_offload.threshold} B")
+
+    print(f"{'mode':>8} {'elapsed s':>10} {'ticks':>6} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}")
+    try:
+        for mode in args.modes:
+            result = await run_mode(mode, large_payload, small_payload, args.large, args.small)
+            print(
+                f"{result['mode']:>8} {result['elapsed']:>10.2f} {result['ticks']:>6} "
+                f"{result['p50'] * 1000:>11.2f} {result['p99'] * 1000:>11.2f} {result['max'] * 1000:>11.2f}"
+            )
+    finally:
+        json_offload.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+# mcp_proxy.py の転送オーバーヘッドを計測するベンチマーク
+#
+# JSON-RPC の行をそのまま返すエコーサーバーを起動し、次の経路で比較します。
+#   direct        プロキシなし
+#   thread        従来のスレッド版 (ログあり)
+#   asyncio       asyncio 版 (ログあり、tee)
+#   asyncio-nolog asyncio 版 (ログなし、splice)
+#
+#   python bench_mcp_proxy.py --messages 2000 --payload 256 --window 32
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+PROXY = os.path.join(base_dir, "mcp_proxy.py")
+
+# 受け取った JSON-RPC リクエストの id と params をそのまま result として返すサーバー
+ECHO_SERVER = """
+import sys, json
+for line in sys.stdin.buffer:
+    request = json.loads(line)
+    response = {"jsonrpc": "2.0", "id": request.get("id"), "result": request.get("params")}
+    sys.stdout.buffer.write(json.dumps(response).encode() + b"\\n")
+    sys.stdout.buffer.flush()
+"""
+
+
+def routes(log_dir):
+    echo = [sys.executable, "-u", "-c", ECHO_SERVER]
+    proxy = [sys.executable, PROXY, "--log-dir", log_dir]
+    return {
+        "direct": echo,
+        "thread": proxy + ["--engine", "thread", "--"] + echo,
+        "asyncio": proxy + ["--engine", "asyncio", "--"] + echo,
+        "asyncio-nolog": proxy + ["--engine", "asyncio", "--no-log", "--"] + echo,
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_request(request_id, payload):
+    return (json.dumps({"jsonrpc": "2.0", "id": request_id, "method": "tools/call", "params": {"data": payload}}) + "\n").encode()
+
+
+async def run_route(command, messages, payload_size, window):
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        limit=16 * 1024 * 1024,
+    )
+    payload = "x" * payload_size
+
+    # ウォームアップ
+    process.stdin.write(make_request(0, payload))
+    await process.stdin.drain()
+    await process.stdout.readline()
+
+    # 1件ずつ往復させてレイテンシを測る
+    latencies = []
+    for i in range(1, messages + 1):
+        started = time.perf_counter()
+        process.stdin.write(make_request(i, payload))
+        await process.stdin.drain()
+        await process.stdout.readline()
+        latencies.append(time.perf_counter() - started)
+
+    # window 件まで同時に流してスループットを測る
+    in_flight = asyncio.Semaphore(window)
+
+    async def reader():
+        for _ in range(messages):
+            await process.stdout.readline()
+            in_flight.release()
+
+    started = time.perf_counter()
+    reader_task = asyncio.create_task(reader())
+    for i in range(messages):
+        await in_flight.acquire()
+        process.stdin.write(make_request(i, payload))
+        await process.stdin.drain()
+    await reader_task
+    elapsed = time.perf_counter() - started
+
+    process.stdin.close()
+    await process.wait()
+
+    latencies.sort()
+    return {
+        "mean": statistics.fmean(latencies),
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "throughput": messages / elapsed,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="mcp_proxy.py forwarding benchmark")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--payload", type=int, default=256, help="payload bytes per message")
+    parser.add_argument("--window", type=int, default=32, help="in-flight messages for the throughput run")
+    parser.add_argument("--routes", nargs="+", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        all_routes = routes(log_dir)
+        selected = args.routes or list(all_routes)
+        results = {}
+        for name in selected:
+            results[name] = await run_route(all_routes[name], args.messages, args.payload, args.window)
+
+    direct = results.get("direct")
+    print(f"messages={args.messages} payload={args.payload}B window={args.window}")
+    print(f"{'route':>14} {'msg/s':>9} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'added us':>9}")
+    for name, result in results.items():
+        added = (result["p50"] - direct["p50"]) * 1e6 if direct else float("nan")
+        print(
+            f"{name:>14} {result['throughput']:>9.0f} {result['mean'] * 1e6:>9.0f} "
+            f"{result['p50'] * 1e6:>9.0f} {result['p99'] * 1e6:>9.0f} {added:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,204 @@
+# MCP のトランスポートごとのツール呼び出しのコストを比較するベンチマーク
+#
+# ローカルの fastmcp サーバー (サイズを指定した文字列を返す合成ツール) を起動し、
+# 次の経路で同じツール呼び出しを繰り返します。
+#   stdio      MCPStdioPlugin でサーバーを直接起動
+#   sse        MCPSsePlugin で SSE サーバーに接続
+#   proxy      MCPStdioPlugin で mcp_proxy.py (asyncio, ログなし) を経由
+#   proxy-log  同上、JSON Lines ログあり
+#
+# 呼び出しごとのレイテンシのパーセンタイル、calls/sec、1呼び出しあたりの CPU 時間を表示します。
+# CPU 時間はベンチマーク自身とその子孫プロセス (サーバー・プロキシ) の合計で、Linux の /proc から読みます。
+# 他の OS ではベンチマークのプロセスの分だけになります。
+#
+#   python bench_mcp_transports.py --calls 300 --concurrency 8 --sizes 100 10000 100000
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+from semantic_kernel.connectors.mcp import MCPSsePlugin, MCPStdioPlugin
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+PROXY = os.path.join(base_dir, "mcp_proxy.py")
+
+SERVER = """
+import inspect
+import sys
+from fastmcp import FastMCP
+
+mcp = FastMCP("bench")
+
+
+@mcp.tool()
+def payload(size: int) -> str:
+    '''Returns a string of the requested size.'''
+    return "x" * size
+
+
+if __name__ == "__main__":
+    # show_banner は新しい fastmcp のみ (poetry.lock の 2.3.0 の run() は受け付けない)
+    options = {"show_banner": False} if "show_banner" in inspect.signature(mcp.run).parameters else {}
+    if sys.argv[1] == "sse":
+        mcp.run(transport="sse", host="127.0.0.1", port=int(sys.argv[2]), log_level="warning", **options)
+    else:
+        mcp.run(transport="stdio", **options)
+"""
+
+
+def tree_cpu_seconds() -> float:
+    """CPU time (user + system) of this process and all its descendants."""
+    if not os.path.isdir("/proc"):
+        return time.process_time()
+    ticks = os.sysconf("SC_CLK_TCK")
+    stats = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields[1] = ppid, fields[11] = utime, fields[12] = stime
+        stats[int(entry)] = (int(fields[1]), int(fields[11]) + int(fields[12]))
+    children = {}
+    for pid, (ppid, _) in stats.items():
+        children.setdefault(ppid, []).append(pid)
+    total = 0
+    stack = [os.getpid()]
+    while stack:
+        pid = stack.pop()
+        total += stats.get(pid, (0, 0))[1]
+        stack.extend(children.get(pid, []))
+    return total / ticks
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"SSE server did not start on port {port}")
+
+
+def create_plugin(route, server_path, port, log_dir):
+    server = [server_path, "stdio"]
+    if route == "stdio":
+        return MCPStdioPlugin(name="bench", command=sys.executable, args=server, load_prompts=False)
+    if route == "sse":
+        return MCPSsePlugin(name="bench", url=f"http://127.0.0.1:{port}/sse", load_prompts=False)
+    proxy = [PROXY, "--engine", "asyncio"]
+    if route == "proxy":
+        proxy.append("--no-log")
+    else:
+        proxy += ["--log-dir", log_dir]
+    return MCPStdioPlugin(name="bench", command=sys.executable, args=proxy + ["--", sys.executable, *server], load_prompts=False)
+
+
+async def run_calls(plugin, size, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call():
+        async with semaphore:
+            started = time.perf_counter()
+            result = await plugin.call_tool("payload", size=size)
+            latencies.append(time.perf_counter() - started)
+            return result
+
+    # ウォームアップ
+    await asyncio.gather(*(plugin.call_tool("payload", size=size) for _ in range(min(10, calls))))
+    cpu_before = tree_cpu_seconds()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(call() for _ in range(calls)))
+    elapsed = time.perf_counter() - started
+    cpu = tree_cpu_seconds() - cpu_before
+    assert len(str(results[0][0])) == size, "unexpected tool result"
+    latencies.sort()
+    return {
+        "calls_per_sec": calls / elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "cpu_ms_per_call": cpu / calls * 1000,
+    }
+
+
+async def run_route(route, sizes, calls, concurrency, server_path, port, log_dir):
+    plugin = create_plugin(route, server_path, port, log_dir)
+    started = time.perf_counter()
+    await plugin.connect()
+    connect_ms = (time.perf_counter() - started) * 1000
+    try:
+        return connect_ms, {size: await run_calls(plugin, size, calls, concurrency) for size in sizes}
+    finally:
+        await plugin.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="MCP トランスポートのベンチマーク")
+    parser.add_argument("--calls", type=int, default=300, help="ペイロードサイズごとの呼び出し回数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に実行する呼び出し数")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000], help="ツールが返す文字数")
+    parser.add_argument("--routes", nargs="+", default=["stdio", "sse", "proxy", "proxy-log"],
+                        choices=["stdio", "sse", "proxy", "proxy-log"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server_path = os.path.join(tmp_dir, "bench_server.py")
+        with open(server_path, "w", encoding="utf-8") as f:
+            f.write(SERVER)
+
+        sse_process = None
+        port = free_port()
+        if "sse" in args.routes:
+            sse_process = await asyncio.create_subprocess_exec(sys.executable, server_path, "sse", str(port))
+            await wait_for_port(port)
+
+        results = {}
+        try:
+            for route in args.routes:
+                results[route] = await run_route(route, args.sizes, args.calls, args.concurrency, server_path, port, tmp_dir)
+        finally:
+            if sse_process:
+                sse_process.terminate()
+                await sse_process.wait()
+
+    cpu_note = "process tree" if os.path.isdir("/proc") else "benchmark process only"
+    print(f"calls={args.calls} concurrency={args.concurrency} (CPU: {cpu_note})")
+    print(f"{'route':>10} {'size':>8} {'calls/s':>8} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'CPU ms/call':>12}")
+    for route, (connect_ms, by_size) in results.items():
+        for size, r in by_size.items():
+            print(
+                f"{route:>10} {size:>8} {r['calls_per_sec']:>8.0f} {r['mean_ms']:>8.2f} {r['p50_ms']:>7.2f} "
+                f"{r['p95_ms']:>7.2f} {r['p99_ms']:>7.2f} {r['cpu_ms_per_call']:>12.3f}"
+            )
+    print("connect ms: " + ", ".join(f"{route} {connect_ms:.0f}" for route, (connect_ms, _) in results.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+# チャット履歴からプロンプトを組み立てるコストのマイクロベンチマーク
+#
+# 1ターンごとにメッセージを追加してプロンプトを作り直す会話を再現し、次の2通りを比べます。
+#   concat   履歴全体を毎回 prompt += f"{role}: ..." で組み立てる (以前の GitHubMCPClient の実装)
+#   builder  ChatPromptBuilder で増えたメッセージだけを変換する (トークン上限なし / あり)
+#
+# 会話全体の合計時間と、最後の1ターンの組み立て時間を表示します。
+#
+#   python bench_prompt_builder.py --messages 100 1000 5000 --max-tokens 8000
+
+import argparse
+import time
+
+from semantic_kernel.contents.chat_history import ChatHistory
+
+from prompt_builder import ChatPromptBuilder, TokenCounter
+
+MESSAGE = "Please explain how the Fibonacci sequence relates to the golden ratio, with an example. "
+
+
+def concat_prompt(chat_history: ChatHistory) -> str:
+    prompt = ""
+    for message in chat_history.messages:
+        role = "user" if message.role.lower() == "user" else "assistant"
+        prompt += f"{role}: {message.content}\n"
+    prompt += "assistant: "
+    return prompt
+
+
+def run(build, messages: int):
+    chat_history = ChatHistory()
+    chat_history.add_system_message("You are a helpful assistant.")
+    total = 0.0
+    last = 0.0
+    for i in range(messages):
+        if i % 2 == 0:
+            chat_history.add_user_message(f"{i}: {MESSAGE}")
+        else:
+            chat_history.add_assistant_message(f"{i}: {MESSAGE}")
+        started = time.perf_counter()
+        build(chat_history)
+        last = time.perf_counter() - started
+        total += last
+    return total, last
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プロンプト組み立てのマイクロベンチマーク")
+    parser.add_argument("--messages", type=int, nargs="+", default=[100, 1000, 5000], help="会話のメッセージ数")
+    parser.add_argument("--max-tokens", type=int, default=8000, help="上限ありのときのトークン上限")
+    args = parser.parse_args()
+
+    counter = TokenCounter()
+    variants = {
+        "concat": lambda: concat_prompt,
+        "builder": lambda: ChatPromptBuilder(counter=counter).build,
+        f"builder/{args.max_tokens}": lambda: ChatPromptBuilder(max_tokens=args.max_tokens, counter=counter).build,
+    }
+    print(f"tokenizer: {'tiktoken' if counter.encoding is not None else 'estimate'}")
+    print(f"{'variant':>14} {'messages':>9} {'total ms':>10} {'last turn ms':>13}")
+    for messages in args.messages:
+        for name, make in variants.items():
+            total, last = run(make(), messages)
+            print(f"{name:>14} {messages:>9} {total * 1000:>10.1f} {last * 1000:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
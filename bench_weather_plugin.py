@@ -0,0 +1,109 @@
+# WeatherPlugin のスループットとテールレイテンシを計測するベンチマーク
+#
+# jma_stub_server.JMAStubServer をローカルで起動し、www.jma.go.jp には一切アクセスしません。
+#
+#   python bench_weather_plugin.py --requests 2000 --concurrency 1 10 50 --latency 0.02
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from jma_stub_server import JMAStubServer
+from plugin import WeatherPlugin
+
+AREA_NAMES = ["東京都", "大阪府"]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_level(weather_plugin: WeatherPlugin, requests: int, concurrency: int) -> dict:
+    """
+    Issues `requests` forecast lookups with at most `concurrency` in flight.
+    """
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(AREA_NAMES[i % len(AREA_NAMES)])
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                area_name = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            result = await weather_plugin.get_weather_forecast(area_name, "2025-05-09")
+            latencies.append(time.perf_counter() - started)
+            if not result.startswith("The weather forecast"):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput": requests / elapsed if elapsed else 0.0,
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="WeatherPlugin benchmark against the local JMA stand-in")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--latency", type=float, default=0.0, help="stub response latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="stub latency jitter (seconds)")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--no-etag", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = JMAStubServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        etag=not args.no_etag,
+        seed=args.seed,
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        async with server:
+            weather_plugin = WeatherPlugin(
+                area_codes_file=os.path.join(tmp_dir, "area_codes.json"),
+                area_codes_url=server.area_codes_url,
+                forecast_base_url=server.forecast_base_url,
+            )
+            started = time.perf_counter()
+            await weather_plugin.load_area_codes()
+            print(f"load_area_codes (from stub): {(time.perf_counter() - started) * 1000:.1f} ms")
+
+            print(f"{'conc':>5} {'reqs':>6} {'err':>5} {'req/s':>9} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+            for concurrency in args.concurrency:
+                result = await run_level(weather_plugin, args.requests, concurrency)
+                print(
+                    f"{result['concurrency']:>5} {result['requests']:>6} {result['errors']:>5} "
+                    f"{result['throughput']:>9.1f} {result['mean'] * 1000:>8.2f} {result['p50'] * 1000:>8.2f} "
+                    f"{result['p95'] * 1000:>8.2f} {result['p99'] * 1000:>8.2f} {result['max'] * 1000:>8.2f}"
+                )
+            print(f"stub stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
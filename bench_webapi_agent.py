@@ -0,0 +1,68 @@
+# WebAPIAgent の API 取得とプロンプトの大きさを比べるベンチマーク
+#
+# ローカルの気象庁代替サーバー (jma_stub_server.py) と、すぐに応答する偽の LLM クライアントを使い、
+# 同じ質問を繰り返して次の2通りを比べます。
+#   raw      TTL 0 のキャッシュ (毎回取得) で、予報 JSON をそのままプロンプトに入れる (以前の動作)
+#   reduced  TTL つきの共有キャッシュと reduce_jma_forecast を使う
+#
+# 質問あたりの API 待ち時間と、プロンプトに入る API 応答のトークン数を表示します。
+#
+#   python bench_webapi_agent.py --questions 50 --latency 0.05
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from jma_stub_server import JMAStubServer
+from webapi_agent import WebAPIAgent
+from webapi_cache import ApiResponseCache, reduce_jma_forecast
+
+QUESTIONS = ["今日の東京の朝の天気教えて", "明日の東京の夜の天気を教えて", "小笠原諸島の週末の天気は?", "伊豆諸島北部は雨が降りますか?"]
+
+
+class InstantLLM:
+    """Answers immediately so only the API side is measured."""
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+
+    async def create(self, model, messages, stream=False):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="晴れです。"))])
+
+
+async def run_variant(server, questions, reducer, ttl):
+    async with ApiResponseCache(ttl=ttl) as cache:
+        agent = WebAPIAgent(
+            "Reporter", "天気予報を作成してください。", f"{server.forecast_base_url}130000.json",
+            client=InstantLLM(), model="bench", cache=cache, reducer=reducer,
+        )
+        started = time.perf_counter()
+        for i in range(questions):
+            async for _ in agent.invoke(QUESTIONS[i % len(QUESTIONS)]):
+                pass
+        elapsed = time.perf_counter() - started
+        return agent, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="WebAPIAgent のキャッシュと応答縮小のベンチマーク")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="代替サーバーの応答遅延 (秒)")
+    parser.add_argument("--ttl", type=float, default=300.0, help="reduced のキャッシュの TTL (秒)")
+    args = parser.parse_args()
+
+    async with JMAStubServer(latency=args.latency) as server:
+        raw, raw_elapsed = await run_variant(server, args.questions, None, ttl=0)
+        reduced, reduced_elapsed = await run_variant(server, args.questions, reduce_jma_forecast, ttl=args.ttl)
+
+    print(f"questions={args.questions} latency={args.latency * 1000:.0f}ms")
+    print(f"{'variant':>8} {'ms/question':>12} {'API tokens/question':>20}")
+    for name, agent, elapsed in (("raw", raw, raw_elapsed), ("reduced", reduced, reduced_elapsed)):
+        print(f"{name:>8} {elapsed / args.questions * 1000:>12.2f} {agent.stats['prompt_tokens'] / args.questions:>20.0f}")
+    print(reduced.format_savings())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
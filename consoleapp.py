@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import os
+import time
 from semantic_kernel import Kernel
 from semantic_kernel.utils.logging import setup_logging
 from semantic_kernel.functions import kernel_function
@@ -14,6 +15,7 @@ from semantic_kernel.connectors.ai.open_ai.prompt_execution_settings.azure_chat_
     AzureChatPromptExecutionSettings,
 )
 from plugin import LightsPlugin,WeatherPlugin, CurrentDatePlugin
+from intent_router import IntentRouter
 
 from dotenv import load_dotenv
 
@@ -61,6 +63,9 @@ async def main():
     execution_settings = AzureChatPromptExecutionSettings()
     execution_settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
 
+    # Optional fast path that answers trivial questions without the LLM
+    router = IntentRouter(kernel) if os.environ.get("FAST_PATH_ROUTER") == "1" else None
+
     # Create a history of the conversation
     history = ChatHistory()
 
@@ -72,17 +77,29 @@ async def main():
 
         # Terminate the loop if the user says "exit"
         if userInput == "exit":
+            if router:
+                print(router.format_report())
             break
 
         # Add user input to the history
         history.add_user_message(userInput)
 
+        if router:
+            answer = await router.try_answer(userInput)
+            if answer is not None:
+                print("Assistant > " + answer)
+                history.add_assistant_message(answer)
+                continue
+
         # Get the response from the AI
+        started = time.perf_counter()
         result = await chat_completion.get_chat_message_content(
             chat_history=history,
             settings=execution_settings,
             kernel=kernel,
         )
+        if router:
+            router.record_fallthrough(time.perf_counter() - started)
 
         # Print the results
         print("Assistant > " + str(result))
@@ -12,17 +12,19 @@ from dotenv import load_dotenv
 from datetime import datetime
 import os
 from semantic_kernel.connectors.mcp import MCPSsePlugin
+from mcp_tool_cache import CachedMCPSsePlugin
 
 load_dotenv("./.env_console_chatagent", override=True)
 
 
 async def create_mcp_plugin() -> MCPSsePlugin:
     
-    plugin = MCPSsePlugin(
+    # 前回のツール一覧をキャッシュから登録し、接続はバックグラウンドで行う
+    plugin = CachedMCPSsePlugin(
         name="diy_plugin",
         url="http://localhost:11111/sse",
     )
-    await plugin.connect()
+    await plugin.start()
     return plugin
 
 async def check_tools_in_mcp(plugin: MCPSsePlugin):
@@ -31,6 +33,14 @@ async def check_tools_in_mcp(plugin: MCPSsePlugin):
     利用可能なツールの一覧を取得。
     """
 
+    if plugin.session is None:
+        # キャッシュから登録した場合は接続を待たずにキャッシュの一覧を表示する
+        tools = plugin.cached_tools or []
+        print("取得したツール一覧 (キャッシュ):")
+        for t in tools:
+            print(f" - {t['name']}: {t.get('description')}")
+        return tools
+
     # 3. MCPサーバが提供するツール一覧を取得
     tools_response = await plugin.session.list_tools()
     tools = tools_response.tools if tools_response else []
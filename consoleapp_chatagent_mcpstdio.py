@@ -11,21 +11,38 @@ from semantic_kernel.functions import KernelArguments, kernel_function
 from dotenv import load_dotenv
 from datetime import datetime
 import os
+import sys
 from semantic_kernel.connectors.mcp import MCPStdioPlugin, MCPPluginBase
+from mcp_tool_cache import CachedMCPStdioPlugin
 
 load_dotenv("./.env_console_chatagent", override=True)
 
 
+MCP_PROXY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp_proxy.py")
+
+
 async def create_mcp_plugin() -> MCPStdioPlugin:
-    
-    plugin = MCPStdioPlugin(
+    command = "python"
+    args = ["C:/Users/v-yoiabe/projects/mcp-server-1/server_stdio.py"]
+    # MCP_RECORD_FILE: mcp_proxy.py を挟んでセッションを記録する
+    # MCP_REPLAY_FILE: 本物のサーバーの代わりに記録を再生する (MCP_REPLAY_SPEED で応答時間の倍率)
+    if os.getenv("MCP_REPLAY_FILE"):
+        command = sys.executable
+        args = [MCP_PROXY, "--replay", os.environ["MCP_REPLAY_FILE"], "--replay-speed", os.getenv("MCP_REPLAY_SPEED", "1.0")]
+    elif os.getenv("MCP_RECORD_FILE"):
+        # 記録は asyncio 版のみ (Windows の既定は thread なので明示する)
+        args = [MCP_PROXY, "--engine", "asyncio", "--no-log", "--record", os.environ["MCP_RECORD_FILE"], "--", command, *args]
+        command = sys.executable
+
+    # 前回のツール一覧をキャッシュから登録し、接続はバックグラウンドで行う
+    plugin = CachedMCPStdioPlugin(
         name="example_plugin",
-        command="python",
-        args=["C:/Users/v-yoiabe/projects/mcp-server-1/server_stdio.py"],
+        command=command,
+        args=args,
         env={},
         encoding="utf-8",
     )
-    await plugin.connect()
+    await plugin.start()
     return plugin
 
 async def check_tools_in_mcp(plugin: MCPPluginBase):
@@ -34,6 +51,14 @@ async def check_tools_in_mcp(plugin: MCPPluginBase):
     利用可能なツールの一覧を取得。
     """
 
+    if plugin.session is None:
+        # キャッシュから登録した場合は接続を待たずにキャッシュの一覧を表示する
+        tools = plugin.cached_tools or []
+        print("取得したツール一覧 (キャッシュ):")
+        for t in tools:
+            print(f" - {t['name']}: {t.get('description')}")
+        return tools
+
     # 3. MCPサーバが提供するツール一覧を取得
     tools_response = await plugin.session.list_tools()
     tools = tools_response.tools if tools_response else []
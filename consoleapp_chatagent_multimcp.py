@@ -0,0 +1,88 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from semantic_kernel import Kernel
+from semantic_kernel.agents import ChatCompletionAgent, ChatHistoryAgentThread
+from semantic_kernel.connectors.ai import FunctionChoiceBehavior
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.connectors.mcp import MCPSsePlugin, MCPStdioPlugin
+from semantic_kernel.functions import KernelArguments
+
+from mcp_connection_manager import MCPConnectionManager
+
+load_dotenv("./.env_console_chatagent", override=True)
+
+
+def create_mcp_plugins():
+    # GitHub (stdio) とローカルの SSE サーバーを使う。どちらかが落ちていても残りで動く
+    return [
+        MCPStdioPlugin(
+            name="github",
+            command="npx",
+            args=["--yes", "@modelcontextprotocol/server-github"],
+            env={"GITHUB_TOKEN": os.getenv("GITHUB_TOKEN", "")},
+        ),
+        MCPSsePlugin(
+            name="diy_plugin",
+            url="http://localhost:11111/sse",
+        ),
+    ]
+
+
+async def main():
+    # 1. 全ての MCP サーバーに同時に接続する (npx の初回起動は遅いので github は長めに待つ)
+    manager = MCPConnectionManager(create_mcp_plugins(), connect_timeout=10, timeouts={"github": 60})
+    await manager.connect_all()
+    print(manager.format_report())
+
+    service_id = "agent"
+    kernel = Kernel()
+    manager.add_to_kernel(kernel)
+    manager.start_health_checks()
+    chat_completion = AzureChatCompletion(
+        deployment_name=os.environ.get("AZURE_AI_AGENT_MODEL_DEPLOYMENT_NAME"),
+        api_key=os.environ.get("AZURE_API_KEY"),
+        base_url=os.environ.get("AZURE_AI_AGENT_ENDPOINT"),
+        api_version=os.environ.get("AZURE_API_VERSION"),
+        service_id=service_id
+    )
+    kernel.add_service(chat_completion)
+
+    # 2. Configure the function choice behavior to auto invoke kernel functions
+    settings = kernel.get_prompt_execution_settings_from_service_id(service_id=service_id)
+    settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
+
+    # 3. Create the agent
+    agent = ChatCompletionAgent(
+        kernel=kernel,
+        name="Host",
+        instructions="Answer questions using the available tools.",
+        arguments=KernelArguments(settings=settings),
+    )
+
+    thread: ChatHistoryAgentThread = None
+
+    try:
+        # 標準入力を受け取ってループする ("status" で接続状態を表示)
+        while True:
+            # input() でイベントループを止めると、待っている間ヘルスチェックと再接続が動かない
+            user_input = await asyncio.to_thread(input, "# User: ")
+            if user_input == "exit":
+                break
+            if user_input == "status":
+                print(manager.format_report())
+                continue
+
+            async for response in agent.invoke(messages=user_input, thread=thread):
+                print(f"# {response.name}: {response}")
+                thread = response.thread
+    finally:
+        await thread.delete() if thread else None
+        await manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
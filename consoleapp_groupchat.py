@@ -1,47 +1,32 @@
 # Copyright (c) Microsoft. All rights reserved.
 
+import argparse
 import asyncio
 import os
 from azure.identity.aio import DefaultAzureCredential
 from semantic_kernel.agents import AgentGroupChat, AzureAIAgent, AzureAIAgentSettings
-from semantic_kernel.agents.strategies import TerminationStrategy
-from semantic_kernel.agents.strategies.selection.selection_strategy import SelectionStrategy
 from semantic_kernel.contents import AuthorRole
 # Add these imports for Bing Grounding Tool functionality
 from azure.ai.projects.models import BingGroundingTool
 
+from agent_definition_cache import AgentDefinitionCache
+from group_chat_transitions import (
+    ANY, START, TERMINATE, TransitionSelectionStrategy, TransitionTable, TransitionTerminationStrategy,
+)
+
 """
 The following sample demonstrates how to create an OpenAI assistant using either
 Azure OpenAI or OpenAI, a chat completion agent and have them participate in a
 group chat to work towards the user's requirement.
+
+エージェントの定義は実行をまたいで再利用します (変更があったときだけ作成・更新)。
+削除するときは `python consoleapp_groupchat.py cleanup` を実行してください。
 """
 from dotenv import load_dotenv
 
 load_dotenv("./.env_groupchat", override=True)
 
 
-class ApprovalTerminationStrategy(TerminationStrategy):
-    """A strategy for determining when an agent should terminate."""
-
-    async def should_agent_terminate(self, agent, history):
-        """Check if the agent should terminate."""
-        return agent.name == "Director" and "承認" in history[-1].content.lower()
-
-class TaskProgressSelectionStrategy(SelectionStrategy):
-    async def next(self, agents, history):
-        if not history:  # 初回はCopyWriter
-            return next(a for a in agents if a.name == "CopyWriter")
-        last_message = history[-1]
-        if "問題なし" in last_message.content:  # IPCheckerの応答後
-            return next(a for a in agents if a.name == "Director")
-        elif "問題あり" in last_message.content:  # IPCheckerの応答後
-            return next(a for a in agents if a.name == "Copywriter")
-        # CopyWriterの提案後は、IPCheckerに渡す.発言者で判断する
-        elif last_message.name == "CopyWriter":  # CopyWriterの応答後
-            return next(a for a in agents if a.name == "IPChecker")
-        else:  # デフォルトでCopyWriter
-            return next(a for a in agents if a.name == "CopyWriter")
-
 REVIEWER_NAME = "Director"
 REVIEWER_INSTRUCTIONS = """
 あなたは本田宗一郎が大好きなDirectorです。車が大好きで、車のデザインや機能に関する深い知識を持っています。
@@ -74,10 +59,25 @@ INTELLECTUAL_PROPERTY_INSTRUCTIONS = """
 日本語で会話してください。
 """
 
+# (直前の発言者, 内容のパターン, 次のエージェント) 上から順に最初に一致した行を使う
+TRANSITIONS = [
+    (START, None, COPYWRITER_NAME),  # 初回はCopyWriter
+    (INTELLECTUAL_PROPERTY_NAME, "問題なし", REVIEWER_NAME),
+    (INTELLECTUAL_PROPERTY_NAME, "問題あり", COPYWRITER_NAME),
+    (COPYWRITER_NAME, None, INTELLECTUAL_PROPERTY_NAME),  # CopyWriterの提案後は、IPCheckerに渡す
+    (REVIEWER_NAME, "承認", TERMINATE),
+    (ANY, None, COPYWRITER_NAME),  # デフォルトでCopyWriter
+]
+# 名前の誤りやパターンの誤りは、Azure に接続する前にここで ValueError になる
+TRANSITION_TABLE = TransitionTable(TRANSITIONS, agent_names=[COPYWRITER_NAME, INTELLECTUAL_PROPERTY_NAME, REVIEWER_NAME])
+
 TASK = "まったく新しい高効率のガソリン車のためのキャッチコピーを考えてください。"
 
+# エージェントのメタデータに保存し、このアプリのエージェントだけを再利用・削除する
+AGENT_SCOPE = "consoleapp_groupchat"
 
-async def main():
+
+async def main(command: str = "run"):
     # Get API key from environment variables
     CONNECTION_STRING = os.environ.get("AZURE_AI_CONNECTION_STRING", "")
     BING_CONNECTION_NAME = os.environ.get("BING_CONNECTION_NAME", "")
@@ -87,7 +87,7 @@ async def main():
     # Check if the connection string is set, if not, raise an error
     if not CONNECTION_STRING:
         raise ValueError("Please set the AZURE_AI_CONNECTION_STRING environment variable.")
-    if not BING_CONNECTION_NAME:
+    if command == "run" and not BING_CONNECTION_NAME:
         raise ValueError("Please set the BING_CONNECTION_NAME environment variable.")
 
     # Create AI agent settings with API key
@@ -99,6 +99,11 @@ async def main():
     
     # Use create_client with API key instead of credential
     async with AzureAIAgent.create_client(credential=credential, conn_str=ai_agent_settings.project_connection_string.get_secret_value()) as client:
+        if command == "cleanup":
+            deleted = await AgentDefinitionCache(client.agents, scope=AGENT_SCOPE).cleanup()
+            print(f"Deleted {len(deleted)} agents: {', '.join(deleted) or '-'}")
+            return
+
         # Get Bing connection ID
         bing_connection = await client.connections.get(connection_name=BING_CONNECTION_NAME)
         print(f"Bing connection ID: {bing_connection.id}")
@@ -107,9 +112,11 @@ async def main():
         bing_tool = BingGroundingTool(connection_id=bing_connection.id)
         print("Bing Grounding Tool initialized")
         
-        # エージェント定義
-        # 1. Create the reviewer agent on the Azure AI agent service
-        reviewer_agent_definition = await client.agents.create_agent(
+        # エージェント定義 (名前と定義のハッシュが同じなら前回のものを使う)
+        definitions = AgentDefinitionCache(client.agents, scope=AGENT_SCOPE)
+
+        # 1. Find or create the reviewer agent on the Azure AI agent service
+        reviewer_agent_definition = await definitions.ensure(
             model=ai_agent_settings.model_deployment_name,
             name=REVIEWER_NAME,
             instructions=REVIEWER_INSTRUCTIONS,
@@ -121,8 +128,8 @@ async def main():
             definition=reviewer_agent_definition,
         )
 
-        # 3. Create the copy writer agent on the Azure AI agent service
-        copy_writer_agent_definition = await client.agents.create_agent(
+        # 3. Find or create the copy writer agent on the Azure AI agent service
+        copy_writer_agent_definition = await definitions.ensure(
             model=ai_agent_settings.model_deployment_name,
             name=COPYWRITER_NAME,
             instructions=COPYWRITER_INSTRUCTIONS,
@@ -134,8 +141,8 @@ async def main():
             definition=copy_writer_agent_definition,
         )
 
-        # 5. Create the IP checker agent on the Azure AI agent service with Bing Search capability
-        ip_checker_agent_definition = await client.agents.create_agent(
+        # 5. Find or create the IP checker agent on the Azure AI agent service with Bing Search capability
+        ip_checker_agent_definition = await definitions.ensure(
             model=ai_agent_settings.model_deployment_name,
             name=INTELLECTUAL_PROPERTY_NAME,
             instructions=INTELLECTUAL_PROPERTY_INSTRUCTIONS,
@@ -148,13 +155,15 @@ async def main():
             client=client,
             definition=ip_checker_agent_definition,
         )
+        print(f"Agent definitions: {definitions.stats}")
 
-        # 7. Place the agents in a group chat with a custom termination strategy
+        # 7. Place the agents in a group chat with the transition table for selection and termination
         # メッセージ履歴の共有
+        agents = [agent_writer, agent_ip_checker, agent_reviewer]
         chat = AgentGroupChat(
-            agents=[agent_writer, agent_ip_checker, agent_reviewer],
-            termination_strategy=ApprovalTerminationStrategy(agents=[agent_reviewer], maximum_iterations=15),
-            selection_strategy=TaskProgressSelectionStrategy(agents=[agent_writer, agent_ip_checker, agent_reviewer]),
+            agents=agents,
+            termination_strategy=TransitionTerminationStrategy(table=TRANSITION_TABLE, agents=[agent_reviewer], maximum_iterations=15),
+            selection_strategy=TransitionSelectionStrategy(table=TRANSITION_TABLE, agents=agents),
         )
 
         try:
@@ -165,11 +174,11 @@ async def main():
             async for content in chat.invoke():
                 print(f"# {content.role} - {content.name or '*'}: '{content.content}'")
         finally:
-            # 10. Cleanup: Delete the agents
+            # 10. Reset the chat; the agents are kept for the next run (see cleanup)
             await chat.reset()
-            await client.agents.delete_agent(agent_reviewer.id)
-            await client.agents.delete_agent(agent_writer.id)
-            await client.agents.delete_agent(agent_ip_checker.id)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="CopyWriter / IPChecker / Director のグループチャット")
+    parser.add_argument("command", nargs="?", choices=["run", "cleanup"], default="run",
+                        help="run: チャットを実行 (既定) / cleanup: このアプリが作ったエージェントを削除")
+    asyncio.run(main(parser.parse_args().command))
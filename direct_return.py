@@ -0,0 +1,270 @@
+# ツールの結果をそのままユーザーに返し、関数呼び出しループを終了させる仕組み
+#
+# get_item_price のように結果が "$9.99" だけのツールでは、自動関数呼び出しループが
+# その結果を言い直すためだけにもう一度 LLM を呼びます。
+# @direct_return を付けた kernel function (または DirectReturnFilter に名前を渡した関数) が
+# そのリクエストで呼ばれた唯一の種類のツールであれば、フィルターが context.terminate を立て、
+# 2回目の LLM 呼び出しを省略します。
+# Semantic Kernel の内部動作 (プレースホルダーの結果、metadata の引き継ぎ、terminate) に依存するので、
+# SK を更新したら TestDirectReturnFilter で確認してください。
+
+import asyncio
+import unittest
+
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.function_call_content import FunctionCallContent
+from semantic_kernel.contents.function_result_content import FunctionResultContent
+from semantic_kernel.filters.auto_function_invocation.auto_function_invocation_context import (
+    AutoFunctionInvocationContext,
+)
+
+DIRECT_RETURN_ATTRIBUTE = "__kernel_function_direct_return__"
+DIRECT_RETURN_METADATA_KEY = "direct_return"
+
+
+def direct_return(func):
+    """
+    Marks a kernel function as terminal: its result is the final answer.
+
+    Apply it on top of @kernel_function:
+
+        @direct_return
+        @kernel_function(description="Provides the price of the requested menu item.")
+        def get_item_price(self, menu_item: str) -> str: ...
+    """
+    setattr(func, DIRECT_RETURN_ATTRIBUTE, True)
+    return func
+
+
+class DirectReturnFilter:
+    """
+    An auto function invocation filter that ends the function-calling loop
+    after a terminal function, so its result goes straight back to the user.
+
+    The loop only ends when every function call in the model's response is
+    terminal and succeeded; otherwise the model still needs to see the results.
+
+    Args:
+        function_names: Extra fully qualified names ("plugin-function") to
+            treat as terminal, for functions that can't be decorated.
+    """
+
+    def __init__(self, function_names=()):
+        self.function_names = set(function_names)
+
+    def is_terminal(self, function) -> bool:
+        if function is None:
+            return False
+        if function.fully_qualified_name in self.function_names:
+            return True
+        method = getattr(function, "method", None)
+        return bool(getattr(method, DIRECT_RETURN_ATTRIBUTE, False))
+
+    def _all_calls_terminal(self, context: AutoFunctionInvocationContext) -> bool:
+        if context.function_count <= 1 or not context.chat_history:
+            return True
+        # The assistant message with all the tool calls of this request is the
+        # last one containing FunctionCallContent
+        for message in reversed(context.chat_history.messages):
+            calls = [item for item in message.items if isinstance(item, FunctionCallContent)]
+            if calls:
+                for call in calls:
+                    try:
+                        function = context.kernel.get_function(call.plugin_name, call.function_name)
+                    except Exception:
+                        return False
+                    if not self.is_terminal(function):
+                        return False
+                return True
+        return False
+
+    async def __call__(self, context: AutoFunctionInvocationContext, next):
+        placeholder = context.function_result
+        await next(context)
+        if not self.is_terminal(context.function):
+            return
+        result = context.function_result
+        # The kernel keeps the placeholder result and stores an error message in
+        # it when the function raised; let the model handle errors as usual
+        if result is None or result is placeholder or result.value is None:
+            return
+        if self._all_calls_terminal(context):
+            result.metadata[DIRECT_RETURN_METADATA_KEY] = True
+            context.terminate = True
+
+
+def direct_return_text(message: ChatMessageContent) -> str:
+    """
+    Returns the text of the direct-return results in `message`, or "".
+    Use it to render TOOL messages that ended the loop.
+    """
+    parts = [
+        str(item.result)
+        for item in message.items
+        if isinstance(item, FunctionResultContent) and item.metadata.get(DIRECT_RETURN_METADATA_KEY)
+    ]
+    return "\n".join(parts)
+
+
+class DirectReturnCollector:
+    """
+    Collects the direct-return results of an agent invocation, for both
+    ChatCompletionAgent.invoke and invoke_stream.
+
+    Neither path yields the tool message that ended the loop as a normal
+    response, but both pass it to `on_intermediate_message`. Pass the collector
+    there and call `take()` after each response and once after the loop:
+
+        collector = DirectReturnCollector()
+        async for response in agent.invoke_stream(messages=..., on_intermediate_message=collector):
+            send(str(response.content) + collector.take())
+        send(collector.take())
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._seen = set()
+
+    async def __call__(self, message: ChatMessageContent):
+        for item in message.items:
+            if not isinstance(item, FunctionResultContent) or not item.metadata.get(DIRECT_RETURN_METADATA_KEY):
+                continue
+            # 同じ結果が別のメッセージで再度渡されても1回だけ返す
+            key = item.call_id or id(item)
+            if key not in self._seen:
+                self._seen.add(key)
+                self._pending.append(str(item.result))
+
+    def take(self) -> str:
+        """Returns the results collected since the last call, or ""."""
+        text = "\n".join(self._pending)
+        self._pending.clear()
+        return text
+
+
+class TestDirectReturnFilter(unittest.TestCase):
+    def make_service(self, responses):
+        from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+        from semantic_kernel.contents.streaming_chat_message_content import StreamingChatMessageContent
+        from semantic_kernel.contents.utils.author_role import AuthorRole
+
+        class ScriptedChatCompletion(ChatCompletionClientBase):
+            """Returns the scripted tool calls, then plain text; counts the model calls."""
+
+            SUPPORTS_FUNCTION_CALLING = True
+            calls: int = 0
+
+            def _update_function_choice_settings_callback(self):
+                return lambda *args, **kwargs: None
+
+            def _reset_function_choice_settings(self, settings):
+                pass
+
+            def _next_items(self):
+                self.calls += 1
+                return responses[self.calls - 1] if self.calls <= len(responses) else []
+
+            async def _inner_get_chat_message_contents(self, chat_history, settings):
+                items = self._next_items()
+                if not items:
+                    return [ChatMessageContent(role=AuthorRole.ASSISTANT, content="The model answered.")]
+                return [ChatMessageContent(role=AuthorRole.ASSISTANT, items=items)]
+
+            async def _inner_get_streaming_chat_message_contents(self, chat_history, settings, function_invoke_attempt=0):
+                items = self._next_items()
+                if not items:
+                    for text in ("The model ", "answered."):
+                        yield [StreamingChatMessageContent(role=AuthorRole.ASSISTANT, choice_index=0, content=text)]
+                    return
+                yield [StreamingChatMessageContent(role=AuthorRole.ASSISTANT, choice_index=0, items=items)]
+
+        return ScriptedChatCompletion(ai_model_id="scripted")
+
+    def make_kernel(self, *calls):
+        from semantic_kernel import Kernel
+        from semantic_kernel.functions import kernel_function
+
+        class MenuPlugin:
+            @direct_return
+            @kernel_function(description="Provides the price of the requested menu item.")
+            def get_item_price(self, menu_item: str) -> str:
+                return "$9.99"
+
+            @kernel_function(description="Provides a list of specials from the menu.")
+            def get_specials(self) -> str:
+                return "Clam Chowder"
+
+            @direct_return
+            @kernel_function(description="Always fails.")
+            def get_broken(self) -> str:
+                raise RuntimeError("broken")
+
+        service = self.make_service([[
+            FunctionCallContent(id=f"call_{i}", name=f"menu-{name}", arguments=arguments)
+            for i, (name, arguments) in enumerate(calls)
+        ]])
+        kernel = Kernel()
+        kernel.add_service(service)
+        kernel.add_plugin(MenuPlugin(), "menu")
+        kernel.add_filter("auto_function_invocation", DirectReturnFilter())
+        return kernel, service
+
+    def run_turn(self, *calls):
+        from semantic_kernel.connectors.ai import FunctionChoiceBehavior
+        from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+        from semantic_kernel.contents.chat_history import ChatHistory
+
+        kernel, service = self.make_kernel(*calls)
+        history = ChatHistory()
+        history.add_user_message("How much is the tea?")
+        settings = PromptExecutionSettings(function_choice_behavior=FunctionChoiceBehavior.Auto())
+        messages = asyncio.run(service.get_chat_message_contents(history, settings, kernel=kernel))
+        return messages[0], service.calls
+
+    def run_agent(self, *calls, stream: bool):
+        """Renders an agent turn the way webapp_chat does; returns the text chunks and the model calls."""
+        from semantic_kernel.agents import ChatCompletionAgent
+
+        kernel, service = self.make_kernel(*calls)
+        agent = ChatCompletionAgent(kernel=kernel, name="Host")
+        collector = DirectReturnCollector()
+
+        async def run():
+            chunks = []
+            invoke = agent.invoke_stream if stream else agent.invoke
+            async for response in invoke(messages="How much is the tea?", on_intermediate_message=collector):
+                chunks.append(str(response.content) + collector.take())
+            chunks.append(collector.take())
+            return [chunk for chunk in chunks if chunk]
+
+        return asyncio.run(run()), service.calls
+
+    def test_terminal_function_ends_the_turn(self):
+        message, model_calls = self.run_turn(("get_item_price", '{"menu_item": "tea"}'))
+        self.assertEqual(model_calls, 1)
+        self.assertEqual(direct_return_text(message), "$9.99")
+
+    def test_other_functions_return_to_the_model(self):
+        for calls in (
+            [("get_specials", "{}")],
+            # 終端でない関数と一緒に呼ばれたら、モデルが両方の結果を見る必要がある
+            [("get_item_price", '{"menu_item": "tea"}'), ("get_specials", "{}")],
+            # 失敗した場合はモデルにエラーを扱わせる
+            [("get_broken", "{}")],
+        ):
+            message, model_calls = self.run_turn(*calls)
+            self.assertEqual(model_calls, 2, calls)
+            self.assertEqual(message.content, "The model answered.")
+            self.assertEqual(direct_return_text(message), "")
+
+    def test_agent_renders_direct_results(self):
+        # /chat (invoke_stream) と WebSocket (invoke) が同じように結果を返す
+        for stream in (True, False):
+            chunks, model_calls = self.run_agent(("get_item_price", '{"menu_item": "tea"}'), stream=stream)
+            self.assertEqual((chunks, model_calls), (["$9.99"], 1), stream)
+            chunks, model_calls = self.run_agent(("get_specials", "{}"), stream=stream)
+            self.assertEqual(("".join(chunks), model_calls), ("The model answered.", 2), stream)
+
+
+if __name__ == "__main__":
+    unittest.main()
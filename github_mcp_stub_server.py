@@ -0,0 +1,239 @@
+# GitHub MCP (api.github.com/mcp/v1) のローカル代替サーバー
+#
+# GitHubMCPClient が使う /completions と /models に固定の応答を返す小さな HTTP サーバーです。
+# クライアントのテストやベンチマークを GitHub にアクセスせずに実行するために使います。
+# "stream": true のリクエストには応答を数文字ずつ server-sent events (data: {...}) で返し、
+# 最後に data: [DONE] を送ります。
+# GitHub と同じ X-RateLimit-* ヘッダーを付け、上限を超えると Retry-After 付きの 429 (または 403) を返します。
+# 503 をランダムに、または fail_next() で指定した回数だけ返すこともできます。
+#
+#   python github_mcp_stub_server.py --port 8766 --latency 0.02 --chunk-delay 0.01
+#   python github_mcp_stub_server.py --rate-limit 60 --rate-window 60 --failure-rate 0.05
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+
+from aiohttp import web
+
+API_PREFIX = "/mcp/v1"
+DEFAULT_TEXT = "def fibonacci(n):\n    a, b = 0, 1\n    for _ in range(n):\n        a, b = b, a + b\n    return a\n"
+DEFAULT_MODELS = [{"id": "github-copilot", "object": "model"}]
+
+
+class GitHubMCPStubServer:
+    """
+    A local stand-in for the GitHub MCP completion endpoints.
+
+    `stats["connections"]` counts distinct client connections, which shows
+    whether the client reuses its connections.
+    """
+
+    def __init__(
+        self,
+        text: str = DEFAULT_TEXT,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: int | None = None,
+        chunk_size: int = 8,
+        chunk_delay: float = 0.0,
+        failure_rate: float = 0.0,
+        rate_limit: int = 0,
+        rate_window: float = 60.0,
+        rate_limit_status: int = 429,
+    ):
+        self.text = text
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.rate_limit_status = rate_limit_status
+        self.stats = {
+            "requests": 0, "connections": 0, "streams": 0, "streams_aborted": 0,
+            "failures": 0, "rate_limited": 0, "max_in_flight": 0,
+        }
+        self._in_flight = 0
+        self.root_url = None
+        self._forced = []
+        self._window_start = None
+        self._window_used = 0
+        self._peers = set()
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        """The value for GitHubMCPClient(base_url=...)."""
+        return f"{self.root_url}{API_PREFIX}"
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(API_PREFIX + "/completions", self.handle_completions)
+        app.router.add_get(API_PREFIX + "/models", self.handle_models)
+        return app
+
+    def fail_next(self, status: int = 503, count: int = 1, retry_after: float | None = None):
+        """Makes the next `count` requests fail with `status` (and a Retry-After header if given)."""
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+        self._forced.extend([(status, headers)] * count)
+
+    def _rate_limit_headers(self) -> tuple[dict, bool]:
+        # 最初のリクエストから rate_window 秒ごとに使用数をリセットする固定ウィンドウ
+        now = time.time()
+        if self._window_start is None or now >= self._window_start + self.rate_window:
+            self._window_start = now
+            self._window_used = 0
+        reset = self._window_start + self.rate_window
+        allowed = self._window_used < self.rate_limit
+        if allowed:
+            self._window_used += 1
+        headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(self.rate_limit - self._window_used),
+            "X-RateLimit-Used": str(self._window_used),
+            "X-RateLimit-Reset": str(math.ceil(reset)),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(reset - now)))
+        return headers, allowed
+
+    async def _before_response(self, request: web.Request) -> tuple[web.Response | None, dict]:
+        """Counts the request and waits; returns an error response to send instead, if any."""
+        self.stats["requests"] += 1
+        peer = request.transport.get_extra_info("peername") if request.transport else None
+        if peer not in self._peers:
+            self._peers.add(peer)
+            self.stats["connections"] += 1
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        headers = {}
+        if self.rate_limit:
+            headers, allowed = self._rate_limit_headers()
+            if not allowed:
+                self.stats["rate_limited"] += 1
+                message = {"message": "API rate limit exceeded (stub)"}
+                return web.json_response(message, status=self.rate_limit_status, headers=headers), headers
+        if self._forced:
+            status, forced_headers = self._forced.pop(0)
+            self.stats["failures"] += 1
+            return web.Response(status=status, text="Forced failure (stub)", headers={**headers, **forced_headers}), headers
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.stats["failures"] += 1
+            return web.Response(status=503, text="Service Unavailable (stub)", headers=headers), headers
+        return None, headers
+
+    async def handle_completions(self, request: web.Request) -> web.StreamResponse:
+        self._in_flight += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+        try:
+            return await self._complete(request)
+        finally:
+            self._in_flight -= 1
+
+    async def _complete(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        error, headers = await self._before_response(request)
+        if error is not None:
+            return error
+        if payload.get("stream"):
+            return await self._stream_completion(request, payload, headers)
+        body = {
+            "id": f"cmpl-stub-{self.stats['requests']}",
+            "object": "text_completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "text": self.text, "finish_reason": "stop"}],
+        }
+        return web.json_response(body, headers=headers)
+
+    async def _stream_completion(self, request: web.Request, payload: dict, headers: dict) -> web.StreamResponse:
+        self.stats["streams"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache", **headers})
+        await response.prepare(request)
+        completion_id = f"cmpl-stub-{self.stats['requests']}"
+        try:
+            for start in range(0, len(self.text), self.chunk_size):
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+                event = {
+                    "id": completion_id,
+                    "object": "text_completion",
+                    "model": payload.get("model"),
+                    "choices": [{"index": 0, "text": self.text[start:start + self.chunk_size], "finish_reason": None}],
+                }
+                await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            done = {"id": completion_id, "choices": [{"index": 0, "text": "", "finish_reason": "stop"}]}
+            await response.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            await response.write_eof()
+        except ConnectionResetError:
+            # クライアントが途中で接続を閉じた
+            self.stats["streams_aborted"] += 1
+        return response
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        error, headers = await self._before_response(request)
+        if error is not None:
+            return error
+        return web.Response(text=json.dumps(DEFAULT_MODELS), content_type="application/json", headers=headers)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Starts the server in the running event loop and returns its base URL.
+        Port 0 picks a free port.
+        """
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.root_url = f"http://{host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GitHub MCP API のローカル代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答遅延 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延に加える揺らぎの最大値 (秒)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=8, help="ストリーミング時の1イベントの文字数")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="ストリーミング時のイベントの間隔 (秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="503を返す割合 (0.0〜1.0)")
+    parser.add_argument("--rate-limit", type=int, default=0, help="ウィンドウあたりのリクエスト数の上限 (0 で無制限)")
+    parser.add_argument("--rate-window", type=float, default=60.0, help="レート制限のウィンドウ (秒)")
+    parser.add_argument("--rate-limit-status", type=int, default=429, choices=[403, 429], help="上限を超えたときのステータス")
+    args = parser.parse_args()
+
+    server = GitHubMCPStubServer(
+        latency=args.latency, jitter=args.jitter, seed=args.seed,
+        chunk_size=args.chunk_size, chunk_delay=args.chunk_delay, failure_rate=args.failure_rate,
+        rate_limit=args.rate_limit, rate_window=args.rate_window, rate_limit_status=args.rate_limit_status,
+    )
+    print(f"GitHub MCP stub: http://{args.host}:{args.port}{API_PREFIX}")
+    web.run_app(server.make_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
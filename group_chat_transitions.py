@@ -0,0 +1,234 @@
+# AgentGroupChat の発言者選択と終了判定を、宣言的な遷移表から作る
+#
+# consoleapp_groupchat.py の TaskProgressSelectionStrategy は毎ターン next(a for a in agents ...) で
+# エージェント一覧を走査し、部分文字列で分岐していました。さらに "問題あり" のときに "Copywriter" を探していたため
+# (実際の名前は "CopyWriter")、StopIteration で失敗する状態でした。
+# TransitionTable は (直前の発言者, 内容のパターン) -> 次のエージェント / TERMINATE の表を読み込み時に検証してコンパイルし、
+# 選択と終了判定は発言者名の辞書引きと、その発言者の行の正規表現だけで決まります (LLM は呼びません)。
+#
+#   table = TransitionTable([
+#       (START, None, "CopyWriter"),
+#       ("CopyWriter", None, "IPChecker"),
+#       ("IPChecker", "問題なし", "Director"),
+#       ("Director", "承認", TERMINATE),
+#       (ANY, None, "CopyWriter"),
+#   ], agent_names=["CopyWriter", "IPChecker", "Director"])
+#   chat = AgentGroupChat(
+#       agents=agents,
+#       selection_strategy=TransitionSelectionStrategy(table=table, agents=agents),
+#       termination_strategy=TransitionTerminationStrategy(table=table, maximum_iterations=15),
+#   )
+
+import re
+import unittest
+
+from pydantic import PrivateAttr
+from semantic_kernel.agents import Agent
+from semantic_kernel.agents.strategies import TerminationStrategy
+from semantic_kernel.agents.strategies.selection.selection_strategy import SelectionStrategy
+from semantic_kernel.contents import AuthorRole
+
+# 直前の発言者の欄に書く特別な値
+START = "<start>"  # 履歴が空か、最後がユーザーのメッセージ
+ANY = "*"  # どの発言者でも
+# 次のエージェントの欄に書く特別な値
+TERMINATE = "<terminate>"
+
+
+class TransitionTable:
+    """
+    A validated, compiled list of (last speaker, content pattern, next agent) rows.
+
+    For a turn, the first row (in table order) whose speaker is the last speaker
+    (or ANY) and whose pattern matches the last message wins. A pattern of None
+    matches any content; patterns are regular expressions searched in the content.
+
+    Args:
+        rows: (speaker, pattern, target) tuples; speaker may be START or ANY, target may be TERMINATE.
+        agent_names: When given, every speaker and target must be one of these names.
+        flags: re flags for every pattern.
+
+    Raises:
+        ValueError: If a row is malformed, a pattern doesn't compile, a name is unknown,
+            a row can never match, or no row handles START.
+    """
+
+    def __init__(self, rows, agent_names=None, flags: int = 0):
+        self.rows = [tuple(row) for row in rows]
+        self._compiled = []
+        for index, row in enumerate(self.rows):
+            if len(row) != 3:
+                raise ValueError(f"Transition row {index} must be (speaker, pattern, target): {row!r}")
+            speaker, pattern, target = row
+            if not speaker or not target:
+                raise ValueError(f"Transition row {index} needs a speaker and a target: {row!r}")
+            if target == START or target == ANY:
+                raise ValueError(f"Transition row {index}: {target!r} can't be a target.")
+            try:
+                compiled = re.compile(pattern, flags) if pattern is not None else None
+            except re.error as e:
+                raise ValueError(f"Transition row {index}: invalid pattern {pattern!r}: {e}") from e
+            self._compiled.append((speaker, compiled, target))
+        if agent_names is not None:
+            self.check_names(agent_names)
+
+        # 発言者ごとに、その発言者に当てはまる行を表の順に並べておく
+        speakers = {speaker for speaker, _, _ in self._compiled if speaker != ANY}
+        self._by_speaker = {
+            speaker: [(p, t) for s, p, t in self._compiled if s == speaker or s == ANY] for speaker in speakers
+        }
+        self._fallback = [(p, t) for s, p, t in self._compiled if s == ANY]
+        self._check_reachable()
+        if not any(pattern is None for pattern, _ in self._rows_for(START)):
+            raise ValueError("The transition table needs a row without a pattern for START (or ANY).")
+        # 選択と終了判定で同じメッセージを2回照合しない
+        self._last = (None, None, None)
+
+    def check_names(self, agent_names):
+        """Raises ValueError if a speaker or target isn't one of `agent_names`."""
+        names = set(agent_names)
+        by_lower = {name.lower(): name for name in names}
+        for index, (speaker, _, target) in enumerate(self.rows):
+            for name in (speaker, target):
+                if name in (START, ANY, TERMINATE) or name in names:
+                    continue
+                # "Copywriter" と "CopyWriter" のような大文字小文字の違いを指摘する
+                hint = f" (did you mean {by_lower[name.lower()]!r}?)" if name.lower() in by_lower else ""
+                raise ValueError(f"Transition row {index}: unknown agent {name!r}{hint}.")
+
+    def _check_reachable(self):
+        # パターンなしの行より後ろにある同じ発言者の行は、決して使われない
+        for index, (speaker, pattern, target) in enumerate(self._compiled):
+            for earlier_speaker, earlier_pattern, _ in self._compiled[:index]:
+                if earlier_pattern is None and earlier_speaker in (speaker, ANY):
+                    raise ValueError(
+                        f"Transition row {index} {self.rows[index]!r} is unreachable after a catch-all row for {earlier_speaker!r}."
+                    )
+
+    def _rows_for(self, speaker: str):
+        return self._by_speaker.get(speaker, self._fallback)
+
+    def resolve(self, speaker: str | None, content: str | None) -> str | None:
+        """The next agent name (or TERMINATE) after `speaker` said `content`; None if no row matches."""
+        speaker = speaker or START
+        content = content or ""
+        last_speaker, last_content, last_target = self._last
+        if speaker == last_speaker and content is last_content:
+            return last_target
+        target = None
+        for pattern, row_target in self._rows_for(speaker):
+            if pattern is None or pattern.search(content):
+                target = row_target
+                break
+        self._last = (speaker, content, target)
+        return target
+
+    def resolve_history(self, history) -> str | None:
+        """resolve() for the last message of a group chat history."""
+        if not history or history[-1].role == AuthorRole.USER:
+            return self.resolve(START, history[-1].content if history else "")
+        return self.resolve(history[-1].name, history[-1].content)
+
+
+class TransitionSelectionStrategy(SelectionStrategy):
+    """
+    Selects the next agent from a TransitionTable.
+
+    Args:
+        table: The transition table; its names are checked against `agents`.
+        agents: The agents of the group chat, indexed by name.
+        default: The agent name used when no row matches or the table says TERMINATE
+            (termination is left to TransitionTerminationStrategy).
+    """
+
+    table: TransitionTable
+    default: str | None = None
+    _agents_by_name: dict = PrivateAttr(default_factory=dict)
+
+    def __init__(self, table: TransitionTable, agents: list[Agent], default: str | None = None, **kwargs):
+        super().__init__(table=table, default=default, **kwargs)
+        names = [agent.name for agent in agents]
+        table.check_names(names)
+        if default is not None and default not in names:
+            raise ValueError(f"Unknown default agent {default!r}.")
+        self._agents_by_name = {agent.name: agent for agent in agents}
+
+    async def select_agent(self, agents: list[Agent], history) -> Agent:
+        target = self.table.resolve_history(history)
+        agent = self._agents_by_name.get(target) or self._agents_by_name.get(self.default)
+        if agent is None:
+            raise ValueError(f"No transition for the last message and no default agent (resolved {target!r}).")
+        return agent
+
+
+class TransitionTerminationStrategy(TerminationStrategy):
+    """Terminates when the TransitionTable resolves the last message to TERMINATE."""
+
+    table: TransitionTable
+
+    async def should_agent_terminate(self, agent, history):
+        return bool(history) and self.table.resolve_history(history) == TERMINATE
+
+
+class TestTransitionTable(unittest.TestCase):
+    NAMES = ["CopyWriter", "IPChecker", "Director"]
+    ROWS = [
+        (START, None, "CopyWriter"),
+        ("IPChecker", "問題なし", "Director"),
+        ("IPChecker", "問題あり", "CopyWriter"),
+        ("CopyWriter", None, "IPChecker"),
+        ("Director", "承認", TERMINATE),
+        (ANY, None, "CopyWriter"),
+    ]
+
+    def test_selects_and_terminates(self):
+        import asyncio
+
+        from semantic_kernel.agents import ChatCompletionAgent
+        from semantic_kernel.contents import ChatMessageContent
+
+        def message(name, content):
+            role = AuthorRole.USER if name is None else AuthorRole.ASSISTANT
+            return ChatMessageContent(role=role, name=name, content=content)
+
+        # 選択と終了判定は名前しか使わないので、サービスのないエージェントで足りる
+        agents = [ChatCompletionAgent(name=name) for name in self.NAMES]
+        table = TransitionTable(self.ROWS, agent_names=self.NAMES)
+        selection = TransitionSelectionStrategy(table=table, agents=agents)
+        termination = TransitionTerminationStrategy(table=table, agents=[agents[2]])
+        turns = [
+            (None, "キャッチコピーを考えてください。"),
+            ("CopyWriter", "走る歓び、燃費で証明。"),
+            ("IPChecker", "問題あり: 類似例があります。"),
+            ("CopyWriter", "一滴で、遠くへ。"),
+            ("IPChecker", "問題なし"),
+            ("Director", "もっと短くしてください。"),
+        ]
+
+        async def run():
+            history, selected = [], []
+            for name, content in turns:
+                history.append(message(name, content))
+                selected.append((await selection.next(agents, history)).name)
+            history.append(message("Director", "承認します。"))
+            return selected, await termination.should_terminate(agents[2], history), await termination.should_terminate(agents[2], history[:-1])
+
+        selected, terminated, continued = asyncio.run(run())
+        # 以前は "問題あり" の後に "Copywriter" を探して失敗していた
+        self.assertEqual(selected, ["CopyWriter", "IPChecker", "CopyWriter", "IPChecker", "Director", "CopyWriter"])
+        self.assertTrue(terminated)
+        self.assertFalse(continued)
+
+    def test_validates_at_load(self):
+        with self.assertRaisesRegex(ValueError, "did you mean 'CopyWriter'"):
+            TransitionTable([*self.ROWS[:2], ("IPChecker", "問題あり", "Copywriter"), *self.ROWS[3:]], agent_names=self.NAMES)
+        with self.assertRaisesRegex(ValueError, "invalid pattern"):
+            TransitionTable([(START, "(", "CopyWriter")])
+        with self.assertRaisesRegex(ValueError, "unreachable"):
+            TransitionTable([(ANY, None, "CopyWriter"), ("Director", "承認", TERMINATE)])
+        with self.assertRaisesRegex(ValueError, "START"):
+            TransitionTable([("CopyWriter", None, "IPChecker")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,396 @@
+# httpx 用のリトライ・レート制限・サーキットブレーカー
+#
+# GitHubMCPClient はステータスが 200 以外だとすぐに例外にしていたため、一時的な 5xx や
+# GitHub のレート制限 (429 / X-RateLimit-Remaining: 0 の 403) でもそのまま失敗していました。
+# ResilientTransport は httpx のトランスポートを包み、次のことを行います。
+#   - 再試行できるステータスと接続エラーを、指数バックオフ (full jitter) で再試行する
+#   - Retry-After と X-RateLimit-Remaining / X-RateLimit-Reset を読み、上限に達する前から送信を待たせる
+#   - 失敗が続いたら一定時間は上流に送らずに CircuitOpenError ですぐ失敗する
+#
+#   transport = ResilientTransport(httpx.AsyncHTTPTransport(limits=...), retry=RetryPolicy(max_attempts=4))
+#   client = httpx.AsyncClient(base_url=..., transport=transport)
+
+import asyncio
+import email.utils
+import logging
+from datetime import timezone
+import random
+import time
+import unittest
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised without contacting the upstream while the circuit breaker is open."""
+
+
+class RetryPolicy:
+    """
+    Which responses to retry and how long to wait between attempts.
+
+    Args:
+        max_attempts: Attempts per request, including the first one.
+        base_delay: Backoff base in seconds; attempt n waits up to base_delay * 2**n.
+        max_delay: Upper bound of one backoff.
+        retry_statuses: Statuses that are retried. 403 is retried only when it is a rate limit.
+        max_retry_after: Longer Retry-After waits are not waited out; the response is returned.
+        idempotent_methods: Methods retried after any transport error. Other methods (e.g. POST
+            /completions) are retried only when the connection failed before the request was sent.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        retry_statuses: tuple[int, ...] = (429, 500, 502, 503, 504),
+        max_retry_after: float = 60.0,
+        idempotent_methods: tuple[str, ...] = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"),
+        seed: int | None = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+        self.max_retry_after = max_retry_after
+        self.idempotent_methods = {method.upper() for method in idempotent_methods}
+        self.random = random.Random(seed)
+
+    def backoff(self, attempt: int) -> float:
+        # full jitter: 同時に失敗したリクエストの再試行をばらけさせる
+        return self.random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def is_retryable(self, response: httpx.Response) -> bool:
+        if response.status_code in self.retry_statuses:
+            return True
+        return response.status_code == 403 and is_rate_limited(response)
+
+    def is_retryable_error(self, request: httpx.Request, error: httpx.TransportError) -> bool:
+        if request.method.upper() in self.idempotent_methods:
+            return True
+        # 送信後に切れた POST を再試行すると、上流で2回実行 (課金) されることがある
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def is_rate_limited(response: httpx.Response) -> bool:
+    return "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0"
+
+
+class RateLimiter:
+    """
+    Tracks the upstream rate-limit budget and holds requests back before it runs out.
+
+    Args:
+        reserve: Requests left unused in each window (e.g. for other processes).
+        max_wait: Longest single wait for a window reset; later requests go
+            out anyway and are handled by the retry policy.
+    """
+
+    def __init__(self, reserve: int = 0, max_wait: float = 60.0):
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.blocked_until = 0.0
+        self.stats = {"throttled": 0, "throttle_seconds": 0.0}
+
+    def delay(self) -> float:
+        """Seconds to wait before the next request may be sent."""
+        delay = self.blocked_until - time.monotonic()
+        if self.remaining is not None and self.remaining <= self.reserve and self.reset_at is not None:
+            delay = max(delay, self.reset_at - time.time())
+        return min(max(delay, 0.0), self.max_wait)
+
+    async def acquire(self):
+        delay = self.delay()
+        if delay > 0:
+            self.stats["throttled"] += 1
+            self.stats["throttle_seconds"] += delay
+            logger.info("Rate limit: waiting %.1fs before the next request", delay)
+            await asyncio.sleep(delay)
+            if self.reset_at is not None and time.time() >= self.reset_at:
+                # ウィンドウが切り替わったので次の応答で残数がわかるまでは制限しない
+                self.remaining = None
+        if self.remaining is not None:
+            # 応答を待たずに同時に送るリクエストの分も残数から引いておく
+            self.remaining -= 1
+
+    def update(self, response: httpx.Response):
+        headers = response.headers
+        try:
+            if "X-RateLimit-Limit" in headers:
+                self.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in headers:
+                self.reset_at = float(headers["X-RateLimit-Reset"])
+        except ValueError:
+            pass
+
+    def retry_after(self, response: httpx.Response) -> float | None:
+        """Seconds the upstream asked us to wait, from Retry-After or X-RateLimit-Reset."""
+        value = response.headers.get("Retry-After")
+        if value is not None:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+            try:
+                date = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=timezone.utc)
+            return max(0.0, date.timestamp() - time.time())
+        if is_rate_limited(response) and self.reset_at is not None:
+            return max(0.0, self.reset_at - time.time())
+        return None
+
+    def block(self, seconds: float):
+        """Holds back every request (not just the retried one) for `seconds`."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive failures.
+
+    After `reset_timeout` seconds one trial request is let through (half-open);
+    its success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._trial_started = 0.0
+        self.stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self):
+        state = self.state
+        if state == "closed":
+            return
+        # 試行中のリクエストがキャンセルされても止まったままにならないよう、古い試行は数えない
+        if state == "half-open" and (not self._trial or time.monotonic() - self._trial_started >= self.reset_timeout):
+            self._trial = True
+            self._trial_started = time.monotonic()
+            return
+        self.stats["rejected"] += 1
+        raise CircuitOpenError(f"Circuit open after {self.failures} consecutive failures")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial:
+                self.stats["opened"] += 1
+            self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps an httpx transport with retries, rate-limit throttling and a circuit breaker.
+
+    Retried responses are closed before the next attempt; the final response
+    (successful or not) is returned to the caller unread, so streaming works.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport | None = None,
+        retry: RetryPolicy | None = None,
+        rate_limiter: RateLimiter | None = None,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.retry = retry or RetryPolicy()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = {"requests": 0, "attempts": 0, "retries": 0}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats["requests"] += 1
+        attempt = -1
+        while True:
+            attempt += 1
+            last = attempt + 1 >= self.retry.max_attempts
+            self.breaker.before_request()
+            await self.rate_limiter.acquire()
+            self.stats["attempts"] += 1
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if last or not self.retry.is_retryable_error(request, e):
+                    raise
+                delay = self.retry.backoff(attempt)
+                logger.warning("%s %s failed (%s); retrying in %.2fs", request.method, request.url, e, delay)
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self.rate_limiter.update(response)
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                # 429 / 403 のレート制限は上流の障害としては数えない
+                self.breaker.record_success()
+            if last or not self.retry.is_retryable(response):
+                return response
+
+            delay = self.rate_limiter.retry_after(response)
+            if delay is None:
+                delay = self.retry.backoff(attempt)
+            elif delay > self.retry.max_retry_after:
+                return response
+            else:
+                # 上流が待つように指示したので、他のリクエストも止める
+                self.rate_limiter.block(delay)
+                delay = 0.0
+            logger.warning("%s %s returned %d; retrying", request.method, request.url, response.status_code)
+            await response.aclose()
+            self.stats["retries"] += 1
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class TestResilientTransport(unittest.TestCase):
+    async def request(self, server, count=1, **transport_options):
+        transport = ResilientTransport(**transport_options)
+        statuses = []
+        async with httpx.AsyncClient(base_url=server.base_url, transport=transport) as client:
+            for _ in range(count):
+                try:
+                    response = await client.get("/models")
+                    statuses.append(response.status_code)
+                except CircuitOpenError:
+                    statuses.append("open")
+        return transport, statuses
+
+    def run_with_stub(self, test, **stub_options):
+        from github_mcp_stub_server import GitHubMCPStubServer
+
+        async def run():
+            async with GitHubMCPStubServer(**stub_options) as server:
+                return await test(server), dict(server.stats)
+
+        return asyncio.run(run())
+
+    def test_retries_with_backoff_and_retry_after(self):
+        async def test(server):
+            server.fail_next(503, count=2)
+            server.fail_next(429, retry_after=1)
+            started = time.monotonic()
+            transport, statuses = await self.request(server, retry=RetryPolicy(base_delay=0.01))
+            return statuses, transport.stats, time.monotonic() - started
+
+        (statuses, stats, elapsed), server_stats = self.run_with_stub(test)
+        self.assertEqual(statuses, [200])
+        self.assertEqual(stats["retries"], 3)
+        self.assertGreaterEqual(elapsed, 1.0)
+        self.assertEqual(server_stats["requests"], 4)
+
+    def test_throttles_before_the_limit(self):
+        async def test(server):
+            limiter = RateLimiter()
+            _, statuses = await self.request(server, count=3, rate_limiter=limiter)
+            return statuses, limiter.stats
+
+        (statuses, limiter_stats), server_stats = self.run_with_stub(test, rate_limit=2, rate_window=1)
+        self.assertEqual(statuses, [200, 200, 200])
+        self.assertEqual(limiter_stats["throttled"], 1)
+        self.assertEqual(server_stats["rate_limited"], 0)
+
+    def test_retries_forbidden_rate_limit(self):
+        async def test(server):
+            _, first = await self.request(server, count=1)
+            # 残数を知らないクライアントは 403 を受けてから Reset まで待つ
+            _, statuses = await self.request(server, count=1)
+            return first + statuses
+
+        statuses, server_stats = self.run_with_stub(test, rate_limit=1, rate_window=1, rate_limit_status=403)
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(server_stats["rate_limited"], 1)
+
+    def test_retry_after_header(self):
+        limiter = RateLimiter()
+
+        def retry_after(value):
+            return limiter.retry_after(httpx.Response(429, headers={"Retry-After": value}))
+
+        self.assertEqual(retry_after("3"), 3.0)
+        self.assertIsNone(retry_after("soon"))
+        future = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(retry_after(future), 30, delta=2)
+        # タイムゾーンのない日付は UTC とみなす
+        self.assertAlmostEqual(retry_after(future.replace(" GMT", "")), 30, delta=2)
+        self.assertEqual(retry_after("Thu, 01 Jan 1970 00:00:00 GMT"), 0.0)
+
+    def test_post_is_not_resent_after_it_was_sent(self):
+        def run(error):
+            attempts = []
+
+            def handler(request):
+                attempts.append(request.method)
+                if len(attempts) == 1:
+                    raise error("dropped", request=request)
+                return httpx.Response(200)
+
+            async def send():
+                transport = ResilientTransport(httpx.MockTransport(handler), retry=RetryPolicy(base_delay=0.001))
+                async with httpx.AsyncClient(transport=transport) as client:
+                    try:
+                        return (await client.post("http://upstream/completions", json={})).status_code, len(attempts)
+                    except httpx.TransportError as e:
+                        return type(e).__name__, len(attempts)
+
+            return asyncio.run(send())
+
+        self.assertEqual(run(httpx.ConnectError), (200, 2))
+        self.assertEqual(run(httpx.ConnectTimeout), (200, 2))
+        self.assertEqual(run(httpx.ReadError), ("ReadError", 1))
+        self.assertEqual(run(httpx.RemoteProtocolError), ("RemoteProtocolError", 1))
+
+    def test_circuit_breaker_fails_fast_and_recovers(self):
+        async def test(server):
+            breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+            options = {"retry": RetryPolicy(max_attempts=1), "breaker": breaker}
+            server.failure_rate = 1.0
+            _, failing = await self.request(server, count=5, **options)
+            requests_while_open = server.stats["requests"]
+            await asyncio.sleep(0.25)
+            server.failure_rate = 0.0
+            _, recovered = await self.request(server, count=2, **options)
+            return failing, requests_while_open, recovered, breaker.state
+
+        (failing, requests_while_open, recovered, state), _ = self.run_with_stub(test)
+        self.assertEqual(failing, [503, 503, 503, "open", "open"])
+        self.assertEqual(requests_while_open, 3)
+        self.assertEqual(recovered, [200, 200])
+        self.assertEqual(state, "closed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,329 @@
+# LLM を呼ばずに答えられる単純な質問のためのファストパス・ルーター
+#
+# 「今何時？」「ライトの一覧」「今日のスペシャルは？」のような質問は、
+# CurrentDatePlugin.get_current_time / LightsPlugin.get_state / MenuPlugin.get_specials を
+# 呼ぶだけで答えられます。ルールとローカルの小さな分類器で確信度が高い場合だけ
+# ツールを直接実行し、テンプレートで回答します。それ以外はエージェントに任せます。
+
+import asyncio
+import re
+import time
+import unittest
+from collections import Counter
+from math import sqrt
+
+from semantic_kernel import Kernel
+
+
+class IntentRule:
+    """
+    One intent that can be answered by calling a single kernel function.
+
+    Args:
+        name: The intent name used in stats.
+        function_name: The kernel function to call.
+        template: A format string with {result}, or a callable taking the result.
+        patterns: Regular expressions that match the intent with full confidence.
+        examples: Example utterances for the local classifier.
+        exclude: Regular expressions that veto the intent (e.g. "turn on").
+        plugin_name: Restricts the lookup to one plugin; any plugin when omitted.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        function_name: str,
+        template,
+        patterns=(),
+        examples=(),
+        exclude=(),
+        plugin_name: str | None = None,
+    ):
+        self.name = name
+        self.function_name = function_name
+        self.plugin_name = plugin_name
+        self.template = template
+        self.patterns = [re.compile(p, re.IGNORECASE) for p in patterns]
+        self.exclude = [re.compile(p, re.IGNORECASE) for p in exclude]
+        self.examples = [_vectorize(e) for e in examples]
+        # 例文に出てくる語 (日本語は文字) だけで書かれた質問しか、例文との類似度では答えない
+        self.vocabulary = {token for e in examples for token in _tokens(e)}
+
+    def render(self, result) -> str:
+        if callable(self.template):
+            return self.template(result)
+        return self.template.format(result=result)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[\s\?？!！。、,.]+", " ", text.lower()).strip()
+
+
+# 語彙になくても意味を変えない語
+_STOPWORDS = {"a", "an", "the", "is", "are", "it", "me", "my", "i", "do", "please", "now", "です", "か"}
+_TOKEN = re.compile(r"[a-z0-9']+|[^\x00-\x7f]")
+
+
+def _tokens(text: str) -> list[str]:
+    """English words and single non-ASCII characters of the normalized text."""
+    return _TOKEN.findall(_normalize(text))
+
+
+def _vectorize(text: str) -> Counter:
+    """Character bigrams, which work for both English and Japanese input."""
+    text = f" {_normalize(text)} "
+    return Counter(text[i : i + 2] for i in range(len(text) - 1))
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    if not dot:
+        return 0.0
+    return dot / (sqrt(sum(v * v for v in a.values())) * sqrt(sum(v * v for v in b.values())))
+
+
+def _render_lights(lights) -> str:
+    lines = [f"- {light['name']} (id {light['id']}): {'on' if light['is_on'] else 'off'}" for light in lights]
+    return "Here are the lights:\n" + "\n".join(lines)
+
+
+def default_rules() -> list[IntentRule]:
+    """
+    Rules for the plugins in plugin.py and the MenuPlugin samples.
+    Rules whose function is not registered in the kernel are ignored.
+    """
+    return [
+        IntentRule(
+            name="current_time",
+            function_name="get_current_time",
+            template="It is {result}.",
+            patterns=[r"^what time is it( now)?$", r"^what'?s the (current )?time( now)?$", r"^(今|いま)何時(ですか)?$"],
+            examples=["what time is it", "tell me the time", "current time please", "今の時間は", "何時ですか"],
+            # "what day is it" は例文に近いが、時刻ではなく日付・曜日の質問
+            exclude=[r"\b(in|at)\s+\w+", r"(で|の)(今|いま)?何時", r"\b(day|date|month|year)\b", r"何日|曜日|日付"],
+        ),
+        IntentRule(
+            name="list_lights",
+            function_name="get_lights",
+            template=_render_lights,
+            patterns=[r"^(list|show)( me)?( all)?( the)? lights( please)?$", r"^ライト(の)?一覧"],
+            examples=["list the lights", "which lights are on", "show me the lights", "what lights do I have"],
+            exclude=[r"\bturn\b", r"\bswitch\b", r"\bchange\b", r"\bset\b", r"つけ", r"消"],
+        ),
+        IntentRule(
+            name="menu_specials",
+            function_name="get_specials",
+            template=lambda result: "Today's specials are:\n" + "\n".join(
+                line.strip() for line in str(result).strip().splitlines()
+            ),
+            patterns=[r"^what are (the |today'?s )?specials( today)?$", r"^(今日の)?スペシャル(メニュー)?は"],
+            examples=["what are the specials", "what's special today", "today's specials", "any specials"],
+            exclude=[r"\bprice\b", r"\bcost\b", r"\bhow much\b", r"値段", r"いくら"],
+        ),
+    ]
+
+
+class IntentRouter:
+    """
+    Answers trivial intents without the LLM and keeps bypass statistics.
+
+    Use `try_answer()` before invoking the agent; when it returns None, invoke
+    the agent as usual and pass its latency to `record_fallthrough()`.
+    """
+
+    def __init__(self, kernel: Kernel, rules: list[IntentRule] | None = None, threshold: float = 0.9, margin: float = 0.1):
+        self.kernel = kernel
+        self.threshold = threshold
+        self.margin = margin
+        self.rules = []
+        self._functions = {}
+        for rule in rules if rules is not None else default_rules():
+            function = self._find_function(rule)
+            if function is not None:
+                self.rules.append(rule)
+                self._functions[rule.name] = function
+        self.stats = {
+            "total": 0,
+            "bypassed": 0,
+            "fast_path_seconds": 0.0,
+            "agent_calls": 0,
+            "agent_seconds": 0.0,
+            "by_intent": Counter(),
+        }
+
+    def _find_function(self, rule: IntentRule):
+        for plugin_name, plugin in self.kernel.plugins.items():
+            if rule.plugin_name and plugin_name != rule.plugin_name:
+                continue
+            if rule.function_name in plugin.functions:
+                return plugin.functions[rule.function_name]
+        return None
+
+    def classify(self, text: str) -> tuple[IntentRule | None, float]:
+        """
+        Returns the best matching rule and its confidence.
+        Pattern matches are certain; otherwise the nearest example decides, but only
+        when every content word of the text appears in that rule's examples
+        ("tell me the timeline of WW2" is close to "tell me the time" but isn't about it).
+        """
+        normalized = _normalize(text)
+        candidates = [rule for rule in self.rules if not any(p.search(normalized) for p in rule.exclude)]
+        for rule in candidates:
+            if any(p.search(normalized) for p in rule.patterns):
+                return rule, 1.0
+
+        vector = _vectorize(text)
+        tokens = [token for token in _tokens(text) if token not in _STOPWORDS]
+        scores = sorted(
+            (
+                (max((_cosine(vector, e) for e in rule.examples), default=0.0), rule)
+                for rule in candidates
+                if all(token in rule.vocabulary for token in tokens)
+            ),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        if not scores:
+            return None, 0.0
+        best_score, best_rule = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        if best_score >= self.threshold and best_score - runner_up >= self.margin:
+            return best_rule, best_score
+        return None, best_score
+
+    async def try_answer(self, text: str) -> str | None:
+        """
+        Returns a templated answer for a high-confidence intent, or None.
+        """
+        self.stats["total"] += 1
+        started = time.perf_counter()
+        rule, _ = self.classify(text)
+        if rule is None:
+            return None
+        try:
+            result = await self.kernel.invoke(self._functions[rule.name])
+            answer = rule.render(result.value if result else None)
+        except Exception as e:
+            print(f"Fast path for '{rule.name}' failed, falling through to the agent: {e}")
+            return None
+        self.stats["bypassed"] += 1
+        self.stats["by_intent"][rule.name] += 1
+        self.stats["fast_path_seconds"] += time.perf_counter() - started
+        return answer
+
+    def record_fallthrough(self, seconds: float):
+        """
+        Records how long the agent took for a question the router did not answer.
+        """
+        self.stats["agent_calls"] += 1
+        self.stats["agent_seconds"] += seconds
+
+    def report(self) -> dict:
+        """
+        Returns the bypass rate and the estimated latency saved.
+        The saving is estimated from the mean agent latency seen on fallthroughs.
+        """
+        stats = self.stats
+        bypassed = stats["bypassed"]
+        fast_mean = stats["fast_path_seconds"] / bypassed if bypassed else 0.0
+        agent_mean = stats["agent_seconds"] / stats["agent_calls"] if stats["agent_calls"] else None
+        return {
+            "total": stats["total"],
+            "bypassed": bypassed,
+            "bypass_rate": bypassed / stats["total"] if stats["total"] else 0.0,
+            "by_intent": dict(stats["by_intent"]),
+            "fast_path_mean_ms": fast_mean * 1000,
+            "agent_mean_ms": agent_mean * 1000 if agent_mean is not None else None,
+            "estimated_saved_ms": (agent_mean - fast_mean) * bypassed * 1000 if agent_mean is not None else None,
+        }
+
+    def format_report(self) -> str:
+        r = self.report()
+        saved = f"{r['estimated_saved_ms']:.0f} ms" if r["estimated_saved_ms"] is not None else "n/a"
+        return (
+            f"Fast path: {r['bypassed']}/{r['total']} bypassed ({r['bypass_rate']:.0%}), "
+            f"fast path mean {r['fast_path_mean_ms']:.1f} ms, estimated latency saved {saved}, "
+            f"by intent {r['by_intent']}"
+        )
+
+
+class TestIntentRouter(unittest.TestCase):
+    def make_router(self, specials: bool = False):
+        from semantic_kernel.functions import kernel_function
+
+        class FakePlugin:
+            calls = 0
+
+            @kernel_function(name="get_current_time")
+            def get_current_time(self) -> str:
+                FakePlugin.calls += 1
+                return "2025-05-09 12:00:00"
+
+            @kernel_function(name="get_lights")
+            def get_lights(self) -> list:
+                FakePlugin.calls += 1
+                return [{"id": 1, "name": "Table Lamp", "is_on": True}]
+
+        class FakeMenuPlugin:
+            @kernel_function(name="get_specials")
+            def get_specials(self) -> str:
+                return "Special Soup: Clam Chowder"
+
+        kernel = Kernel()
+        kernel.add_plugin(FakePlugin(), "fake")
+        if specials:
+            kernel.add_plugin(FakeMenuPlugin(), "menu")
+        return IntentRouter(kernel), FakePlugin
+
+    def test_classify(self):
+        router, _ = self.make_router()
+        # get_specials が登録されていなければ、そのルールは使われない
+        self.assertEqual([rule.name for rule in router.rules], ["current_time", "list_lights"])
+        router, _ = self.make_router(specials=True)
+        self.assertEqual([rule.name for rule in router.rules], ["current_time", "list_lights", "menu_specials"])
+        for text, intent in [
+            ("What time is it?", "current_time"),
+            ("今何時？", "current_time"),
+            ("tell me the time", "current_time"),
+            ("show me the lights", "list_lights"),
+            ("which lights are on", "list_lights"),
+            ("what time is it in Tokyo", None),
+            ("turn on the table lamp", None),
+            ("what is the weather", None),
+            # 日付・曜日の質問を時刻で答えない
+            ("what day is it", None),
+            ("what date is it", None),
+            ("今日は何曜日？", None),
+            ("what are the specials", "menu_specials"),
+            ("today's specials", "menu_specials"),
+            # 例文に似ていても、例文にない語を含む質問はエージェントに任せる
+            ("tell me the timeline of WW2", None),
+            ("tell me a time travel story", None),
+            ("what time is sunset", None),
+            ("what are the specials tomorrow", None),
+            ("are there any specials that are vegan", None),
+            ("list the lights in the kitchen", None),
+        ]:
+            rule, _ = router.classify(text)
+            self.assertEqual(rule.name if rule else None, intent, text)
+
+    def test_answers_and_falls_through(self):
+        router, plugin = self.make_router()
+
+        async def run():
+            return [await router.try_answer(text) for text in ("what time is it", "list the lights", "what day is it")]
+
+        answers = asyncio.run(run())
+        self.assertEqual(answers[0], "It is 2025-05-09 12:00:00.")
+        self.assertIn("Table Lamp (id 1): on", answers[1])
+        self.assertIsNone(answers[2])
+        self.assertEqual(plugin.calls, 2)
+        router.record_fallthrough(0.5)
+        report = router.report()
+        self.assertEqual((report["total"], report["bypassed"]), (3, 2))
+        self.assertEqual(report["by_intent"], {"current_time": 1, "list_lights": 1})
+        self.assertGreater(report["estimated_saved_ms"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
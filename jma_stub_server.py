@@ -0,0 +1,166 @@
+# 気象庁 (www.jma.go.jp) のローカル代替サーバー
+#
+# 記録済みの area.json と forecast/*.json を返す小さな HTTP サーバーです。
+# WeatherPlugin のテストやベンチマークをオフラインで実行するために使います。
+#
+#   python jma_stub_server.py --port 8765 --latency 0.05 --failure-rate 0.01
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+
+from aiohttp import web
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_AREA_FILE = os.path.join(base_dir, "area_codes.json")
+DEFAULT_FORECAST_DIR = os.path.join(base_dir, "fixtures", "jma", "forecast")
+
+AREA_PATH = "/bosai/common/const/area.json"
+FORECAST_PATH = "/bosai/forecast/data/forecast/"
+
+
+class JMAStubServer:
+    """
+    A local stand-in for the JMA endpoints used by WeatherPlugin.
+
+    Fixtures are read once at start-up and served from memory, so the server
+    itself adds as little overhead as possible to the measured numbers.
+    """
+
+    def __init__(
+        self,
+        area_file: str = DEFAULT_AREA_FILE,
+        forecast_dir: str = DEFAULT_FORECAST_DIR,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        etag: bool = True,
+        seed: int | None = None,
+    ):
+        self.area_file = area_file
+        self.forecast_dir = forecast_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.etag = etag
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "failures": 0, "not_modified": 0, "not_found": 0}
+        self.base_url = None
+        self._fixtures = {}
+        self._runner = None
+
+    @property
+    def area_codes_url(self) -> str:
+        return f"{self.base_url}{AREA_PATH}"
+
+    @property
+    def forecast_base_url(self) -> str:
+        return f"{self.base_url}{FORECAST_PATH}"
+
+    def load_fixtures(self):
+        """
+        Loads area.json and every forecast fixture into memory.
+        """
+        fixtures = {}
+        with open(self.area_file, "rb") as f:
+            fixtures[AREA_PATH] = f.read()
+        if os.path.isdir(self.forecast_dir):
+            for file_name in sorted(os.listdir(self.forecast_dir)):
+                if file_name.endswith(".json"):
+                    with open(os.path.join(self.forecast_dir, file_name), "rb") as f:
+                        fixtures[FORECAST_PATH + file_name] = f.read()
+        self._fixtures = {
+            path: (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+            for path, body in fixtures.items()
+        }
+
+    def make_app(self) -> web.Application:
+        if not self._fixtures:
+            self.load_fixtures()
+        app = web.Application()
+        app.router.add_get(AREA_PATH, self.handle)
+        app.router.add_get(FORECAST_PATH + "{code}.json", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.stats["failures"] += 1
+            return web.Response(status=503, text="Service Unavailable (stub)")
+
+        fixture = self._fixtures.get(request.path)
+        if fixture is None:
+            self.stats["not_found"] += 1
+            return web.Response(status=404, text="Not Found")
+        body, etag = fixture
+
+        headers = {}
+        if self.etag:
+            headers["ETag"] = etag
+            if request.headers.get("If-None-Match") == etag:
+                self.stats["not_modified"] += 1
+                return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", charset="utf-8", headers=headers)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Starts the server in the running event loop and returns its base URL.
+        Port 0 picks a free port.
+        """
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="気象庁APIのローカル代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--area-file", default=DEFAULT_AREA_FILE)
+    parser.add_argument("--forecast-dir", default=DEFAULT_FORECAST_DIR)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答遅延 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延に加える揺らぎの最大値 (秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="503を返す割合 (0.0〜1.0)")
+    parser.add_argument("--no-etag", action="store_true", help="ETag / If-None-Match を無効化")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = JMAStubServer(
+        area_file=args.area_file,
+        forecast_dir=args.forecast_dir,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        etag=not args.no_etag,
+        seed=args.seed,
+    )
+    print(f"JMA stub: http://{args.host}:{args.port}{AREA_PATH}")
+    web.run_app(server.make_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
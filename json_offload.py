@@ -0,0 +1,206 @@
+# イベントループ外での JSON デコード / エンコード
+#
+# 小さなペイロードはその場で処理し、しきい値を超える大きなペイロードだけを
+# スレッドプールまたはプロセスプールに逃がします。
+# WeatherPlugin、webapp_chat、GitHubMCPClient から共通で使います。
+#
+# 設定は環境変数でも変更できます:
+#   JSON_OFFLOAD_MODE       thread | process | inline (既定: thread)
+#   JSON_OFFLOAD_THRESHOLD  オフロードするサイズ (UTF-8 のバイト数, 既定: 65536)
+#
+# str は文字数ではなく UTF-8 のバイト数で比べます (日本語は1文字3バイト)。
+
+import asyncio
+import json
+import os
+import unittest
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+DEFAULT_THRESHOLD = 64 * 1024
+MODES = ("thread", "process", "inline")
+
+mode = os.environ.get("JSON_OFFLOAD_MODE", "thread")
+threshold = int(os.environ.get("JSON_OFFLOAD_THRESHOLD", DEFAULT_THRESHOLD))
+
+_process_pool: ProcessPoolExecutor | None = None
+
+
+def configure(new_mode: str | None = None, new_threshold: int | None = None):
+    """
+    Changes the offload mode and/or the size threshold for the whole process.
+    """
+    global mode, threshold
+    if new_mode is not None:
+        if new_mode not in MODES:
+            raise ValueError(f"Unknown JSON offload mode: {new_mode}")
+        mode = new_mode
+    if new_threshold is not None:
+        threshold = new_threshold
+
+
+def shutdown():
+    """
+    Shuts down the process pool if it was started.
+    """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
+
+
+def _get_executor() -> Executor | None:
+    global _process_pool
+    if mode == "process":
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=max(1, min(4, (os.cpu_count() or 1) - 1)))
+        return _process_pool
+    # None は asyncio のデフォルト ThreadPoolExecutor
+    return None
+
+
+def _utf8_size(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def estimate_size(obj, limit: int) -> int:
+    """
+    Roughly estimates the encoded size of `obj`.
+
+    The walk stops as soon as the estimate exceeds `limit`, so the cost is
+    bounded by the threshold rather than by the size of the object.
+    """
+    size = 0
+    stack = [obj]
+    while stack and size <= limit:
+        item = stack.pop()
+        if isinstance(item, str):
+            size += _utf8_size(item) + 2
+        elif isinstance(item, dict):
+            size += 2
+            for key, value in item.items():
+                size += _utf8_size(str(key)) + 4
+                stack.append(value)
+        elif isinstance(item, (list, tuple)):
+            size += 2
+            stack.extend(item)
+        elif isinstance(item, (bytes, bytearray)):
+            size += len(item)
+        else:
+            size += 8
+    return size
+
+
+async def _run(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), func, *args)
+
+
+def _is_small(data: str | bytes | bytearray) -> bool:
+    if not isinstance(data, str) or len(data) >= threshold:
+        return len(data) < threshold
+    # UTF-8 は1文字最大4バイト。境目のときだけ実際に数える (長さはしきい値未満なので安い)
+    return len(data) * 4 < threshold or _utf8_size(data) < threshold
+
+
+async def loads(data: str | bytes | bytearray):
+    """
+    Decodes a JSON document, off the event loop when it is large.
+    """
+    if mode == "inline" or _is_small(data):
+        return json.loads(data)
+    return await _run(json.loads, data)
+
+
+def _dumps(obj, kwargs):
+    return json.dumps(obj, **kwargs)
+
+
+async def dumps(obj, size_hint: int | None = None, **kwargs) -> str:
+    """
+    Encodes `obj` as JSON, off the event loop when it is large.
+
+    Args:
+        obj: The object to encode.
+        size_hint: Expected encoded size in bytes; estimated when omitted.
+        **kwargs: Passed through to json.dumps.
+    """
+    if size_hint is None:
+        size_hint = estimate_size(obj, threshold)
+    if mode == "inline" or size_hint < threshold:
+        return json.dumps(obj, **kwargs)
+    return await _run(_dumps, obj, kwargs)
+
+
+def _load_file(path, encoding):
+    with open(path, "r", encoding=encoding) as f:
+        return json.load(f)
+
+
+async def load_file(path: str, encoding: str = "utf-8"):
+    """
+    Reads and decodes a JSON file without blocking the event loop.
+    """
+    if mode == "inline":
+        return _load_file(path, encoding)
+    # ファイルI/Oを含むので、サイズに関係なくスレッドで実行する
+    if mode == "process" and os.path.getsize(path) >= threshold:
+        return await _run(_load_file, path, encoding)
+    return await asyncio.to_thread(_load_file, path, encoding)
+
+
+def _dump_file(path, obj, encoding, kwargs):
+    with open(path, "w", encoding=encoding) as f:
+        json.dump(obj, f, **kwargs)
+
+
+async def dump_file(path: str, obj, encoding: str = "utf-8", **kwargs):
+    """
+    Encodes `obj` and writes it to `path` without blocking the event loop.
+    """
+    if mode == "inline":
+        _dump_file(path, obj, encoding, kwargs)
+        return
+    await asyncio.to_thread(_dump_file, path, obj, encoding, kwargs)
+
+
+class TestJsonOffload(unittest.TestCase):
+    def setUp(self):
+        self.saved = (mode, threshold)
+        configure(new_mode="thread", new_threshold=1000)
+
+    def tearDown(self):
+        configure(*self.saved)
+
+    def run_counting_offloads(self, coro_factory):
+        from unittest import mock
+
+        with mock.patch(f"{__name__}._run", wraps=_run) as run:
+            result = asyncio.run(coro_factory())
+        return result, run.call_count
+
+    def test_inline_and_offloaded(self):
+        small = {"items": ["a"] * 10}
+        large = {"items": ["a" * 100] * 20}
+        for obj, offloads in ((small, 0), (large, 1)):
+            text = json.dumps(obj)
+            self.assertEqual(self.run_counting_offloads(lambda: loads(text)), (obj, offloads))
+            self.assertEqual(self.run_counting_offloads(lambda: loads(text.encode())), (obj, offloads))
+            self.assertEqual(self.run_counting_offloads(lambda: dumps(obj)), (text, offloads))
+
+    def test_threshold_counts_utf8_bytes(self):
+        # 400 文字だが UTF-8 では 1200 バイトを超える
+        obj = {"text": "東京地方" * 100}
+        text = json.dumps(obj, ensure_ascii=False)
+        self.assertLess(len(text), 1000)
+        self.assertGreaterEqual(len(text.encode("utf-8")), 1000)
+        self.assertEqual(self.run_counting_offloads(lambda: loads(text)), (obj, 1))
+        self.assertEqual(self.run_counting_offloads(lambda: dumps(obj, ensure_ascii=False)), (text, 1))
+
+    def test_inline_mode_never_offloads(self):
+        configure(new_mode="inline")
+        obj = {"items": ["a" * 100] * 20}
+        self.assertEqual(self.run_counting_offloads(lambda: loads(json.dumps(obj))), (obj, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
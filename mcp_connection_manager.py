@@ -0,0 +1,339 @@
+# 複数の MCP サーバーへの並列接続とヘルスチェック
+#
+# エージェントは GitHub (stdio) やローカルの SSE サーバー (localhost:11111/sse) など
+# 複数の MCP サーバーを使いますが、サンプルでは await plugin.connect() を1つずつ待っています。
+# MCPConnectionManager は全サーバーにサーバーごとのタイムアウト付きで同時に接続し、
+# つながらないサーバーは除いて動き続け、バックグラウンドで ping による確認と再接続を行います。
+#
+#   manager = MCPConnectionManager([github_plugin, sse_plugin], timeouts={"github": 30})
+#   await manager.connect_all()
+#   manager.add_to_kernel(kernel)      # つながったサーバーのツールだけを登録する
+#   manager.start_health_checks()
+#   print(manager.format_report())
+#   ...
+#   await manager.close()
+
+import asyncio
+import logging
+import time
+import unittest
+from contextlib import AsyncExitStack
+
+from semantic_kernel import Kernel
+from semantic_kernel.connectors.mcp import MCPPluginBase
+
+logger = logging.getLogger(__name__)
+
+# 接続をタイムアウトで止めるために使う MCPPluginBase の内部属性 (semantic-kernel 1.28 以降で確認)。
+# どれかがなければ公開の connect() / close() だけを使う
+PRIVATE_CONNECT_ATTRIBUTES = ("_inner_connect", "_exit_stack", "_current_task", "_stop_event")
+
+
+def uses_private_connect(plugin: MCPPluginBase) -> bool:
+    return all(hasattr(plugin, name) for name in PRIVATE_CONNECT_ATTRIBUTES)
+
+
+class ServerStatus:
+    """Connection state and timings of one MCP server."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "disconnected"
+        self.connect_ms = None
+        self.ping_ms = None
+        self.last_error = None
+        self.connects = 0
+        self.failures = 0
+        self.next_retry = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "connect_ms": self.connect_ms,
+            "ping_ms": self.ping_ms,
+            "connects": self.connects,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class MCPConnectionManager:
+    """
+    Connects MCP plugins concurrently and keeps them connected.
+
+    Args:
+        plugins: MCPStdioPlugin / MCPSsePlugin (or any MCPPluginBase) instances.
+        connect_timeout: Default seconds allowed for one connect.
+        timeouts: Per-plugin connect timeouts, keyed by plugin name.
+        health_interval: Seconds between health checks.
+        ping_timeout: Seconds allowed for one ping.
+        max_backoff: Upper bound of the reconnect backoff in seconds.
+    """
+
+    def __init__(
+        self,
+        plugins: list[MCPPluginBase],
+        connect_timeout: float = 15.0,
+        timeouts: dict[str, float] | None = None,
+        health_interval: float = 30.0,
+        ping_timeout: float = 5.0,
+        max_backoff: float = 300.0,
+    ):
+        self.plugins = {plugin.name: plugin for plugin in plugins}
+        self.connect_timeout = connect_timeout
+        self.timeouts = timeouts or {}
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.max_backoff = max_backoff
+        self.status = {name: ServerStatus(name) for name in self.plugins}
+        self.kernel = None
+        self._health_task = None
+
+    async def connect_all(self) -> dict[str, ServerStatus]:
+        """Connects every server at once; one slow or broken server doesn't block the others."""
+        await asyncio.gather(*(self._connect(name) for name in self.plugins))
+        return self.status
+
+    async def _connect(self, name: str) -> bool:
+        plugin = self.plugins[name]
+        status = self.status[name]
+        status.state = "connecting"
+        started = time.perf_counter()
+        try:
+            await self._connect_plugin(plugin, self.timeouts.get(name, self.connect_timeout))
+        except Exception as e:
+            await self._abort(plugin)
+            self._mark_failed(status, e)
+            return False
+        status.connect_ms = round((time.perf_counter() - started) * 1000, 1)
+        status.state = "connected"
+        status.connects += 1
+        status.last_error = None
+        status.failures = 0
+        if self.kernel is not None:
+            self.kernel.add_plugin(plugin)
+        return True
+
+    async def _connect_plugin(self, plugin: MCPPluginBase, timeout: float):
+        if not uses_private_connect(plugin):
+            await asyncio.wait_for(plugin.connect(), timeout=timeout)
+            return
+        inner_connect = plugin._inner_connect
+        # MCPPluginBase.connect() と同じ流れだが、タイムアウトで止めたときに
+        # 開きかけの接続を (anyio の制約どおり) 接続したタスクの中で閉じられるようにする
+        ready = asyncio.Event()
+
+        async def run():
+            try:
+                await inner_connect(ready)
+            except asyncio.CancelledError:
+                await plugin._exit_stack.aclose()
+                raise
+
+        task = asyncio.create_task(run())
+        plugin._current_task = task
+        ready_wait = asyncio.create_task(ready.wait())
+        done, _ = await asyncio.wait([task, ready_wait], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        ready_wait.cancel()
+        if not done:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise TimeoutError(f"connect timed out after {timeout}s")
+        if task.done():
+            # 接続に失敗すると ready を立てた直後にタスクが例外で終わる
+            raise task.exception() or ConnectionError("connection closed during connect")
+
+    def _mark_failed(self, status: ServerStatus, error: Exception):
+        status.state = "failed"
+        status.last_error = f"{type(error).__name__}: {error}"
+        status.failures += 1
+        # 連続して失敗するほど再接続の間隔を延ばす
+        status.next_retry = time.monotonic() + min(self.health_interval * 2 ** (status.failures - 1), self.max_backoff)
+        logger.warning("MCP server '%s' is unavailable: %s", status.name, status.last_error)
+        if self.kernel is not None:
+            # つながらないサーバーのツールをモデルに見せない
+            self.kernel.plugins.pop(status.name, None)
+
+    async def _abort(self, plugin: MCPPluginBase):
+        if not uses_private_connect(plugin):
+            try:
+                await asyncio.wait_for(plugin.close(), timeout=self.ping_timeout)
+            except Exception as e:
+                logger.warning("Closing MCP server '%s' failed: %s", plugin.name, e)
+            plugin.session = None
+            return
+        # 接続タスクが残っていれば止め、次の connect() のために状態を戻す
+        task = plugin._current_task
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        plugin._current_task = None
+        plugin._stop_event = None
+        plugin._exit_stack = AsyncExitStack()
+        plugin.session = None
+
+    def add_to_kernel(self, kernel: Kernel):
+        """Adds the connected plugins; reconnected ones are added later automatically."""
+        self.kernel = kernel
+        for name, plugin in self.plugins.items():
+            if self.status[name].state == "connected":
+                kernel.add_plugin(plugin)
+
+    def connected(self) -> list[MCPPluginBase]:
+        return [self.plugins[name] for name, status in self.status.items() if status.state == "connected"]
+
+    async def check_all(self):
+        """Pings connected servers and reconnects failed ones whose backoff has passed."""
+        await asyncio.gather(*(self._check(name) for name in self.plugins))
+
+    async def _check(self, name: str):
+        plugin = self.plugins[name]
+        status = self.status[name]
+        if status.state == "connected":
+            started = time.perf_counter()
+            try:
+                if plugin.session is None:
+                    raise ConnectionError("session closed")
+                await asyncio.wait_for(plugin.session.send_ping(), timeout=self.ping_timeout)
+                status.ping_ms = round((time.perf_counter() - started) * 1000, 1)
+                return
+            except Exception as e:
+                await self._close_quietly(plugin)
+                self._mark_failed(status, e)
+                # すぐに1回だけ再接続を試みる
+                status.next_retry = 0.0
+        if status.state == "failed" and time.monotonic() >= status.next_retry:
+            await self._connect(name)
+
+    async def _close_quietly(self, plugin: MCPPluginBase):
+        try:
+            await asyncio.wait_for(plugin.close(), timeout=self.ping_timeout)
+        except Exception:
+            await self._abort(plugin)
+
+    def start_health_checks(self):
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.exception("MCP health check failed", exc_info=e)
+
+    def report(self) -> dict:
+        return {name: status.as_dict() for name, status in self.status.items()}
+
+    def format_report(self) -> str:
+        lines = []
+        for name, status in self.status.items():
+            latency = f"{status.connect_ms:.0f} ms" if status.connect_ms is not None else "-"
+            error = f" ({status.last_error})" if status.state != "connected" and status.last_error else ""
+            lines.append(f"{name}: {status.state}, connect {latency}{error}")
+        return "\n".join(lines)
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        await asyncio.gather(
+            *(self._close_quietly(plugin) for plugin in self.plugins.values() if plugin.session is not None)
+        )
+        for status in self.status.values():
+            status.state = "disconnected"
+
+    async def __aenter__(self):
+        await self.connect_all()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class TestMCPConnectionManager(unittest.TestCase):
+    SERVER = (
+        "from mcp.server.fastmcp import FastMCP\n"
+        "mcp = FastMCP('calc')\n"
+        "@mcp.tool()\n"
+        "def add(a: int, b: int) -> int:\n"
+        "    '''Adds two numbers.'''\n"
+        "    return a + b\n"
+        "mcp.run()\n"
+    )
+
+    def test_degrades_and_reconnects(self):
+        import sys
+
+        from semantic_kernel.connectors.mcp import MCPSsePlugin, MCPStdioPlugin
+
+        async def run():
+            plugins = [
+                MCPStdioPlugin(name="calc", command=sys.executable, args=["-c", self.SERVER], load_prompts=False),
+                # 何も待ち受けていないポート
+                MCPSsePlugin(name="down", url="http://127.0.0.1:9/sse"),
+                # 応答しないサーバー
+                MCPStdioPlugin(name="hung", command=sys.executable, args=["-c", "import time; time.sleep(60)"]),
+            ]
+            manager = MCPConnectionManager(plugins, connect_timeout=10, timeouts={"hung": 1})
+            started = time.perf_counter()
+            await manager.connect_all()
+            elapsed = time.perf_counter() - started
+            kernel = Kernel()
+            manager.add_to_kernel(kernel)
+            states = {name: status.state for name, status in manager.status.items()}
+            kernel_plugins = sorted(kernel.plugins)
+
+            # 接続が切れたら次のチェックで再接続する
+            await plugins[0].close()
+            await manager.check_all()
+            result = await kernel.invoke(plugin_name="calc", function_name="add", a=1, b=2)
+            report = manager.report()
+            await manager.close()
+            return elapsed, states, kernel_plugins, str(result.value[0]), report
+
+        elapsed, states, kernel_plugins, value, report = asyncio.run(run())
+        self.assertEqual(states, {"calc": "connected", "down": "failed", "hung": "failed"})
+        self.assertLess(elapsed, 8)
+        self.assertEqual(kernel_plugins, ["calc"])
+        self.assertEqual(value, "3")
+        self.assertEqual(report["calc"]["connects"], 2)
+        self.assertIn("Timeout", report["hung"]["last_error"])
+
+    def test_public_connect_without_private_attributes(self):
+        class PublicOnlyPlugin:
+            """Has only the public connect()/close(), like a future MCPPluginBase might."""
+
+            def __init__(self, name, hang=False):
+                self.name = name
+                self.hang = hang
+                self.session = None
+                self.closes = 0
+
+            async def connect(self):
+                if self.hang:
+                    await asyncio.sleep(60)
+                self.session = object()
+
+            async def close(self):
+                self.closes += 1
+                self.session = None
+
+        async def run():
+            plugins = [PublicOnlyPlugin("ok"), PublicOnlyPlugin("hung", hang=True)]
+            manager = MCPConnectionManager(plugins, connect_timeout=0.2)
+            await manager.connect_all()
+            states = {name: status.state for name, status in manager.status.items()}
+            await manager.close()
+            return states, [plugin.closes for plugin in plugins]
+
+        self.assertFalse(uses_private_connect(PublicOnlyPlugin("x")))
+        states, closes = asyncio.run(run())
+        self.assertEqual(states, {"ok": "connected", "hung": "failed"})
+        # タイムアウトした接続は close() で片付け、接続できたものは close() で閉じる
+        self.assertEqual(closes, [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
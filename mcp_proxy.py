@@ -1,32 +1,97 @@
-import sys
+import argparse
+import asyncio
+import errno
+import json
 import os
+import shlex
+import socket
+import stat
 import subprocess
+import sys
 import threading
-import time
+import unittest
 from datetime import datetime
 
+from mcp_proxy_cache import CachingInterceptor, ResponseCache
+from mcp_proxy_log import JsonLinesLogSink
+from mcp_proxy_mux import serve as serve_mux
+from mcp_proxy_pool import DEFAULT_PROTOCOL_VERSION, WarmPool, server_argv, server_env
+from mcp_proxy_replay import ReplayServer, SessionRecorder
+from mcp_proxy_stats import JsonRpcLatencyTracker, start_stats_server
+
+# 既定で起動する MCP サーバー
+DEFAULT_SERVER_COMMAND = "npx --yes @modelcontextprotocol/server-github"
+
 # ログファイルパス
 log_dir = os.path.dirname(os.path.abspath(__file__))
 stdin_log_path = os.path.join(log_dir, "stdin_log.txt")
 stdout_log_path = os.path.join(log_dir, "stdout_log.txt")
 
-# 入出力の記録ファイル
-in_log = open(stdin_log_path, "w", encoding="utf-8")
-out_log = open(stdout_log_path, "w", encoding="utf-8")
-
-print(f"ログファイル: {stdin_log_path}, {stdout_log_path}", file=sys.stderr)
+# 1回の read / splice で転送する最大バイト数
+CHUNK_SIZE = 256 * 1024
 
-# 起動時刻をログに記録
-timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-in_log.write(f"[{timestamp}] プロキシ起動\n")
-in_log.flush()
-out_log.write(f"[{timestamp}] プロキシ起動\n")
-out_log.flush()
+# 入出力の記録ファイル (open_logs() で開く)
+in_log = None
+out_log = None
 
 # マルチスレッド実行のためのロック
 in_lock = threading.Lock()
 out_lock = threading.Lock()
 
+
+def open_logs(directory=None):
+    """ログファイルを開き、起動時刻を記録する"""
+    global in_log, out_log, stdin_log_path, stdout_log_path
+    if directory:
+        stdin_log_path = os.path.join(directory, "stdin_log.txt")
+        stdout_log_path = os.path.join(directory, "stdout_log.txt")
+    in_log = open(stdin_log_path, "w", encoding="utf-8")
+    out_log = open(stdout_log_path, "w", encoding="utf-8")
+
+    print(f"ログファイル: {stdin_log_path}, {stdout_log_path}", file=sys.stderr)
+
+    # 起動時刻をログに記録
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    in_log.write(f"[{timestamp}] プロキシ起動\n")
+    in_log.flush()
+    out_log.write(f"[{timestamp}] プロキシ起動\n")
+    out_log.flush()
+
+
+def log_environment(cmd):
+    # 環境変数をログに記録
+    in_log.write("環境変数:\n")
+    for key, value in os.environ.items():
+        if key in ["PATH", "GITHUB_TOKEN"]:
+            value_to_show = "***" if key == "GITHUB_TOKEN" else value[:20] + "..."
+            in_log.write(f"  {key}={value_to_show}\n")
+    in_log.write(f"実行コマンド: {cmd}\n")
+    in_log.flush()
+
+
+def start_server(cmd):
+    """実際のMCPサーバーをサブプロセスとして起動"""
+    # シェルを介さずに起動する (shell=True だとシェルのプロセスが1つ余分に挟まる)
+    process = subprocess.Popen(
+        server_argv(cmd),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=server_env(),
+    )
+    if in_log:
+        in_log.write(f"プロセスID: {process.pid}\n")
+        in_log.flush()
+    return process
+
+
+# ---------------------------------------------------------------------------
+# スレッド版 (従来の実装)
+#
+# 1行ずつ読み、行ごとにデコードしてログに書き、書き込みのたびに flush します。
+# asyncio が使えない環境 (Windows のパイプなど) と、ベンチマークの比較対象として残しています。
+# ---------------------------------------------------------------------------
+
 def log_message(log_file, lock, prefix, message):
     """スレッドセーフにログを記録"""
     with lock:
@@ -38,14 +103,14 @@ def log_message(log_file, lock, prefix, message):
 def stdin_to_server(process):
     try:
         log_message(in_log, in_lock, "INFO", "標準入力転送開始\n")
-        
+
         # バイナリモードでないと正しく動作しない可能性がある
         for line in sys.stdin.buffer:
             try:
                 # データをログ
                 decoded = line.decode("utf-8", errors="replace")
                 log_message(in_log, in_lock, "TO_SERVER", decoded)
-                
+
                 # データを転送
                 process.stdin.write(line)
                 process.stdin.flush()
@@ -56,18 +121,23 @@ def stdin_to_server(process):
         log_message(in_log, in_lock, "ERROR", f"標準入力転送スレッドエラー: {e}\n")
     finally:
         log_message(in_log, in_lock, "INFO", "標準入力転送終了\n")
+        # サーバーに入力の終わりを伝える
+        try:
+            process.stdin.close()
+        except Exception:
+            pass
 
 # MCPサーバーから標準出力へデータを転送
 def server_to_stdout(process):
     try:
         log_message(out_log, out_lock, "INFO", "標準出力転送開始\n")
-        
+
         for line in process.stdout:
             try:
                 # データをログ
                 decoded = line.decode("utf-8", errors="replace")
                 log_message(out_log, out_lock, "FROM_SERVER", decoded)
-                
+
                 # データを転送
                 sys.stdout.buffer.write(line)
                 sys.stdout.buffer.flush()
@@ -83,13 +153,13 @@ def server_to_stdout(process):
 def server_to_stderr(process):
     try:
         log_message(out_log, out_lock, "INFO", "エラー出力転送開始\n")
-        
+
         for line in process.stderr:
             try:
                 # データをログ
                 decoded = line.decode("utf-8", errors="replace")
                 log_message(out_log, out_lock, "SERVER_ERR", decoded)
-                
+
                 # データを転送
                 sys.stderr.buffer.write(line)
                 sys.stderr.buffer.flush()
@@ -101,60 +171,497 @@ def server_to_stderr(process):
     finally:
         log_message(out_log, out_lock, "INFO", "エラー出力転送終了\n")
 
+
+def run_thread_proxy(cmd):
+    process = start_server(cmd)
+
+    # 転送スレッドを起動
+    threads = [
+        threading.Thread(target=stdin_to_server, args=(process,)),
+        threading.Thread(target=server_to_stdout, args=(process,)),
+        threading.Thread(target=server_to_stderr, args=(process,))
+    ]
+
+    # スレッドを開始
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    # プロセスの終了を待機
+    process.wait()
+    # 残りの出力を転送し終えるまで待つ
+    threads[1].join(timeout=1)
+    threads[2].join(timeout=1)
+
+
+# ---------------------------------------------------------------------------
+# asyncio 版
+#
+# 1つのイベントループでパイプ間のバイト列をそのまま転送します。
+# - ログ無効時は Linux の os.splice でカーネル内だけでコピー (ゼロコピー)
+# - それ以外は CHUNK_SIZE 単位の大きな read / write (行単位の分割・デコードはしない)
+# - ログは転送後にシンクへ渡すだけで、書き込みはワーカースレッドがまとめて行う (ホットパス外の tee)
+# ---------------------------------------------------------------------------
+
+def _is_pipe_or_socket(fd):
+    try:
+        mode = os.fstat(fd).st_mode
+    except OSError:
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)
+
+
+class Pump:
+    """
+    src_fd から dst_fd へバイト列を転送する。
+
+    読み込み可能になったら転送し、書き込み先が詰まったら読み込みを止めて
+    書き込み可能になるのを待つ (バックプレッシャー)。
+
+    transform を渡すと行単位で転送し、各行を transform(line) の戻り値に置き換える (None なら捨てる)。
+    tee は通常は読んだデータを受け取り、tee_output=True なら実際に書き込んだデータを受け取る。
+    """
+
+    def __init__(self, loop, src_fd, dst_fd, name, tee=None, on_eof=None, use_splice=True, transform=None, tee_output=False):
+        self.loop = loop
+        self.src_fd = src_fd
+        self.dst_fd = dst_fd
+        self.name = name
+        self.tee = tee
+        self.on_eof = on_eof
+        self.transform = transform
+        self.tee_output = tee_output
+        self.use_splice = use_splice and tee is None and transform is None and hasattr(os, "splice")
+        self.pending = b""
+        self.partial = b""
+        # 読み込み側が EOF に達した (pending を書き終えたら終了する)
+        self.eof = False
+        self.read_buffer = bytearray(CHUNK_SIZE)
+        self.read_view = memoryview(self.read_buffer)
+        self.done = loop.create_future()
+        self.bytes = 0
+        self.dst_nonblocking = _is_pipe_or_socket(dst_fd)
+        # 端末など他のプロセスと共有している fd はブロッキングのままにする
+        if self.dst_nonblocking:
+            os.set_blocking(dst_fd, False)
+        if _is_pipe_or_socket(src_fd):
+            os.set_blocking(src_fd, False)
+
+    def start(self):
+        self.loop.add_reader(self.src_fd, self._on_readable)
+        return self.done
+
+    def _on_readable(self):
+        try:
+            if self.use_splice:
+                self._splice()
+            else:
+                self._copy()
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self._finish(e)
+
+    def _splice(self):
+        try:
+            n = os.splice(self.src_fd, self.dst_fd, CHUNK_SIZE, flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+        except OSError as e:
+            if e.errno in (errno.EINVAL, errno.ENOSYS, errno.EBADF):
+                # パイプ同士でない (端末やファイル) 場合は通常のコピーに切り替える
+                self.use_splice = False
+                self._copy()
+                return
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                # 書き込み先が詰まっている: 書き込めるようになるまで読み込みを止める
+                self.loop.remove_reader(self.src_fd)
+                self.loop.add_writer(self.dst_fd, self._on_splice_writable)
+                return
+            raise
+        if n == 0:
+            self._finish()
+            return
+        self.bytes += n
+
+    def _on_splice_writable(self):
+        self.loop.remove_writer(self.dst_fd)
+        self.loop.add_reader(self.src_fd, self._on_readable)
+
+    def _copy(self):
+        # os.read(fd, CHUNK_SIZE) は毎回大きなバッファを確保するので、使い回すバッファに読む
+        n = os.readv(self.src_fd, [self.read_buffer])
+        if n == 0:
+            self.eof = True
+            if self.partial:
+                # 改行で終わらない最後のデータはそのまま転送する
+                self._write(self.partial)
+                self.partial = b""
+            if not self.pending:
+                self._finish()
+            # 書き切れなかった分は _on_writable が書き終えてから終了する
+            return
+        self.bytes += n
+        data = self.read_view[:n]
+        if self.transform is not None:
+            self._copy_lines(bytes(data))
+        elif self.tee is not None:
+            data = bytes(data)
+            self._write(data)
+            self.tee(self.name, data)
+        else:
+            self._write(data)
+
+    def _copy_lines(self, data):
+        if self.tee is not None and not self.tee_output:
+            self.tee(self.name, data)
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        out = []
+        for line in lines:
+            line = self.transform(line)
+            if line is not None:
+                out.append(line + b"\n")
+        if out:
+            self.inject(b"".join(out))
+
+    def inject(self, data):
+        """
+        行の区切りにデータを書き込む (キャッシュからの応答など)。
+        行単位で転送している (transform がある) ポンプでだけ使う。
+        """
+        if self.done.done():
+            return
+        if self.tee is not None and self.tee_output:
+            self.tee(self.name, data)
+        if self.pending:
+            self.pending += data
+        else:
+            self._write(data)
+
+    def _write(self, data):
+        if not self.dst_nonblocking:
+            self._write_all_blocking(data)
+            return
+        try:
+            written = os.write(self.dst_fd, data)
+        except BlockingIOError:
+            written = 0
+        if written < len(data):
+            # 読み込みバッファは再利用するので、残りはコピーして保持する
+            self.pending = bytes(data[written:])
+            self.loop.remove_reader(self.src_fd)
+            self.loop.add_writer(self.dst_fd, self._on_writable)
+
+    def _write_all_blocking(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.dst_fd, view):]
+
+    def _on_writable(self):
+        try:
+            written = os.write(self.dst_fd, self.pending)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._finish(e)
+            return
+        self.pending = self.pending[written:]
+        if not self.pending:
+            self.loop.remove_writer(self.dst_fd)
+            if self.eof:
+                self._finish()
+            elif not self.done.done():
+                self.loop.add_reader(self.src_fd, self._on_readable)
+
+    def _finish(self, error=None):
+        self.loop.remove_reader(self.src_fd)
+        self.loop.remove_writer(self.dst_fd)
+        if self.dst_nonblocking and not self.pending:
+            # 標準出力 / 標準エラー出力を通常の print でも使えるように戻す
+            try:
+                os.set_blocking(self.dst_fd, True)
+            except OSError:
+                pass
+        if self.on_eof:
+            try:
+                self.on_eof()
+            except OSError:
+                pass
+        if not self.done.done():
+            self.done.set_result(error)
+
+
+def make_log_sink(args):
+    """コマンドライン引数から JSON Lines のログシンクを作る"""
+    directory = args.log_dir or log_dir
+    return JsonLinesLogSink(
+        os.path.join(directory, "mcp_proxy.jsonl"),
+        max_bytes=args.log_max_bytes,
+        rotate_interval=args.log_rotate_interval,
+        backup_count=args.log_backups,
+        flush_interval=args.log_flush_interval,
+        sample_rate=args.log_sample_rate,
+    )
+
+
+def make_tee(*taps):
+    """ログシンクやレイテンシ計測など、転送データを見る処理を1つの tee にまとめる"""
+    taps = [tap for tap in taps if tap is not None]
+    if not taps:
+        return None
+    if len(taps) == 1:
+        return taps[0]
+
+    def tee(name, data):
+        for tap in taps:
+            tap(name, data)
+
+    return tee
+
+
+async def run_async_proxy(cmd, sink=None, tracker=None, stats_port=None, cache=None, recorder=None):
+    loop = asyncio.get_running_loop()
+    if sink:
+        sink.start()
+        sink.event("start", command=cmd, pid=os.getpid())
+    stats_server = None
+    if tracker:
+        tracker.start()
+        if stats_port:
+            stats_server = await start_stats_server(tracker, port=stats_port)
+            print(f"統計エンドポイント: http://127.0.0.1:{stats_port}/stats", file=sys.stderr)
+    process = start_server(cmd)
+    if sink:
+        sink.event("server_started", pid=process.pid)
+
+    # tee があると splice は使えないが、計測を有効にしたときだけなので許容する
+    tee = make_tee(
+        sink.log if sink else None,
+        tracker.observe if tracker else None,
+        recorder.observe if recorder else None,
+    )
+
+    # キャッシュ有効時は行単位で転送する。tee には常にクライアントから見た通信を渡す
+    interceptor = CachingInterceptor(cache) if cache else None
+    pumps = [
+        # クライアントの入力が終わったらサーバーの標準入力を閉じる
+        Pump(
+            loop, sys.stdin.fileno(), process.stdin.fileno(), "to_server", tee=tee, on_eof=process.stdin.close,
+            transform=interceptor.to_server if interceptor else None,
+        ),
+        Pump(
+            loop, process.stdout.fileno(), sys.stdout.fileno(), "from_server", tee=tee,
+            transform=interceptor.from_server if interceptor else None, tee_output=True,
+        ),
+        Pump(loop, process.stderr.fileno(), sys.stderr.fileno(), "server_err", tee=tee),
+    ]
+    if interceptor:
+        interceptor.reply = pumps[1].inject
+    for pump in pumps:
+        pump.start()
+
+    # サーバーの終了を待ち、残りの出力を転送し終えるまで待つ
+    await asyncio.to_thread(process.wait)
+    await asyncio.wait([pumps[1].done, pumps[2].done], timeout=1)
+    if not pumps[0].done.done():
+        pumps[0]._finish()
+    if sink:
+        for pump in pumps:
+            error = pump.done.result() if pump.done.done() else None
+            if error:
+                sink.event("error", pump=pump.name, error=str(error))
+        if cache:
+            sink.event("cache", **cache.stats)
+        sink.event("stop", returncode=process.returncode, bytes={pump.name: pump.bytes for pump in pumps})
+        await sink.close()
+    if stats_server:
+        stats_server.close()
+        await stats_server.wait_closed()
+    if tracker:
+        await tracker.close()
+    if recorder:
+        await recorder.close()
+    return process.returncode
+
+
+async def run_bridge(path):
+    """標準入出力と多重化プロキシ (--listen) の Unix ソケットをつなぐ"""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.setblocking(False)
+
+    def close_write():
+        # クライアントの入力が終わったことをプロキシに伝える
+        sock.shutdown(socket.SHUT_WR)
+
+    pumps = [
+        Pump(loop, sys.stdin.fileno(), sock.fileno(), "to_mux", on_eof=close_write),
+        Pump(loop, sock.fileno(), sys.stdout.fileno(), "from_mux"),
+    ]
+    for pump in pumps:
+        pump.start()
+    await pumps[1].done
+    if not pumps[0].done.done():
+        pumps[0]._finish()
+    sock.close()
+
+
+# スレッド版 (run_thread_proxy) では使えないオプション
+ASYNCIO_ONLY_OPTIONS = (
+    "no_log", "log_max_bytes", "log_rotate_interval", "log_backups", "log_flush_interval", "log_sample_rate",
+    "record", "cache", "cache_dir", "stats_file", "stats_interval", "stats_port",
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="標準入出力の MCP サーバーを中継し、通信をログに記録するプロキシ",
+        usage="python mcp_proxy.py [options] [-- server command ...]",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["asyncio", "thread"],
+        default="thread" if sys.platform == "win32" else "asyncio",
+        help="転送方式 (Windows のパイプは asyncio の add_reader に対応していないため thread が既定)",
+    )
+    parser.add_argument("--no-log", action="store_true", help="通信ログを記録しない (asyncio では splice を使用)")
+    parser.add_argument("--log-dir", default=None, help="ログファイルの出力先")
+    # 以下は asyncio 版の JSON Lines ログ (mcp_proxy.jsonl) の設定
+    parser.add_argument("--log-max-bytes", type=int, default=10 * 1024 * 1024, help="このサイズでローテーション (0で無効)")
+    parser.add_argument("--log-rotate-interval", type=float, default=0, help="この秒数でローテーション (0で無効)")
+    parser.add_argument("--log-backups", type=int, default=5, help="残すローテーション済みファイル数")
+    parser.add_argument("--log-flush-interval", type=float, default=1.0, help="まとめて書き込む間隔 (秒)")
+    parser.add_argument("--log-sample-rate", type=float, default=1.0, help="記録するメッセージの割合 (0.0〜1.0)")
+    # 多重化 (複数のクライアントで常駐サーバーを共有する)
+    parser.add_argument("--listen", default=None, help="この Unix ソケットで待ち受け、クライアントを常駐サーバーに多重化する")
+    parser.add_argument("--backends", type=int, default=1, help="--listen で常駐させるサーバープロセス数")
+    parser.add_argument("--pool", type=int, default=0, help="--listen で多重化せず、初期化済みのサーバーをこの数だけ用意して接続ごとに専有で渡す")
+    parser.add_argument("--pool-idle-timeout", type=float, default=600, help="通信のないセッションを閉じる秒数 (0で無効)")
+    parser.add_argument("--pool-max-lifetime", type=float, default=3600, help="サーバープロセスの最大寿命 (秒, 0で無効)")
+    parser.add_argument("--pool-protocol-version", default=DEFAULT_PROTOCOL_VERSION, help="事前の初期化に使うプロトコルバージョン (違うクライアントはその場で起動)")
+    parser.add_argument(
+        "--pool-capabilities", type=json.loads, default={},
+        help='事前の初期化に使うクライアントの capabilities (JSON, 例: \'{"roots": {"listChanged": true}}\')。違うクライアントはその場で起動',
+    )
+    parser.add_argument("--connect", default=None, help="標準入出力を --listen のソケットに中継する (サーバーは起動しない)")
+    # 記録・再生
+    parser.add_argument("--record", default=None, help="セッションをこのファイルに記録する (.gz なら圧縮, asyncio 版のみ)")
+    parser.add_argument("--replay", default=None, help="サーバーを起動せず、記録したファイルで応答する")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="記録した応答時間の倍率 (0で即時応答)")
+    # 冪等なメソッドのレスポンスキャッシュ (asyncio 版のみ)
+    parser.add_argument("--cache", action="store_true", help="initialize / tools/list などの応答をメモリにキャッシュする")
+    parser.add_argument("--cache-dir", default=None, help="キャッシュをこのディレクトリに保存して次回の起動でも使う (--cache を含む)")
+    # JSON-RPC のレイテンシ計測 (asyncio 版のみ)
+    parser.add_argument("--stats-file", default=None, help="メソッド・ツールごとのレイテンシ集計を書き出す JSON ファイル")
+    parser.add_argument("--stats-interval", type=float, default=10.0, help="集計ファイルを書き出す間隔 (秒)")
+    parser.add_argument("--stats-port", type=int, default=0, help="集計を返すローカル HTTP ポート (0で無効)")
+    argv = sys.argv[1:] if argv is None else argv
+    if "--" in argv:
+        index = argv.index("--")
+        args = parser.parse_args(argv[:index])
+        server_args = argv[index + 1:]
+        if sys.platform == "win32":
+            args.command = subprocess.list2cmdline(server_args)
+        else:
+            args.command = " ".join(shlex.quote(arg) for arg in server_args)
+    else:
+        args = parser.parse_args(argv)
+        args.command = DEFAULT_SERVER_COMMAND
+    # スレッド版はこれらを実装していないので、黙って無視せずにエラーにする
+    if args.engine == "thread" and not (args.replay or args.connect or args.listen):
+        ignored = [
+            f"--{dest.replace('_', '-')}" for dest in ASYNCIO_ONLY_OPTIONS if getattr(args, dest) != parser.get_default(dest)
+        ]
+        if ignored:
+            parser.error(f"{', '.join(ignored)} は --engine asyncio でのみ使えます")
+    return args
+
+
 # メイン処理
 def main():
+    args = parse_args()
     try:
         print("MCPプロキシを起動しています...", file=sys.stderr)
-        
-        # 環境変数をログに記録
-        in_log.write("環境変数:\n")
-        for key, value in os.environ.items():
-            if key in ["PATH", "GITHUB_TOKEN"]:
-                value_to_show = "***" if key == "GITHUB_TOKEN" else value[:20] + "..."
-                in_log.write(f"  {key}={value_to_show}\n")
-        in_log.flush()
-        
-        # 実際のMCPサーバーを起動
-        cmd = "npx --yes @modelcontextprotocol/server-github"
-        in_log.write(f"実行コマンド: {cmd}\n")
-        in_log.flush()
-        
-        # サブプロセスを起動
-        process = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True,
-            env={**os.environ, "GITHUB_TOKEN": os.getenv("GITHUB_TOKEN", "")}
-        )
-        
-        in_log.write(f"プロセスID: {process.pid}\n")
-        in_log.flush()
-        
-        # 転送スレッドを起動
-        threads = [
-            threading.Thread(target=stdin_to_server, args=(process,)),
-            threading.Thread(target=server_to_stdout, args=(process,)),
-            threading.Thread(target=server_to_stderr, args=(process,))
-        ]
-        
-        # スレッドを開始
-        for thread in threads:
-            thread.daemon = True
-            thread.start()
-        
-        # プロセスの終了を待機
-        process.wait()
-        
+
+        if args.replay:
+            asyncio.run(ReplayServer(args.replay, speed=args.replay_speed).serve_stdio())
+        elif args.connect:
+            asyncio.run(run_bridge(args.connect))
+        elif args.listen and args.pool:
+            pool = WarmPool(
+                args.command, size=args.pool, idle_timeout=args.pool_idle_timeout, max_lifetime=args.pool_max_lifetime,
+                protocol_version=args.pool_protocol_version, capabilities=args.pool_capabilities,
+            )
+            asyncio.run(pool.serve(args.listen))
+        elif args.listen:
+            asyncio.run(serve_mux(args.command, args.listen, args.backends))
+        elif args.engine == "thread":
+            # スレッド版は常にテキストログ (stdin_log.txt / stdout_log.txt) を記録する
+            open_logs(args.log_dir)
+            log_environment(args.command)
+            run_thread_proxy(args.command)
+        else:
+            sink = None if args.no_log else make_log_sink(args)
+            tracker = None
+            if args.stats_file or args.stats_port:
+                tracker = JsonRpcLatencyTracker(args.stats_file, interval=args.stats_interval)
+            cache = ResponseCache(args.command, args.cache_dir) if args.cache or args.cache_dir else None
+            recorder = SessionRecorder(args.record, args.command) if args.record else None
+            asyncio.run(
+                run_async_proxy(
+                    args.command, sink=sink, tracker=tracker, stats_port=args.stats_port, cache=cache, recorder=recorder
+                )
+            )
+            if cache:
+                print(f"キャッシュ: {cache.stats}", file=sys.stderr)
+
+    except KeyboardInterrupt:
+        # --listen は Ctrl+C で止める
+        pass
     except Exception as e:
         print(f"プロキシエラー: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc(file=sys.stderr)
     finally:
         print("MCPプロキシ処理終了", file=sys.stderr)
-        in_log.close()
-        out_log.close()
+        if in_log:
+            in_log.close()
+            out_log.close()
+
+class TestPump(unittest.TestCase):
+    def test_unterminated_tail_is_written_before_eof(self):
+        # 改行で終わらない最後の行が一度に書けなくても、書き終えてから on_eof を呼ぶ
+        data = b'{"jsonrpc": "2.0", "id": 1}\n' + b"x" * 60000
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            src_read, src_write = os.pipe()
+            sender, receiver = socket.socketpair()
+            sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            receiver.setblocking(False)
+            os.write(src_write, data)
+            os.close(src_write)
+            pump = Pump(
+                loop, src_read, sender.fileno(), "to_server",
+                on_eof=lambda: sender.shutdown(socket.SHUT_WR), transform=lambda line: line,
+            )
+            pump.start()
+            # 受信側が読み始める前に EOF まで読ませ、書き込みを詰まらせる
+            await asyncio.sleep(0.05)
+            received = bytearray()
+            while chunk := await loop.sock_recv(receiver, 65536):
+                received += chunk
+            error = await pump.done
+            os.close(src_read)
+            sender.close()
+            receiver.close()
+            return bytes(received), error
+
+        received, error = asyncio.run(run())
+        self.assertIsNone(error)
+        self.assertEqual(received, data)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
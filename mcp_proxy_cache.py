@@ -0,0 +1,269 @@
+# mcp_proxy 用の冪等な MCP メソッドのレスポンスキャッシュ
+#
+# クライアントはセッションごとに initialize / tools/list / resources/list / prompts/list を送り、
+# GitHub の MCP サーバーは毎回同じ内容を返します。これらをメモリ (とディスク) にキャッシュし、
+# リクエストの id を書き換えたレスポンスをプロキシが直接返します。
+#
+# - キーはサーバーのコマンドとバージョン (initialize の serverInfo.version)
+# - initialize はキャッシュから即答しつつ、サーバー自身の初期化のために内部 id で転送し、その応答は捨てる
+#   (実際のバージョンが違えばキャッシュを捨て、クライアントに list_changed 通知を送る)
+# - notifications/tools/list_changed などを受けたら該当メソッドのキャッシュを無効にする
+
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+
+CACHEABLE_METHODS = ("tools/list", "resources/list", "prompts/list")
+
+LIST_CHANGED_NOTIFICATIONS = {
+    "notifications/tools/list_changed": "tools/list",
+    "notifications/resources/list_changed": "resources/list",
+    "notifications/prompts/list_changed": "prompts/list",
+}
+
+
+def _params_key(params, ignore=()) -> str:
+    # _meta (progressToken など) はレスポンスに影響しないのでキーに含めない
+    if not isinstance(params, dict):
+        return json.dumps(params, sort_keys=True)
+    return json.dumps({k: v for k, v in params.items() if k != "_meta" and k not in ignore}, sort_keys=True)
+
+
+def _response(request_id, result_text: str) -> bytes:
+    # キャッシュした result にクライアントの id を埋め込む
+    return (
+        b'{"jsonrpc":"2.0","id":' + json.dumps(request_id).encode("utf-8")
+        + b',"result":' + result_text.encode("utf-8") + b"}\n"
+    )
+
+
+class ResponseCache:
+    """
+    Cached results of idempotent MCP methods for one server command.
+
+    Args:
+        command: The server command line; one cache (and file) per command.
+        cache_dir: Directory for the on-disk cache, or None for memory only.
+    """
+
+    def __init__(self, command: str, cache_dir: str | None = None):
+        self.command = command
+        self.path = None
+        if cache_dir:
+            digest = hashlib.sha256(command.encode("utf-8")).hexdigest()[:16]
+            self.path = os.path.join(cache_dir, f"mcp_cache_{digest}.json")
+        self.version = None
+        self.initialize = {}
+        self.entries = {}
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("command") == self.command:
+            self.version = data.get("version")
+            self.initialize = data.get("initialize", {})
+            self.entries = data.get("entries", {})
+
+    def save(self):
+        if not self.path:
+            return
+        data = {"command": self.command, "version": self.version, "initialize": self.initialize, "entries": self.entries}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, method, params_key):
+        return f"{self.version}\n{method}\n{params_key}"
+
+    def get_initialize(self, params_key) -> str | None:
+        return self._count(self.initialize.get(params_key))
+
+    def get(self, method, params_key) -> str | None:
+        # バージョンが分からないうちはキャッシュを使わない
+        if self.version is None:
+            return self._count(None)
+        return self._count(self.entries.get(self._key(method, params_key)))
+
+    def _count(self, result):
+        self.stats["hits" if result is not None else "misses"] += 1
+        return result
+
+    def store_initialize(self, params_key, result) -> bool:
+        """
+        Stores an initialize result. Returns True when the server version changed,
+        in which case the cached lists were dropped.
+        """
+        server_info = result.get("serverInfo") if isinstance(result, dict) else None
+        version = json.dumps(server_info, sort_keys=True) if server_info else None
+        changed = self.version is not None and version != self.version
+        if changed:
+            self.initialize.clear()
+            self.entries.clear()
+            self.stats["invalidations"] += 1
+        self.version = version
+        result_text = json.dumps(result, ensure_ascii=False)
+        if self.initialize.get(params_key) == result_text:
+            return False
+        self.initialize[params_key] = result_text
+        self.stats["stores"] += 1
+        self.save()
+        return changed
+
+    def store(self, method, params_key, result):
+        if self.version is None:
+            return
+        self.entries[self._key(method, params_key)] = json.dumps(result, ensure_ascii=False)
+        self.stats["stores"] += 1
+        self.save()
+
+    def invalidate(self, method):
+        prefix = f"{self.version}\n{method}\n"
+        stale = [key for key in self.entries if key.startswith(prefix)]
+        for key in stale:
+            del self.entries[key]
+        self.stats["invalidations"] += 1
+        if stale:
+            self.save()
+
+
+class CachingInterceptor:
+    """
+    Line transforms for the proxy pumps that serve and fill a ResponseCache.
+
+    `to_server` and `from_server` take one JSON-RPC line (without the newline)
+    and return the line to forward, or None to drop it. `reply` is called with
+    a complete line that should go to the client, e.g. a cached response.
+    """
+
+    def __init__(self, cache: ResponseCache, reply=None):
+        self.cache = cache
+        self.reply = reply
+        self.pending = {}
+        self._internal_ids = 0
+
+    def to_server(self, line: bytes) -> bytes | None:
+        # ほとんどのメッセージ (tools/call など) は解析せずに素通しする
+        if not any(method.encode() in line for method in ("initialize", *CACHEABLE_METHODS)):
+            return line
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return line
+        if not isinstance(message, dict) or "id" not in message:
+            return line
+        method = message.get("method")
+        request_id = message["id"]
+        if method == "initialize":
+            # clientInfo はクライアントごとに違うが、サーバーの応答には影響しない
+            params_key = _params_key(message.get("params"), ignore=("clientInfo",))
+            cached = self.cache.get_initialize(params_key)
+            if cached is None:
+                self.pending[json.dumps(request_id)] = (method, params_key, False)
+                return line
+            self.reply(_response(request_id, cached))
+            # サーバー自身も初期化が必要なので、内部 id で転送して応答は捨てる
+            self._internal_ids += 1
+            internal_id = f"mcp-proxy-{self._internal_ids}"
+            self.pending[json.dumps(internal_id)] = (method, params_key, True)
+            return json.dumps({**message, "id": internal_id}, ensure_ascii=False).encode("utf-8")
+        if method in CACHEABLE_METHODS:
+            params_key = _params_key(message.get("params"))
+            cached = self.cache.get(method, params_key)
+            if cached is not None:
+                self.reply(_response(request_id, cached))
+                return None
+            self.pending[json.dumps(request_id)] = (method, params_key, False)
+        return line
+
+    def from_server(self, line: bytes) -> bytes | None:
+        if not self.pending and b"list_changed" not in line:
+            return line
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return line
+        if not isinstance(message, dict):
+            return line
+        if "method" in message:
+            method = LIST_CHANGED_NOTIFICATIONS.get(message["method"])
+            if method and "id" not in message:
+                self.cache.invalidate(method)
+            return line
+        entry = self.pending.pop(json.dumps(message.get("id")), None)
+        if entry is None:
+            return line
+        method, params_key, swallow = entry
+        if "result" in message:
+            if method == "initialize":
+                if self.cache.store_initialize(params_key, message["result"]) and swallow:
+                    # キャッシュから答えた initialize が古かった: 一覧を取り直してもらう
+                    for notification in LIST_CHANGED_NOTIFICATIONS:
+                        self.reply(b'{"jsonrpc":"2.0","method":"' + notification.encode() + b'"}\n')
+            else:
+                self.cache.store(method, params_key, message["result"])
+        return None if swallow else line
+
+
+class TestCachingInterceptor(unittest.TestCase):
+    INITIALIZE = b'{"jsonrpc":"2.0","id":%d,"method":"initialize","params":{"protocolVersion":"2024-11-05","clientInfo":{"name":"c%d"}}}'
+    INITIALIZE_RESULT = b'{"jsonrpc":"2.0","id":%s,"result":{"serverInfo":{"name":"github","version":"%s"}}}'
+    TOOLS_LIST = b'{"jsonrpc":"2.0","id":%d,"method":"tools/list"}'
+    TOOLS_RESULT = b'{"jsonrpc":"2.0","id":%d,"result":{"tools":[{"name":"search_repositories"}]}}'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.replies = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _interceptor(self):
+        return CachingInterceptor(ResponseCache("npx server", self.tmp_dir.name), reply=self.replies.append)
+
+    def _warm_up(self):
+        first = self._interceptor()
+        self.assertIsNotNone(first.to_server(self.INITIALIZE % (1, 1)))
+        first.from_server(self.INITIALIZE_RESULT % (b"1", b"1.0"))
+        self.assertIsNotNone(first.to_server(self.TOOLS_LIST % 2))
+        first.from_server(self.TOOLS_RESULT % 2)
+        self.assertEqual(self.replies, [])
+
+    def test_serves_second_session_from_disk_with_rewritten_ids(self):
+        self._warm_up()
+        second = self._interceptor()
+        forwarded = json.loads(second.to_server(self.INITIALIZE % (7, 2)))
+        self.assertEqual(forwarded["id"], "mcp-proxy-1")
+        self.assertIsNone(second.to_server(self.TOOLS_LIST % 8))
+        self.assertEqual([json.loads(r)["id"] for r in self.replies], [7, 8])
+        self.assertEqual(json.loads(self.replies[1])["result"]["tools"][0]["name"], "search_repositories")
+        # 内部 id の initialize の応答はクライアントに返さない
+        self.assertIsNone(second.from_server(self.INITIALIZE_RESULT % (b'"mcp-proxy-1"', b"1.0")))
+
+    def test_list_changed_invalidates(self):
+        self._warm_up()
+        interceptor = self._interceptor()
+        interceptor.to_server(self.INITIALIZE % (1, 1))
+        interceptor.from_server(b'{"jsonrpc":"2.0","method":"notifications/tools/list_changed"}')
+        self.assertIsNotNone(interceptor.to_server(self.TOOLS_LIST % 2))
+
+    def test_version_change_drops_cache_and_notifies_client(self):
+        self._warm_up()
+        interceptor = self._interceptor()
+        interceptor.to_server(self.INITIALIZE % (1, 1))
+        interceptor.from_server(self.INITIALIZE_RESULT % (b'"mcp-proxy-1"', b"2.0"))
+        self.assertIn(b"notifications/tools/list_changed", self.replies[-3])
+        self.assertIsNotNone(interceptor.to_server(self.TOOLS_LIST % 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
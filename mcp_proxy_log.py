@@ -0,0 +1,311 @@
+# mcp_proxy 用のバッファ付き・ローテーション付き構造化ログ
+#
+# 転送データはメモリに溜めるだけで、flush_interval ごとにワーカースレッドで
+# JSON Lines に変換してまとめて書き込みます。1行ごとのロック・flush はしません。
+# サイズ (max_bytes) と時間 (rotate_interval) でファイルをローテーションし、
+# sample_rate で通信の記録を間引けるので、本番でも全通信の記録を続けやすくなります。
+# 書き込みが追いつかないときは max_buffer_bytes を超えた分を捨てて数え ("dropped" イベントも残す)、
+# 書き込みエラーが起きてもログを出して書き込みを続けます。
+#
+# 1レコード = 1メッセージ (改行区切りの JSON-RPC 1行):
+#   {"ts": 1715212800.123, "dir": "to_server", "bytes": 84, "line": "{\"jsonrpc\": ...}"}
+#   {"ts": 1715212800.001, "dir": "event", "event": "start", "command": "npx ..."}
+
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+import unittest
+
+logger = logging.getLogger(__name__)
+
+
+class JsonLinesLogSink:
+    """
+    An asyncio-friendly, batched JSON Lines log writer with rotation.
+
+    Args:
+        path: The active log file; rotated files get .1, .2, ... suffixes.
+        max_bytes: Rotate when the file grows beyond this size (0 disables).
+        rotate_interval: Rotate when the file is older than this many seconds (0 disables).
+        backup_count: Number of rotated files to keep.
+        flush_interval: Seconds between batched writes.
+        sample_rate: Fraction of traffic messages to keep (events are always kept).
+        max_pending: Write early when this many chunks are waiting.
+        max_buffer_bytes: Traffic beyond this many unwritten bytes is dropped and counted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        rotate_interval: float = 0,
+        backup_count: int = 5,
+        flush_interval: float = 1.0,
+        sample_rate: float = 1.0,
+        max_pending: int = 10000,
+        max_buffer_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self.max_buffer_bytes = max_buffer_bytes
+        self.random = random.Random()
+        self.stats = {
+            "records": 0, "sampled_out": 0, "batches": 0, "rotations": 0,
+            "dropped": 0, "dropped_bytes": 0, "write_errors": 0,
+        }
+        self._pending = []
+        self._pending_bytes = 0
+        # 捨てたチャンクがある方向 -> 最後に捨てたチャンクが行の途中で終わったか
+        self._dropping = {}
+        # 捨てたチャンクの後、次の改行まで読み飛ばす方向 (ワーカースレッド側)
+        self._resync = set()
+        # 方向ごとの、まだ改行が来ていない行の断片
+        self._partial = {}
+        self._file = None
+        self._opened_at = 0.0
+        self._wake = None
+        self._task = None
+        self._closed = False
+
+    # --- イベントループ側 (ホットパス) ---
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def log(self, direction: str, data: bytes):
+        """
+        Queues a forwarded chunk. The chunk may hold several or partial lines.
+        """
+        if self._pending_bytes + len(data) > self.max_buffer_bytes:
+            self.stats["dropped"] += 1
+            self.stats["dropped_bytes"] += len(data)
+            self._dropping[direction] = not data.endswith(b"\n")
+            return
+        if direction in self._dropping:
+            # 次に書く前に "dropped" の印を入れる
+            mid_line = self._dropping.pop(direction)
+            self._pending.append((time.time(), "dropped", {"direction": direction, "mid_line": mid_line}))
+        self._pending.append((time.time(), direction, data))
+        self._pending_bytes += len(data)
+        if len(self._pending) >= self.max_pending and self._wake:
+            self._wake.set()
+
+    def event(self, event: str, **fields):
+        """
+        Queues a lifecycle record, e.g. start / stop / error. Never sampled.
+        """
+        self._pending.append((time.time(), "event", {"event": event, **fields}))
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._write_pending()
+
+    async def _write_pending(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._pending_bytes = 0
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            # ディスクがいっぱいなどで失敗しても、次のバッチは書き込めるようにする
+            self.stats["write_errors"] += 1
+            logger.warning("Failed to write %d log chunks to %s: %s", len(batch), self.path, e)
+            await asyncio.to_thread(self._close_file)
+
+    async def close(self):
+        self._closed = True
+        if self._wake:
+            self._wake.set()
+        if self._task:
+            await self._task
+        await self._write_pending()
+        await asyncio.to_thread(self._close_file)
+
+    # --- ワーカースレッド側 ---
+
+    def _records(self, batch):
+        for timestamp, direction, data in batch:
+            if direction == "event":
+                yield {"ts": timestamp, "dir": "event", **data}
+                continue
+            if direction == "dropped":
+                # 捨てたチャンクの前後をつなげた壊れた行を書かない
+                self._partial.pop(data["direction"], None)
+                if data["mid_line"]:
+                    self._resync.add(data["direction"])
+                yield {"ts": timestamp, "dir": "event", "event": "dropped", "direction": data["direction"]}
+                continue
+            text = self._partial.pop(direction, "") + data.decode("utf-8", errors="replace")
+            if direction in self._resync:
+                if "\n" not in text:
+                    continue
+                self._resync.discard(direction)
+                text = text.split("\n", 1)[1]
+            lines = text.split("\n")
+            if lines[-1]:
+                self._partial[direction] = lines[-1]
+            for line in lines[:-1]:
+                if self.sample_rate < 1.0 and self.random.random() >= self.sample_rate:
+                    self.stats["sampled_out"] += 1
+                    continue
+                yield {"ts": timestamp, "dir": direction, "bytes": len(line.encode("utf-8")) + 1, "line": line}
+
+    def _write_batch(self, batch):
+        lines = [json.dumps(record, ensure_ascii=False) + "\n" for record in self._records(batch)]
+        if not lines:
+            return
+        self._open_if_needed()
+        self._file.write("".join(lines))
+        self._file.flush()
+        self.stats["records"] += len(lines)
+        self.stats["batches"] += 1
+        if self._should_rotate():
+            self._rotate()
+
+    def _open_if_needed(self):
+        if self._file is None:
+            # 追記モード: 再起動しても以前のログを消さない
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._opened_at = time.time()
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        self._close_file()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.stats["rotations"] += 1
+
+    def _close_file(self):
+        if self._file is not None:
+            file, self._file = self._file, None
+            try:
+                file.close()
+            except OSError:
+                pass
+
+
+class TestJsonLinesLogSink(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "mcp_proxy.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_splits_chunks_into_line_records(self):
+        async def run():
+            sink = JsonLinesLogSink(self.path, flush_interval=0.01)
+            sink.start()
+            sink.event("start", command="echo")
+            sink.log("to_server", b'{"id": 1}\n{"id"')
+            sink.log("to_server", b': 2}\n')
+            await sink.close()
+
+        asyncio.run(run())
+        records = self._read(self.path)
+        self.assertEqual(records[0]["event"], "start")
+        self.assertEqual([r["line"] for r in records[1:]], ['{"id": 1}', '{"id": 2}'])
+
+    def test_rotates_by_size_and_keeps_backups(self):
+        async def run():
+            # バックグラウンドのタスクを動かさず、書き込みを直接呼ぶ
+            sink = JsonLinesLogSink(self.path, max_bytes=200, backup_count=2, flush_interval=0.01)
+            for i in range(10):
+                sink.log("from_server", (json.dumps({"id": i, "pad": "x" * 100}) + "\n").encode())
+                await sink._write_pending()
+            await sink.close()
+            return sink
+
+        sink = asyncio.run(run())
+        self.assertGreater(sink.stats["rotations"], 2)
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+
+    def test_sampling_drops_traffic_but_not_events(self):
+        async def run():
+            sink = JsonLinesLogSink(self.path, sample_rate=0.0, flush_interval=0.01)
+            sink.start()
+            sink.event("start")
+            sink.log("to_server", b"{}\n" * 5)
+            await sink.close()
+            return sink
+
+        sink = asyncio.run(run())
+        self.assertEqual([r["dir"] for r in self._read(self.path)], ["event"])
+        self.assertEqual(sink.stats["sampled_out"], 5)
+
+    def test_drops_beyond_the_buffer_cap(self):
+        async def run():
+            sink = JsonLinesLogSink(self.path, max_buffer_bytes=30)
+            sink.log("to_server", b'{"id": 1}\n{"id": 2, "pad"')
+            sink.log("to_server", b': "xxxxxxxxxxxxxxxxxxxx"}\n')
+            await sink._write_pending()
+            sink.log("to_server", b'{"id": 3}\n')
+            # 行の途中で終わるチャンクを捨てたら、次の改行までも捨てる
+            sink.log("to_server", b'{"id": 4, "pad": "xxxxxxxxxxxxxxxxxxxxxxxxxx"')
+            sink.log("to_server", b'}\n{"id": 5}\n')
+            await sink.close()
+            return sink
+
+        sink = asyncio.run(run())
+        records = self._read(self.path)
+        # 途中で切れた id 2 の行は書かず、捨てたことを記録する
+        self.assertEqual(
+            [r.get("line") or r["event"] for r in records], ['{"id": 1}', "dropped", '{"id": 3}', "dropped", '{"id": 5}']
+        )
+        self.assertEqual(sink.stats["dropped"], 2)
+
+    def test_keeps_writing_after_a_write_error(self):
+        async def run():
+            # ログのパスがディレクトリなので最初の書き込みは失敗する
+            os.mkdir(self.path)
+            sink = JsonLinesLogSink(self.path, flush_interval=0.01)
+            sink.start()
+            sink.log("to_server", b'{"id": 1}\n')
+            await asyncio.sleep(0.05)
+            os.rmdir(self.path)
+            sink.log("to_server", b'{"id": 2}\n')
+            await asyncio.sleep(0.05)
+            running = not sink._task.done()
+            await sink.close()
+            return sink, running
+
+        with self.assertLogs(__name__, level="WARNING"):
+            sink, running = asyncio.run(run())
+        self.assertTrue(running)
+        self.assertEqual(sink.stats["write_errors"], 1)
+        self.assertEqual([r["line"] for r in self._read(self.path)], ['{"id": 2}'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,461 @@
+# 多数の MCP クライアントを少数の常駐 MCP サーバーに多重化する (mcp_proxy.py --listen)
+#
+# セッションごとに npx で GitHub の MCP サーバーを起動すると、Node の起動とパッケージ解決に
+# 毎回数秒かかります。Unix ソケットで待ち受け、クライアントのセッションを常駐している
+# 1〜数個のサーバープロセスに振り分けます。
+#
+# - JSON-RPC の id はクライアントごとにサーバー側の通し番号へ書き換え、応答は元の id で返す
+# - initialize はサーバーごとに1回だけ転送し、以降のクライアントには同じ結果を返す
+# - notifications/progress は progressToken で持ち主のクライアントへ、その他の通知は全員に送る
+# - サーバーが落ちたら処理中のリクエストにエラーを返し、再起動して同じパラメーターで初期化し直す
+#
+# stdio しか話せないクライアントは `python mcp_proxy.py --connect <socket>` を経由して接続します。
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+from mcp_proxy_pool import spawn_server
+
+# 1メッセージ (1行) の最大サイズ
+LINE_LIMIT = 64 * 1024 * 1024
+# 読み出しの遅いクライアントに溜める送信データの上限。超えたら切断する
+MAX_CLIENT_BUFFER = 64 * 1024 * 1024
+
+JSONRPC_INTERNAL_ERROR = -32603
+JSONRPC_METHOD_NOT_FOUND = -32601
+JSONRPC_INVALID_REQUEST = -32600
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _error(request_id, code, message) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+class MuxClient:
+    """One client connection and the requests it has in flight."""
+
+    def __init__(self, number: int, writer: asyncio.StreamWriter):
+        self.number = number
+        self.writer = writer
+        self.backend = None
+        # クライアントの id (JSON 文字列) -> サーバー側の id
+        self.in_flight = {}
+        self.closed = False
+
+    def send(self, message: dict | bytes):
+        if self.closed:
+            return
+        self.writer.write(message if isinstance(message, bytes) else _encode(message))
+        if self.writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            print(f"[mux] client {self.number}: 送信バッファが上限を超えたため切断します", file=sys.stderr)
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+
+class Backend:
+    """
+    A long-lived MCP server process shared by several clients.
+
+    Args:
+        command: The server command line.
+        index: The backend number used in log messages.
+        restart_delay: Seconds to wait before restarting a crashed server.
+        spawn: Coroutine function that starts the process; defaults to
+            spawn_server (piped stdin/stdout, inherited stderr, no shell).
+    """
+
+    def __init__(self, command: str, index: int = 0, restart_delay: float = 1.0, spawn=None):
+        self.command = command
+        self.index = index
+        self.restart_delay = restart_delay
+        self.spawn = spawn or self._spawn
+        self.process = None
+        self.clients = set()
+        self.restarts = 0
+        # サーバー側の id -> (client, クライアントの id)
+        self.requests = {}
+        # プロキシ自身が送ったリクエスト (initialize) の id -> Future
+        self.internal = {}
+        # サーバー側の progressToken -> (client, 元の token)
+        self.progress = {}
+        self.init_params = None
+        self.init_result = None
+        self.initialized = None
+        self._initializing = False
+        self._next_id = 0
+        self._task = None
+        self._closed = False
+
+    async def _spawn(self):
+        return await spawn_server(self.command, limit=LINE_LIMIT)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self.initialized = loop.create_future()
+        while not self._closed:
+            self._initializing = False
+            self.process = await self.spawn()
+            print(f"[mux] backend {self.index}: サーバーを起動しました (pid {self.process.pid})", file=sys.stderr)
+            if self.init_params is not None:
+                # 再起動: クライアントは初期化済みなので、前回と同じパラメーターで初期化し直す
+                asyncio.create_task(self._initialize(self.init_params))
+            await self._read_loop()
+            await self.process.wait()
+            self._fail_in_flight(f"MCP server exited with code {self.process.returncode}")
+            # 再起動を待つ間に来たリクエストは、次のサーバーの初期化完了まで待たせる
+            self.initialized = loop.create_future()
+            if self._closed:
+                break
+            self.restarts += 1
+            print(f"[mux] backend {self.index}: サーバーが終了しました。{self.restart_delay} 秒後に再起動します", file=sys.stderr)
+            await asyncio.sleep(self.restart_delay)
+
+    async def _read_loop(self):
+        while True:
+            try:
+                line = await self.process.stdout.readline()
+            except (ValueError, asyncio.LimitOverrunError) as e:
+                print(f"[mux] backend {self.index}: 読み込みエラー: {e}", file=sys.stderr)
+                self.process.kill()
+                return
+            if not line:
+                return
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(message, dict):
+                self.handle_server_message(message)
+
+    def _fail_in_flight(self, reason: str):
+        for client, client_id in list(self.requests.values()):
+            client.in_flight.pop(json.dumps(client_id), None)
+            client.send(_error(client_id, JSONRPC_INTERNAL_ERROR, reason))
+        self.requests.clear()
+        self.progress.clear()
+        for future in self.internal.values():
+            if not future.done():
+                future.set_exception(ConnectionError(reason))
+        self.internal.clear()
+        if self.initialized and not self.initialized.done():
+            self.initialized.set_exception(ConnectionError(reason))
+            # 誰も待っていなくても警告を出さないようにする
+            self.initialized.exception()
+
+    def _allocate_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def write(self, message: dict):
+        if self.process is None or self.process.stdin.is_closing():
+            raise ConnectionError("MCP server is not running")
+        self.process.stdin.write(_encode(message))
+
+    async def _internal_request(self, method: str, params=None) -> dict:
+        backend_id = self._allocate_id()
+        future = asyncio.get_running_loop().create_future()
+        self.internal[backend_id] = future
+        self.write({"jsonrpc": "2.0", "id": backend_id, "method": method, "params": params or {}})
+        return await future
+
+    async def _initialize(self, params):
+        self._initializing = True
+        initialized = self.initialized
+        try:
+            result = await self._internal_request("initialize", params)
+            self.write({"jsonrpc": "2.0", "method": "notifications/initialized"})
+        except Exception as e:
+            if not initialized.done():
+                initialized.set_exception(e)
+            if initialized is self.initialized:
+                # 次のクライアントの initialize でやり直す
+                self.initialized = asyncio.get_running_loop().create_future()
+                self._initializing = False
+            return
+        self.init_result = result
+        if not initialized.done():
+            initialized.set_result(result)
+
+    async def initialize(self, params) -> dict:
+        """Initializes the server once; later callers get the same result."""
+        if self.init_params is None:
+            self.init_params = params
+        if not self._initializing and not self.initialized.done():
+            asyncio.create_task(self._initialize(self.init_params))
+        return await asyncio.shield(self.initialized)
+
+    # --- クライアント -> サーバー ---
+
+    async def handle_client_message(self, client: MuxClient, message: dict):
+        method = message.get("method")
+        if "id" not in message:
+            if method == "notifications/initialized":
+                # サーバーへは _initialize() が1回だけ送る
+                return
+            if method == "notifications/cancelled":
+                params = dict(message.get("params") or {})
+                backend_id = client.in_flight.get(json.dumps(params.get("requestId")))
+                if backend_id is None:
+                    return
+                params["requestId"] = backend_id
+                message = {**message, "params": params}
+            await self._write_when_ready(message)
+            return
+        client_id = message["id"]
+        if method is None:
+            # サーバーからのリクエストへの応答は _reply_to_server_request で処理済み
+            return
+        if method == "initialize":
+            try:
+                result = await self.initialize(message.get("params"))
+            except Exception as e:
+                client.send(_error(client_id, JSONRPC_INTERNAL_ERROR, f"initialize failed: {e}"))
+                return
+            client.send({"jsonrpc": "2.0", "id": client_id, "result": result})
+            return
+        if method == "ping":
+            client.send({"jsonrpc": "2.0", "id": client_id, "result": {}})
+            return
+        backend_id = self._allocate_id()
+        params = message.get("params")
+        meta = params.get("_meta") if isinstance(params, dict) else None
+        if isinstance(meta, dict) and "progressToken" in meta:
+            # progressToken はクライアント間で重複しうるので、サーバー側の id に置き換える
+            self.progress[backend_id] = (client, meta["progressToken"])
+            params = {**params, "_meta": {**meta, "progressToken": backend_id}}
+        self.requests[backend_id] = (client, client_id)
+        client.in_flight[json.dumps(client_id)] = backend_id
+        message = {**message, "id": backend_id}
+        if params is not None:
+            message["params"] = params
+        try:
+            await self._write_when_ready(message)
+        except Exception as e:
+            self.requests.pop(backend_id, None)
+            client.in_flight.pop(json.dumps(client_id), None)
+            client.send(_error(client_id, JSONRPC_INTERNAL_ERROR, str(e)))
+
+    async def _write_when_ready(self, message: dict):
+        # 再起動中は初期化が終わるまで待つ
+        await asyncio.shield(self.initialized)
+        self.write(message)
+        await self.process.stdin.drain()
+
+    def detach(self, client: MuxClient):
+        """Forgets a disconnected client and cancels its in-flight requests."""
+        self.clients.discard(client)
+        for backend_id in client.in_flight.values():
+            self.requests.pop(backend_id, None)
+            self.progress.pop(backend_id, None)
+            try:
+                self.write({"jsonrpc": "2.0", "method": "notifications/cancelled",
+                            "params": {"requestId": backend_id, "reason": "client disconnected"}})
+            except ConnectionError:
+                pass
+        client.in_flight.clear()
+
+    # --- サーバー -> クライアント ---
+
+    def handle_server_message(self, message: dict):
+        method = message.get("method")
+        if method is None:
+            backend_id = message.get("id")
+            future = self.internal.pop(backend_id, None)
+            if future is not None:
+                if "error" in message:
+                    future.set_exception(RuntimeError(message["error"].get("message", "error")))
+                else:
+                    future.set_result(message.get("result"))
+                return
+            entry = self.requests.pop(backend_id, None)
+            if entry is None:
+                return
+            client, client_id = entry
+            self.progress.pop(backend_id, None)
+            client.in_flight.pop(json.dumps(client_id), None)
+            client.send({**message, "id": client_id})
+            return
+        if "id" in message:
+            self._reply_to_server_request(message)
+            return
+        if method == "notifications/progress":
+            params = message.get("params") or {}
+            entry = self.progress.get(params.get("progressToken"))
+            if entry is not None:
+                client, token = entry
+                client.send({**message, "params": {**params, "progressToken": token}})
+            return
+        # list_changed やログなど、どのリクエストにも属さない通知は全員に送る
+        data = _encode(message)
+        for client in list(self.clients):
+            client.send(data)
+
+    def _reply_to_server_request(self, message: dict):
+        # サーバーからのリクエストはどのクライアント宛てか決められないので、ping 以外は断る
+        if message["method"] == "ping":
+            reply = {"jsonrpc": "2.0", "id": message["id"], "result": {}}
+        else:
+            reply = _error(message["id"], JSONRPC_METHOD_NOT_FOUND, "not supported through the multiplexer")
+        try:
+            self.write(reply)
+        except ConnectionError:
+            pass
+
+    async def close(self):
+        self._closed = True
+        if self.process and self.process.returncode is None:
+            self.process.stdin.close()
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+        if self._task:
+            await self._task
+
+
+class Multiplexer:
+    """
+    Accepts clients on a Unix socket and assigns each to the least loaded backend.
+    """
+
+    def __init__(self, command: str, backends: int = 1, restart_delay: float = 1.0, spawn=None):
+        self.backends = [Backend(command, i, restart_delay, spawn) for i in range(backends)]
+        self._clients = 0
+        self._server = None
+
+    async def start(self, path: str):
+        for backend in self.backends:
+            backend.start()
+        if os.path.exists(path):
+            os.remove(path)
+        self._server = await asyncio.start_unix_server(self.handle_client, path, limit=LINE_LIMIT)
+        os.chmod(path, 0o600)
+        return self._server
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients += 1
+        client = MuxClient(self._clients, writer)
+        backend = min(self.backends, key=lambda b: len(b.clients))
+        client.backend = backend
+        backend.clients.add(client)
+        print(f"[mux] client {client.number}: 接続 (backend {backend.index})", file=sys.stderr)
+        try:
+            while not client.closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    client.send(_error(None, -32700, "parse error"))
+                    continue
+                if not isinstance(message, dict):
+                    client.send(_error(None, JSONRPC_INVALID_REQUEST, "batches are not supported through the multiplexer"))
+                    continue
+                await backend.handle_client_message(client, message)
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            backend.detach(client)
+            client.close()
+            print(f"[mux] client {client.number}: 切断", file=sys.stderr)
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for backend in self.backends:
+            await backend.close()
+
+
+async def serve(command: str, path: str, backends: int = 1):
+    mux = Multiplexer(command, backends)
+    server = await mux.start(path)
+    print(f"[mux] {path} で待ち受けています (サーバー {backends} 個)", file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await mux.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class TestMultiplexer(unittest.TestCase):
+    # initialize と tools/call に答える最小の MCP サーバー
+    SERVER = (
+        "import json, sys\n"
+        "for line in sys.stdin:\n"
+        "    m = json.loads(line)\n"
+        "    if 'id' not in m: continue\n"
+        "    if m['method'] == 'initialize':\n"
+        "        r = {'protocolVersion': '2024-11-05', 'serverInfo': {'name': 'echo', 'version': '1'}, 'capabilities': {}}\n"
+        "    elif m['method'] == 'crash':\n"
+        "        sys.exit(1)\n"
+        "    else:\n"
+        "        r = {'echo': m['params']}\n"
+        "    print(json.dumps({'jsonrpc': '2.0', 'id': m['id'], 'result': r}), flush=True)\n"
+    )
+
+    def test_two_clients_share_one_server(self):
+        import shlex
+        import tempfile
+
+        async def session(path, number):
+            reader, writer = await asyncio.open_unix_connection(path)
+
+            async def call(request_id, method, params):
+                writer.write(_encode({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}))
+                return json.loads(await reader.readline())
+
+            init = await call(1, "initialize", {"protocolVersion": "2024-11-05"})
+            echo = await call(2, "tools/call", {"name": "echo", "client": number})
+            writer.close()
+            return init, echo
+
+        async def run():
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "mux.sock")
+                command = f"{shlex.quote(sys.executable)} -u -c {shlex.quote(self.SERVER)}"
+                mux = Multiplexer(command, backends=1, restart_delay=0.05)
+                await mux.start(path)
+                results = await asyncio.gather(session(path, 1), session(path, 2))
+                pid = mux.backends[0].process.pid
+
+                # サーバーが落ちたら処理中のリクエストはエラーになり、再起動後は使える
+                reader, writer = await asyncio.open_unix_connection(path)
+                writer.write(_encode({"jsonrpc": "2.0", "id": "x", "method": "crash", "params": {}}))
+                crashed = json.loads(await reader.readline())
+                writer.write(_encode({"jsonrpc": "2.0", "id": "y", "method": "tools/call", "params": {"n": 3}}))
+                after = json.loads(await reader.readline())
+                writer.close()
+                restarted_pid = mux.backends[0].process.pid
+                await mux.close()
+                return results, pid, crashed, after, restarted_pid
+
+        results, pid, crashed, after, restarted_pid = asyncio.run(run())
+        for number, (init, echo) in enumerate(results, start=1):
+            self.assertEqual(init["id"], 1)
+            self.assertEqual(init["result"]["serverInfo"]["name"], "echo")
+            self.assertEqual(echo["id"], 2)
+            self.assertEqual(echo["result"]["echo"]["client"], number)
+        self.assertEqual(crashed["id"], "x")
+        self.assertIn("error", crashed)
+        self.assertEqual(after["result"]["echo"], {"n": 3})
+        self.assertNotEqual(pid, restarted_pid)
+
+
+if __name__ == "__main__":
+    unittest.main()
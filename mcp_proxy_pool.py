@@ -0,0 +1,389 @@
+# 起動・初期化済みの MCP サーバープロセスのウォームプール (mcp_proxy.py --listen --pool N)
+#
+# 多重化しない場合でも、セッション開始にかかる時間の大半は npx による GitHub MCP サーバーの起動です。
+# 起動して initialize まで済ませたプロセスを N 個用意しておき、新しい接続ごとに1つを専有で渡し、
+# 減った分はバックグラウンドで補充します。
+#
+# - クライアントの initialize には事前の初期化結果を id だけ書き換えて返し、以降はバイト列をそのまま中継する
+# - 事前の初期化は設定したプロトコルバージョンと capabilities で行う。どちらかが違うクライアントには、
+#   プールには触れずにその場で起動したプロセスを渡す (initialize もそのまま転送する)。
+#   capabilities は initialize でしかサーバーに伝わらないので、roots / sampling / elicitation を使う
+#   クライアントを受けるなら --pool-capabilities にそれを設定する
+# - idle_timeout: 通信のないセッションを閉じる秒数
+# - max_lifetime: プロセスの最大寿命。プール内なら入れ替え、使用中ならセッションを閉じる
+#
+# サーバーはシェルを介さずに直接起動します (shell=True は余分なプロセスを1つ増やすため)。
+
+import asyncio
+import json
+import os
+import shlex
+import shutil
+import sys
+import time
+import unittest
+
+CHUNK_SIZE = 256 * 1024
+LINE_LIMIT = 64 * 1024 * 1024
+
+DEFAULT_PROTOCOL_VERSION = "2025-03-26"
+
+
+def server_argv(command: str) -> list[str]:
+    """
+    Splits a server command line and resolves the executable on PATH,
+    so it can be started without a shell (npx is npx.cmd on Windows).
+    """
+    argv = shlex.split(command, posix=os.name != "nt")
+    if argv:
+        argv[0] = shutil.which(argv[0]) or argv[0]
+    return argv
+
+
+def server_env() -> dict:
+    return {**os.environ, "GITHUB_TOKEN": os.getenv("GITHUB_TOKEN", "")}
+
+
+async def spawn_server(command: str, limit: int = LINE_LIMIT):
+    """Starts an MCP server with piped stdin/stdout; stderr goes to ours."""
+    return await asyncio.create_subprocess_exec(
+        *server_argv(command),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        env=server_env(),
+        limit=limit,
+    )
+
+
+async def stop_server(process, timeout: float = 5.0):
+    if process.returncode is not None:
+        return
+    if process.stdin and not process.stdin.is_closing():
+        process.stdin.close()
+    try:
+        await asyncio.wait_for(process.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+class WarmServer:
+    """A started and initialized server waiting in the pool."""
+
+    def __init__(self, process, init_result, protocol_version):
+        self.process = process
+        self.init_result = init_result
+        self.protocol_version = protocol_version
+        self.started_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+class WarmPool:
+    """
+    Keeps `size` initialized MCP servers ready and hands one out per connection.
+
+    Args:
+        command: The server command line.
+        size: Number of warm servers to keep.
+        idle_timeout: Close a session after this many seconds without traffic (0 disables).
+        max_lifetime: Retire a server after this many seconds (0 disables).
+        protocol_version: The protocol version used to pre-initialize servers.
+        capabilities: The client capabilities used to pre-initialize servers.
+        init_timeout: Seconds to wait for a server's initialize response.
+
+    Clients whose protocol version or capabilities differ from the pre-initialization
+    get a cold-started server of their own, so the server sees their real initialize.
+    """
+
+    def __init__(
+        self,
+        command: str,
+        size: int = 2,
+        idle_timeout: float = 600,
+        max_lifetime: float = 3600,
+        protocol_version: str = DEFAULT_PROTOCOL_VERSION,
+        capabilities: dict | None = None,
+        init_timeout: float = 60,
+    ):
+        self.command = command
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.protocol_version = protocol_version
+        self.capabilities = capabilities or {}
+        self.init_timeout = init_timeout
+        self.ready = []
+        self.stats = {"spawned": 0, "warm_hits": 0, "cold_starts": 0, "mismatched": 0, "retired": 0, "failed": 0}
+        self._starting = 0
+        self._wake = None
+        self._task = None
+        self._server = None
+        self._closed = False
+
+    # --- プールの維持 ---
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._maintain())
+
+    async def _maintain(self):
+        while not self._closed:
+            self._retire_expired()
+            missing = self.size - len(self.ready) - self._starting
+            for _ in range(max(missing, 0)):
+                self._starting += 1
+                asyncio.create_task(self._add_warm())
+            try:
+                # 寿命の確認のため定期的にも起きる
+                await asyncio.wait_for(self._wake.wait(), timeout=self._check_interval())
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _check_interval(self) -> float:
+        return max(min(self.max_lifetime / 10, 30.0), 0.05) if self.max_lifetime else 30.0
+
+    def _retire_expired(self):
+        if not self.max_lifetime:
+            return
+        for warm in [w for w in self.ready if w.age() >= self.max_lifetime]:
+            self.ready.remove(warm)
+            self.stats["retired"] += 1
+            asyncio.create_task(stop_server(warm.process))
+
+    async def _add_warm(self):
+        try:
+            warm = await self._start_initialized(self.protocol_version)
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"[pool] サーバーの起動に失敗しました: {e}", file=sys.stderr)
+            # 起動に失敗し続ける場合に負荷をかけないよう少し待つ
+            await asyncio.sleep(1)
+            warm = None
+        finally:
+            self._starting -= 1
+        if warm is None:
+            self._wake.set()
+        elif self._closed:
+            await stop_server(warm.process)
+            self._wake.set()
+        else:
+            self.ready.append(warm)
+
+    async def _start_initialized(self, protocol_version) -> WarmServer:
+        process = await spawn_server(self.command)
+        self.stats["spawned"] += 1
+        try:
+            request = {
+                "jsonrpc": "2.0",
+                "id": 0,
+                "method": "initialize",
+                "params": {
+                    "protocolVersion": protocol_version,
+                    "capabilities": self.capabilities,
+                    "clientInfo": {"name": "mcp_proxy", "version": "1.0"},
+                },
+            }
+            process.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+            await process.stdin.drain()
+            while True:
+                line = await asyncio.wait_for(process.stdout.readline(), timeout=self.init_timeout)
+                if not line:
+                    raise ConnectionError(f"server exited with code {await process.wait()}")
+                message = json.loads(line)
+                if message.get("id") == 0 and "method" not in message:
+                    break
+            if "error" in message:
+                raise RuntimeError(message["error"].get("message", "initialize failed"))
+            process.stdin.write(b'{"jsonrpc":"2.0","method":"notifications/initialized"}\n')
+            await process.stdin.drain()
+        except BaseException:
+            await stop_server(process, timeout=1)
+            raise
+        return WarmServer(process, message["result"], protocol_version)
+
+    # --- 接続の処理 ---
+
+    def acquire(self, protocol_version, capabilities=None) -> WarmServer | None:
+        """
+        Takes a warm server, or None when none is ready or the client's
+        protocol version or capabilities differ from the pre-initialization.
+        """
+        if protocol_version != self.protocol_version or (capabilities or {}) != self.capabilities:
+            # プールはそのままにして、このクライアントだけその場で起動する
+            self.stats["mismatched"] += 1
+            return None
+        self._retire_expired()
+        warm = self.ready.pop(0) if self.ready else None
+        self._wake.set()
+        return warm
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        process = None
+        try:
+            first = await reader.readline()
+            if not first:
+                return
+            try:
+                message = json.loads(first)
+            except ValueError:
+                message = {}
+            warm = None
+            if isinstance(message, dict) and message.get("method") == "initialize" and "id" in message:
+                params = message.get("params") or {}
+                warm = self.acquire(params.get("protocolVersion"), params.get("capabilities"))
+            if warm is not None:
+                self.stats["warm_hits"] += 1
+                process = warm.process
+                started_at = warm.started_at
+                response = {"jsonrpc": "2.0", "id": message["id"], "result": warm.init_result}
+                writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                # サーバーには初期化済みの通知を送ってあるので、クライアントの通知は捨てる
+                second = await reader.readline()
+                if second and b"notifications/initialized" not in second:
+                    process.stdin.write(second)
+            else:
+                # 準備できたサーバーがない: その場で起動し、initialize もそのまま転送する
+                self.stats["cold_starts"] += 1
+                process = await spawn_server(self.command)
+                self.stats["spawned"] += 1
+                started_at = time.monotonic()
+                process.stdin.write(first)
+            await self._relay(reader, writer, process, started_at)
+        except (ConnectionError, OSError) as e:
+            print(f"[pool] セッションエラー: {e}", file=sys.stderr)
+        finally:
+            writer.close()
+            if process is not None:
+                await stop_server(process)
+
+    async def _relay(self, reader, writer, process, started_at):
+        last_activity = time.monotonic()
+
+        async def copy(read, write, drain, on_eof=None):
+            nonlocal last_activity
+            while True:
+                data = await read(CHUNK_SIZE)
+                if not data:
+                    break
+                last_activity = time.monotonic()
+                write(data)
+                await drain()
+            if on_eof:
+                on_eof()
+
+        tasks = [
+            asyncio.create_task(copy(reader.read, process.stdin.write, process.stdin.drain, process.stdin.close)),
+            asyncio.create_task(copy(process.stdout.read, writer.write, writer.drain)),
+        ]
+        try:
+            while not tasks[1].done():
+                now = time.monotonic()
+                if self.idle_timeout and now - last_activity >= self.idle_timeout:
+                    print("[pool] 通信がないためセッションを閉じます", file=sys.stderr)
+                    break
+                if self.max_lifetime and now - started_at >= self.max_lifetime:
+                    print("[pool] 最大寿命に達したためセッションを閉じます", file=sys.stderr)
+                    self.stats["retired"] += 1
+                    break
+                await asyncio.wait([tasks[1]], timeout=self._check_interval())
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def serve(self, path: str):
+        self.start()
+        if os.path.exists(path):
+            os.remove(path)
+        self._server = await asyncio.start_unix_server(self.handle_client, path, limit=LINE_LIMIT)
+        os.chmod(path, 0o600)
+        print(f"[pool] {path} で待ち受けています (ウォームプール {self.size} 個)", file=sys.stderr)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def close(self):
+        self._closed = True
+        if self._server:
+            self._server.close()
+        if self._wake:
+            self._wake.set()
+        if self._task:
+            await self._task
+        for warm in self.ready:
+            await stop_server(warm.process)
+        self.ready.clear()
+
+
+class TestWarmPool(unittest.TestCase):
+    SERVER = (
+        "import json, os, sys\n"
+        "for line in sys.stdin:\n"
+        "    m = json.loads(line)\n"
+        "    if 'id' not in m: continue\n"
+        "    if m['method'] == 'initialize':\n"
+        "        r = {'protocolVersion': m['params']['protocolVersion'], 'clientCapabilities': m['params'].get('capabilities'),\n"
+        "             'serverInfo': {'name': 'echo', 'version': str(os.getpid())}}\n"
+        "    else:\n"
+        "        r = {'echo': m['params']}\n"
+        "    print(json.dumps({'jsonrpc': '2.0', 'id': m['id'], 'result': r}), flush=True)\n"
+    )
+
+    def test_hands_out_warm_servers_and_replenishes(self):
+        import tempfile
+
+        async def session(path, protocol_version, capabilities=None):
+            reader, writer = await asyncio.open_unix_connection(path)
+
+            async def send(message):
+                writer.write(json.dumps({"jsonrpc": "2.0", **message}).encode() + b"\n")
+
+            params = {"protocolVersion": protocol_version, "capabilities": capabilities or {}}
+            await send({"id": 7, "method": "initialize", "params": params})
+            init = json.loads(await reader.readline())
+            await send({"method": "notifications/initialized"})
+            await send({"id": 8, "method": "tools/call", "params": {"name": "x"}})
+            echo = json.loads(await reader.readline())
+            writer.close()
+            return init, echo
+
+        async def run():
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "pool.sock")
+                command = f"{shlex.quote(sys.executable)} -u -c {shlex.quote(self.SERVER)}"
+                pool = WarmPool(command, size=2, protocol_version="2025-03-26")
+                serve = asyncio.create_task(pool.serve(path))
+                while len(pool.ready) < 2:
+                    await asyncio.sleep(0.05)
+                warm = await session(path, "2025-03-26")
+                while len(pool.ready) < 2:
+                    await asyncio.sleep(0.05)
+                ready = list(pool.ready)
+                cold = await session(path, "2024-11-05")
+                roots = await session(path, "2025-03-26", {"roots": {"listChanged": True}})
+                # 条件の違うクライアントが来ても、用意したサーバーは捨てない
+                kept = all(warm in pool.ready for warm in ready)
+                serve.cancel()
+                await asyncio.gather(serve, return_exceptions=True)
+                return warm, cold, roots, kept, pool.stats
+
+        (init, echo), (cold_init, cold_echo), (roots_init, _), kept, stats = asyncio.run(run())
+        self.assertEqual(init["id"], 7)
+        self.assertEqual(echo, {"jsonrpc": "2.0", "id": 8, "result": {"echo": {"name": "x"}}})
+        self.assertEqual(cold_init["result"]["protocolVersion"], "2024-11-05")
+        self.assertEqual(cold_echo["id"], 8)
+        # capabilities の違うクライアントの initialize はサーバーまで届く
+        self.assertEqual(roots_init["result"]["clientCapabilities"], {"roots": {"listChanged": True}})
+        self.assertTrue(kept)
+        self.assertEqual(stats["warm_hits"], 1)
+        self.assertEqual((stats["cold_starts"], stats["mismatched"]), (2, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
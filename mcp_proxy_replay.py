@@ -0,0 +1,253 @@
+# mcp_proxy の記録・再生モード
+#
+# 記録 (mcp_proxy.py --record session.jsonl.gz -- <server command>):
+#   プロキシを通るセッションを、リクエストとレスポンスの組と応答時間だけの小さなファイルに保存します。
+# 再生 (mcp_proxy.py --replay session.jsonl.gz [--replay-speed 1.0]):
+#   本物のサーバーを起動せず、記録したレスポンスで答える標準入出力の MCP サーバーとして動きます。
+#   GitHub や npx なしで、MCP を使うエージェントを決まった結果・決まった応答時間でベンチマークできます。
+#
+# ファイル形式 (JSON Lines, 拡張子が .gz なら gzip 圧縮):
+#   {"type": "header", "version": 1, "command": "npx ...", "recorded_at": 1715212800.0}
+#   {"type": "call", "method": "tools/call", "params": {...}, "result": {...}, "ms": 182.4}
+#   {"type": "notify", "message": {"jsonrpc": "2.0", "method": "notifications/tools/list_changed"}}
+# notify は直前の call のレスポンスの後に再生します。
+
+import asyncio
+import gzip
+import json
+import sys
+import time
+import unittest
+from collections import defaultdict
+
+FORMAT_VERSION = 1
+LINE_LIMIT = 64 * 1024 * 1024
+JSONRPC_NO_RECORDING = -32001
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _params_key(method, params) -> str:
+    # initialize の clientInfo などはクライアントごとに違うので、メソッドだけで照合する
+    if method == "initialize":
+        return method
+    if isinstance(params, dict):
+        params = {k: v for k, v in params.items() if k != "_meta"}
+    return method + "\n" + json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+
+class SessionRecorder:
+    """
+    Records request/response pairs seen by the proxy.
+
+    `observe()` is a proxy tee: it only timestamps chunks; pairing and writing
+    happen in `close()`, off the event loop.
+    """
+
+    def __init__(self, path: str, command: str = ""):
+        self.path = path
+        self.command = command
+        self._chunks = []
+
+    def observe(self, direction: str, data: bytes):
+        if direction in ("to_server", "from_server"):
+            self._chunks.append((time.perf_counter(), direction, data))
+
+    def records(self):
+        yield {"type": "header", "version": FORMAT_VERSION, "command": self.command, "recorded_at": time.time()}
+        partial = {}
+        pending = {}
+        for timestamp, direction, data in self._chunks:
+            lines = (partial.pop(direction, b"") + data).split(b"\n")
+            if lines[-1]:
+                partial[direction] = lines[-1]
+            for line in lines[:-1]:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                if direction == "to_server":
+                    if "method" in message and "id" in message:
+                        pending[json.dumps(message["id"])] = (timestamp, message)
+                elif "method" in message:
+                    if "id" not in message:
+                        yield {"type": "notify", "message": message}
+                else:
+                    request = pending.pop(json.dumps(message.get("id")), None)
+                    if request is None:
+                        continue
+                    started, request_message = request
+                    record = {"type": "call", "method": request_message["method"]}
+                    if "params" in request_message:
+                        record["params"] = request_message["params"]
+                    for key in ("result", "error"):
+                        if key in message:
+                            record[key] = message[key]
+                    record["ms"] = round((timestamp - started) * 1000, 3)
+                    yield record
+
+    def write(self):
+        with _open(self.path, "w") as f:
+            for record in self.records():
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    async def close(self):
+        await asyncio.to_thread(self.write)
+        print(f"記録を保存しました: {self.path}", file=sys.stderr)
+
+
+class ReplayServer:
+    """
+    Answers MCP requests from a recording.
+
+    Requests are matched on method and params; tools/call falls back to the
+    first recording of the same tool, so agents whose arguments vary between
+    runs still get an answer. Repeated requests get the recordings in order
+    and then the last one again.
+
+    Args:
+        path: The recording file.
+        speed: Multiplier for the recorded response times (0 answers immediately).
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.speed = speed
+        self.calls = defaultdict(list)
+        self.tools = {}
+        self.header = {}
+        self.stats = {"exact": 0, "fallback": 0, "missing": 0}
+        self._used = defaultdict(int)
+        self._tasks = set()
+        self.load(path)
+
+    def load(self, path):
+        last = None
+        with _open(path, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "header":
+                    self.header = record
+                elif record["type"] == "call":
+                    record["notifications"] = []
+                    self.calls[_params_key(record["method"], record.get("params"))].append(record)
+                    if record["method"] == "tools/call":
+                        self.tools.setdefault((record.get("params") or {}).get("name"), record)
+                    last = record
+                elif record["type"] == "notify" and last is not None:
+                    last["notifications"].append(record["message"])
+
+    def find(self, method, params):
+        key = _params_key(method, params)
+        recordings = self.calls.get(key)
+        if recordings:
+            self.stats["exact"] += 1
+            index = self._used[key]
+            self._used[key] += 1
+            return recordings[min(index, len(recordings) - 1)]
+        if method == "tools/call" and isinstance(params, dict) and params.get("name") in self.tools:
+            self.stats["fallback"] += 1
+            return self.tools[params["name"]]
+        self.stats["missing"] += 1
+        return None
+
+    def handle(self, message: dict, write):
+        """Handles one client message; `write` takes one encoded line."""
+        if "id" not in message or "method" not in message:
+            return
+        if message["method"] == "ping":
+            write(_encode({"jsonrpc": "2.0", "id": message["id"], "result": {}}))
+            return
+        task = asyncio.create_task(self._respond(message, write))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _respond(self, message, write):
+        record = self.find(message["method"], message.get("params"))
+        if record is None:
+            write(_encode({
+                "jsonrpc": "2.0",
+                "id": message["id"],
+                "error": {"code": JSONRPC_NO_RECORDING, "message": f"no recording for {message['method']}"},
+            }))
+            return
+        if self.speed:
+            await asyncio.sleep(record["ms"] * self.speed / 1000)
+        response = {"jsonrpc": "2.0", "id": message["id"]}
+        if "error" in record:
+            response["error"] = record["error"]
+        else:
+            response["result"] = record.get("result")
+        write(_encode(response))
+        for notification in record["notifications"]:
+            write(_encode(notification))
+
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=LINE_LIMIT)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        out = sys.stdout.buffer
+
+        def write(data):
+            out.write(data)
+            out.flush()
+
+        while line := await reader.readline():
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(message, dict):
+                self.handle(message, write)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        print(f"再生: {self.stats}", file=sys.stderr)
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class TestRecordReplay(unittest.TestCase):
+    def test_round_trip(self):
+        import os
+        import tempfile
+
+        recorder = SessionRecorder("unused", command="server")
+        recorder._chunks = [
+            (0.000, "to_server", b'{"jsonrpc":"2.0","id":1,"method":"initialize","params":{"clientInfo":{"name":"a"}}}\n'),
+            (0.050, "from_server", b'{"jsonrpc":"2.0","id":1,"result":{"serverInfo":{"name":"github"}}}\n'),
+            (0.060, "to_server", b'{"jsonrpc":"2.0","id":2,"method":"tools/call","params":{"name":"search","arguments":{"q":"sk"}}}\n'),
+            (0.260, "from_server", b'{"jsonrpc":"2.0","id":2,"result":{"content":[{"type":"text","text":"1 repo"}]}}\n'),
+            (0.270, "from_server", b'{"jsonrpc":"2.0","method":"notifications/tools/list_changed"}\n'),
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            recorder.path = os.path.join(tmp_dir, "session.jsonl.gz")
+            recorder.write()
+            replay = ReplayServer(recorder.path, speed=0)
+
+        written = []
+
+        async def run():
+            replay.handle({"jsonrpc": "2.0", "id": "a", "method": "initialize", "params": {"clientInfo": {"name": "b"}}}, written.append)
+            replay.handle({"jsonrpc": "2.0", "id": "b", "method": "tools/call", "params": {"name": "search", "arguments": {"q": "other"}}}, written.append)
+            replay.handle({"jsonrpc": "2.0", "id": "c", "method": "tools/call", "params": {"name": "unknown"}}, written.append)
+            await asyncio.gather(*replay._tasks)
+
+        asyncio.run(run())
+        messages = {m.get("id"): m for m in map(json.loads, written)}
+        self.assertEqual(messages["a"]["result"]["serverInfo"]["name"], "github")
+        self.assertEqual(messages["b"]["result"]["content"][0]["text"], "1 repo")
+        self.assertEqual(messages["c"]["error"]["code"], JSONRPC_NO_RECORDING)
+        self.assertEqual(messages[None]["method"], "notifications/tools/list_changed")
+        self.assertEqual(replay.stats, {"exact": 1, "fallback": 1, "missing": 1})
+        self.assertAlmostEqual(replay.calls["initialize"][0]["ms"], 50, places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,296 @@
+# mcp_proxy 用の JSON-RPC レイテンシ計測
+#
+# プロキシを通る JSON-RPC フレームを解析し、レスポンスをリクエストの id と突き合わせて
+# メソッドごと・ツール名ごと (tools/call の params.name) のレイテンシのヒストグラムと
+# ペイロードサイズを集計します。
+# 集計結果は定期的に JSON ファイルへ書き出すほか、ローカルの HTTP エンドポイントでも取得できます。
+#
+#   curl http://127.0.0.1:9464/stats
+
+import asyncio
+import json
+import os
+import threading
+import time
+import unittest
+
+# ヒストグラムのバケット上限 (ミリ秒)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    """A fixed-bucket latency histogram with count/sum/min/max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, ms: float):
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+
+    def percentile(self, pct: float) -> float | None:
+        """Upper bound of the bucket holding the percentile (capped at max)."""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "min_ms": round(self.min, 3) if self.min is not None else None,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 3) if self.max is not None else None,
+            "buckets": {f"le_{bound}": count for bound, count in zip(BUCKETS_MS, self.counts)}
+            | {"le_inf": self.counts[-1]},
+        }
+
+
+class CallStats:
+    """Latency and payload size stats for one method or tool."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.request_bytes = 0
+        self.request_bytes_max = 0
+        self.response_bytes = 0
+        self.response_bytes_max = 0
+
+    def add(self, ms, request_bytes, response_bytes, error):
+        self.latency.add(ms)
+        self.errors += 1 if error else 0
+        self.request_bytes += request_bytes
+        self.request_bytes_max = max(self.request_bytes_max, request_bytes)
+        self.response_bytes += response_bytes
+        self.response_bytes_max = max(self.response_bytes_max, response_bytes)
+
+    def summary(self) -> dict:
+        count = self.latency.count or 1
+        return {
+            **self.latency.summary(),
+            "errors": self.errors,
+            "request_bytes_avg": round(self.request_bytes / count),
+            "request_bytes_max": self.request_bytes_max,
+            "response_bytes_avg": round(self.response_bytes / count),
+            "response_bytes_max": self.response_bytes_max,
+        }
+
+
+class JsonRpcLatencyTracker:
+    """
+    Matches JSON-RPC responses to requests by id and aggregates latency.
+
+    `observe()` is cheap and called on the forwarding path with the time the
+    chunk was seen; frames are parsed later in a worker thread by `process()`.
+
+    Directions are the proxy pump names: "to_server" carries client requests
+    and "from_server" carries server responses (and vice versa for requests
+    the server sends to the client).
+    """
+
+    def __init__(self, summary_path: str | None = None, interval: float = 10.0):
+        self.summary_path = summary_path
+        self.interval = interval
+        self.started_at = time.time()
+        self.methods = {}
+        self.tools = {}
+        self.notifications = {}
+        self.unmatched_responses = 0
+        self.parse_errors = 0
+        self._pending = {"to_server": {}, "from_server": {}}
+        self._partial = {}
+        self._queue = []
+        self._lock = threading.Lock()
+        self._task = None
+        self._closed = False
+
+    # --- イベントループ側 (ホットパス) ---
+
+    def observe(self, direction: str, data: bytes, timestamp: float | None = None):
+        if direction in self._pending:
+            self._queue.append((timestamp or time.perf_counter(), direction, data))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        last_written = time.monotonic()
+        while not self._closed:
+            await asyncio.sleep(min(0.2, self.interval))
+            await self.drain()
+            if self.summary_path and time.monotonic() - last_written >= self.interval:
+                await asyncio.to_thread(self.write_summary)
+                last_written = time.monotonic()
+
+    async def drain(self):
+        if self._queue:
+            batch, self._queue = self._queue, []
+            await asyncio.to_thread(self.process, batch)
+
+    async def close(self):
+        self._closed = True
+        if self._task:
+            await self._task
+        await self.drain()
+        if self.summary_path:
+            await asyncio.to_thread(self.write_summary)
+
+    # --- ワーカースレッド側 ---
+
+    def process(self, batch):
+        with self._lock:
+            for timestamp, direction, data in batch:
+                text = self._partial.pop(direction, b"") + data
+                lines = text.split(b"\n")
+                if lines[-1]:
+                    self._partial[direction] = lines[-1]
+                for line in lines[:-1]:
+                    if line.strip():
+                        self._handle_line(timestamp, direction, line)
+
+    def _handle_line(self, timestamp, direction, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            self.parse_errors += 1
+            return
+        # JSON-RPC のバッチ (配列) にも対応する
+        for frame in message if isinstance(message, list) else [message]:
+            if isinstance(frame, dict):
+                self._handle_frame(timestamp, direction, frame, len(line) + 1)
+
+    def _handle_frame(self, timestamp, direction, frame, size):
+        method = frame.get("method")
+        frame_id = frame.get("id")
+        if method is not None and frame_id is None:
+            self.notifications[method] = self.notifications.get(method, 0) + 1
+            return
+        if method is not None:
+            params = frame.get("params") or {}
+            tool = params.get("name") if method == "tools/call" and isinstance(params, dict) else None
+            self._pending[direction][_id_key(frame_id)] = (timestamp, method, tool, size)
+            return
+        # レスポンスは逆方向のリクエストと突き合わせる
+        request_direction = "from_server" if direction == "to_server" else "to_server"
+        request = self._pending[request_direction].pop(_id_key(frame_id), None)
+        if request is None:
+            self.unmatched_responses += 1
+            return
+        started, method, tool, request_size = request
+        ms = (timestamp - started) * 1000
+        # tools/call はツールの失敗を result.isError で返す
+        result = frame.get("result")
+        error = "error" in frame or (isinstance(result, dict) and bool(result.get("isError")))
+        self.methods.setdefault(method, CallStats()).add(ms, request_size, size, error)
+        if tool:
+            self.tools.setdefault(tool, CallStats()).add(ms, request_size, size, error)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "generated_at": time.time(),
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "methods": {name: stats.summary() for name, stats in sorted(self.methods.items())},
+                "tools": {name: stats.summary() for name, stats in sorted(self.tools.items())},
+                "notifications": dict(self.notifications),
+                "in_flight": sum(len(pending) for pending in self._pending.values()),
+                "unmatched_responses": self.unmatched_responses,
+                "parse_errors": self.parse_errors,
+            }
+
+    def write_summary(self):
+        # 読み手が書きかけのファイルを見ないよう、一時ファイルから置き換える
+        tmp_path = self.summary_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.summary_path)
+
+
+def _id_key(frame_id):
+    # 1 と "1" は別の id として扱う
+    return (type(frame_id).__name__, frame_id) if isinstance(frame_id, (int, str)) else json.dumps(frame_id)
+
+
+async def start_stats_server(tracker: JsonRpcLatencyTracker, host: str = "127.0.0.1", port: int = 9464):
+    """
+    Serves the tracker summary as JSON on GET / and GET /stats.
+    A minimal HTTP/1.0 responder so the proxy needs no web framework.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] in ("/", "/stats"):
+                status = "200 OK"
+                body = json.dumps(await asyncio.to_thread(tracker.summary), ensure_ascii=False).encode("utf-8")
+            else:
+                status = "404 Not Found"
+                body = b'{"error": "not found"}'
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+class TestJsonRpcLatencyTracker(unittest.TestCase):
+    def test_matches_responses_by_id(self):
+        tracker = JsonRpcLatencyTracker()
+        tracker.process(
+            [
+                (0.000, "to_server", b'{"jsonrpc":"2.0","id":1,"method":"initialize","params":{}}\n'),
+                (0.000, "to_server", b'{"jsonrpc":"2.0","id":2,"method":"tools/call","params":{"name":"search_repos"}}\n'),
+                (0.010, "from_server", b'{"jsonrpc":"2.0","id":1,"result":{}}\n{"jsonrpc":"2.0",'),
+                (0.250, "from_server", b'"id":2,"result":{"content":[]}}\n'),
+                (0.300, "from_server", b'{"jsonrpc":"2.0","method":"notifications/tools/list_changed"}\n'),
+            ]
+        )
+        summary = tracker.summary()
+        self.assertEqual(summary["methods"]["initialize"]["count"], 1)
+        self.assertAlmostEqual(summary["methods"]["initialize"]["max_ms"], 10, places=3)
+        self.assertEqual(summary["tools"]["search_repos"]["p50_ms"], 250)
+        self.assertEqual(summary["notifications"], {"notifications/tools/list_changed": 1})
+        self.assertEqual(summary["in_flight"], 0)
+
+    def test_counts_errors(self):
+        tracker = JsonRpcLatencyTracker()
+        tracker.process(
+            [
+                (0.0, "to_server", b'{"jsonrpc":"2.0","id":"a","method":"tools/call","params":{"name":"x"}}\n'),
+                (0.1, "from_server", b'{"jsonrpc":"2.0","id":"a","error":{"code":-32602,"message":"bad"}}\n'),
+            ]
+        )
+        self.assertEqual(tracker.summary()["tools"]["x"]["errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,262 @@
+# MCP ツールのスキーマをディスクにキャッシュし、接続前にカーネルへ登録する
+#
+# simplemcp_client.py や consoleapp_chatagent_mcp*.py は起動時に session.initialize() と
+# list_tools() を待ってからでないとエージェントが答えられません。
+# 前回取得したツールのスキーマをサーバーの識別情報 (コマンドや URL) とバージョンをキーに保存しておき、
+# 起動時はキャッシュからすぐに登録して、実際の接続はバックグラウンドか最初のツール呼び出し時に行います。
+# 接続後に取得した一覧がキャッシュと違えば、キャッシュとカーネルの登録を更新します。
+#
+#   plugin = CachedMCPStdioPlugin(name="github", command="npx", args=["--yes", "@modelcontextprotocol/server-github"])
+#   await plugin.start()          # キャッシュがあれば接続を待たない
+#   kernel.add_plugin(plugin)
+#   ...
+#   await plugin.close()
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import unittest
+
+from mcp import types
+from semantic_kernel.connectors.mcp import MCPPluginBase, MCPSsePlugin, MCPStdioPlugin
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".mcp_tool_cache")
+
+
+class ToolSchemaCache:
+    """
+    One cached tool list per server identity and version.
+
+    Args:
+        identity: What identifies the server, e.g. its command line or URL.
+        version: The server version; pin it (e.g. the npm package version) so
+            an upgrade starts from an empty cache instead of a stale one.
+        cache_dir: Where the cache files live.
+    """
+
+    def __init__(self, identity: str, version: str = "", cache_dir: str | None = None):
+        self.identity = identity
+        self.version = version
+        digest = hashlib.sha256(f"{identity}\n{version}".encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, f"tools_{digest}.json")
+
+    def load(self) -> list[dict] | None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("identity") != self.identity or data.get("version") != self.version:
+            return None
+        return data.get("tools")
+
+    def save(self, tools: list[dict]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"identity": self.identity, "version": self.version, "tools": tools}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class _StaticToolList:
+    """Stands in for the MCP session so MCPPluginBase.load_tools registers a given list."""
+
+    def __init__(self, result: types.ListToolsResult):
+        self.result = result
+
+    async def list_tools(self):
+        return self.result
+
+
+def _dump_tools(result: types.ListToolsResult) -> list[dict]:
+    return [tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in result.tools]
+
+
+class CachedToolsMixin:
+    """
+    Registers MCP tools from a ToolSchemaCache before the server is connected.
+
+    Mix it in before an MCP*Plugin class. Extra keyword arguments:
+        tool_cache: The cache to use; built from the server identity when omitted.
+        server_version: Passed to ToolSchemaCache when tool_cache is omitted.
+        connect_mode: "background" connects right after start(); "lazy" waits
+            for the first tool call.
+    """
+
+    def __init__(self, *args, tool_cache: ToolSchemaCache | None = None, server_version: str = "",
+                 connect_mode: str = "background", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tool_cache = tool_cache or ToolSchemaCache(self.server_identity(), server_version)
+        self.connect_mode = connect_mode
+        self.cached_tools = None
+        self._connect_task = None
+        self._connect_lock = asyncio.Lock()
+
+    def server_identity(self) -> str:
+        url = getattr(self, "url", None)
+        if url:
+            return str(url)
+        return " ".join([str(getattr(self, "command", "")), *map(str, getattr(self, "args", None) or [])])
+
+    async def start(self):
+        """
+        Registers cached tools and connects in the background (or lazily).
+        Without a cache, connects now so the tools can be listed and cached.
+        """
+        self.cached_tools = self.tool_cache.load()
+        if self.cached_tools is None:
+            await self.connect()
+            return self
+        await self._register_tools(types.ListToolsResult(tools=[types.Tool(**tool) for tool in self.cached_tools]))
+        if self.connect_mode == "background":
+            self._connect_task = asyncio.create_task(self._connect_in_background())
+        return self
+
+    async def _connect_in_background(self):
+        try:
+            await self.connect()
+        except Exception as e:
+            # 最初のツール呼び出しでもう一度接続を試みる
+            logger.warning("Background connect to MCP server '%s' failed: %s", self.name, e)
+
+    async def connect(self):
+        await super().connect()
+        if self.kernel is not None:
+            # カーネルは add_plugin した時点の関数一覧を持つので、接続後の一覧で登録し直す
+            self.kernel.add_plugin(self)
+
+    async def ensure_connected(self):
+        async with self._connect_lock:
+            if self.session is not None:
+                return
+            if self._connect_task is not None:
+                task, self._connect_task = self._connect_task, None
+                await task
+                if self.session is not None:
+                    return
+            await self.connect()
+
+    async def _register_tools(self, result: types.ListToolsResult):
+        # 名前の正規化や衝突の扱いは Semantic Kernel の load_tools に任せる。
+        # _StaticToolList.list_tools は待機しないので、差し替え中に他のタスクが session を見ることはない
+        session, self.session = self.session, _StaticToolList(result)
+        try:
+            await MCPPluginBase.load_tools(self)
+        finally:
+            self.session = session
+
+    async def load_tools(self):
+        """Loads the live tool list, registers it and refreshes the cache."""
+        try:
+            result = await self.session.list_tools()
+        except Exception:
+            return
+        await self._register_tools(result)
+        tools = _dump_tools(result)
+        if tools == self.cached_tools:
+            return
+        if self.cached_tools is not None:
+            self._unregister_removed(tools)
+            logger.info("MCP tool cache for '%s' was stale; updated.", self.name)
+        self.cached_tools = tools
+        try:
+            self.tool_cache.save(tools)
+        except OSError as e:
+            logger.warning("Failed to save MCP tool cache: %s", e)
+
+    def _unregister_removed(self, tools: list[dict]):
+        live = {tool["name"] for tool in tools}
+        registered = getattr(self, "_mcp_registered_names", None)
+        for tool in self.cached_tools:
+            if tool["name"] in live:
+                continue
+            local_names = [n for n, owner in (registered or {}).items() if owner == ("tool", tool["name"])]
+            for local_name in local_names or [tool["name"]]:
+                if local_name in vars(self):
+                    delattr(self, local_name)
+                if registered is not None:
+                    registered.pop(local_name, None)
+
+    async def call_tool(self, tool_name: str, **kwargs):
+        await self.ensure_connected()
+        return await super().call_tool(tool_name, **kwargs)
+
+    async def get_prompt(self, prompt_name: str, **kwargs):
+        await self.ensure_connected()
+        return await super().get_prompt(prompt_name, **kwargs)
+
+    async def close(self):
+        if self._connect_task is not None:
+            await asyncio.gather(self._connect_task, return_exceptions=True)
+            self._connect_task = None
+        await super().close()
+
+
+class CachedMCPStdioPlugin(CachedToolsMixin, MCPStdioPlugin):
+    """MCPStdioPlugin whose tools are registered from the schema cache."""
+
+
+class CachedMCPSsePlugin(CachedToolsMixin, MCPSsePlugin):
+    """MCPSsePlugin whose tools are registered from the schema cache."""
+
+
+class TestCachedMCPStdioPlugin(unittest.TestCase):
+    SERVER = (
+        "import sys\n"
+        "from mcp.server.fastmcp import FastMCP\n"
+        "mcp = FastMCP('calc')\n"
+        "@mcp.tool()\n"
+        "def add(a: int, b: int) -> int:\n"
+        "    '''Adds two numbers.'''\n"
+        "    return a + b\n"
+        "if len(sys.argv) > 1:\n"
+        "    @mcp.tool()\n"
+        "    def sub(a: int, b: int) -> int:\n"
+        "        '''Subtracts b from a.'''\n"
+        "        return a - b\n"
+        "mcp.run()\n"
+    )
+
+    def test_registers_from_cache_and_reconciles(self):
+        import sys
+        import tempfile
+
+        from semantic_kernel import Kernel
+
+        async def run(cache_dir):
+            cache = ToolSchemaCache("calc", cache_dir=cache_dir)
+
+            # 1回目: キャッシュがないので接続して一覧を保存する
+            first = CachedMCPStdioPlugin(name="calc", command=sys.executable, args=["-c", self.SERVER], tool_cache=cache, load_prompts=False)
+            await first.start()
+            self.assertIsNotNone(first.session)
+            await first.close()
+
+            # 2回目: 接続前にキャッシュから登録され、最初の呼び出しで接続する
+            kernel = Kernel()
+            second = CachedMCPStdioPlugin(
+                name="calc", command=sys.executable, args=["-c", self.SERVER, "v2"], tool_cache=cache,
+                load_prompts=False, connect_mode="lazy",
+            )
+            await second.start()
+            self.assertIsNone(second.session)
+            kernel.add_plugin(second)
+            result = await kernel.invoke(plugin_name="calc", function_name="add", a=2, b=3)
+            # 接続後の一覧 (sub が増えた) でキャッシュとカーネルが更新される
+            names = sorted(kernel.plugins["calc"].functions)
+            await second.close()
+            return str(result.value[0]), names, [tool["name"] for tool in cache.load()]
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            value, names, cached = asyncio.run(run(cache_dir))
+        self.assertEqual(value, "5")
+        self.assertEqual(names, ["add", "sub"])
+        self.assertEqual(sorted(cached), ["add", "sub"])
+
+
+if __name__ == "__main__":
+    unittest.main()
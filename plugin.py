@@ -3,19 +3,106 @@ from semantic_kernel.functions import kernel_function
 import json
 import aiohttp
 import os
+import json_offload
 from typing import Annotated
 from semantic_kernel.functions import kernel_function
 from datetime import datetime, timedelta
 import unittest
 import asyncio
+import tempfile
+from pydantic import BaseModel
+
+
+DEFAULT_LIGHTS = [
+    {"id": 1, "name": "Table Lamp", "is_on": False},
+    {"id": 2, "name": "Porch light", "is_on": False},
+    {"id": 3, "name": "Chandelier", "is_on": True},
+]
+
+
+class LightChange(BaseModel):
+    id: int
+    is_on: bool
+
+
+class LightStateStore:
+    """
+    An asyncio-safe store of light states keyed by id.
+
+    Changes are applied under a lock and published as events to every
+    subscriber queue, so consumers don't have to poll get_lights.
+    """
+
+    def __init__(self, lights=None, max_queue_size: int = 100):
+        self._lights = {light["id"]: dict(light) for light in (DEFAULT_LIGHTS if lights is None else lights)}
+        self._lock = asyncio.Lock()
+        self._subscribers = set()
+        self.max_queue_size = max_queue_size
+
+    def snapshot(self) -> list[dict]:
+        """
+        Returns a copy of all lights, safe to hand out to callers.
+        """
+        return [dict(light) for light in self._lights.values()]
+
+    def get(self, id: int) -> dict | None:
+        light = self._lights.get(id)
+        return dict(light) if light else None
+
+    async def set_state(self, id: int, is_on: bool) -> dict | None:
+        """
+        Changes the state of a single light. Returns None for unknown ids.
+        """
+        updated = await self.set_states([LightChange(id=id, is_on=is_on)])
+        return updated[0] if updated else None
+
+    async def set_states(self, changes: list[LightChange]) -> list[dict]:
+        """
+        Applies several changes atomically and returns the updated lights.
+        Unknown ids are skipped.
+        """
+        updated = []
+        events = []
+        async with self._lock:
+            for change in changes:
+                light = self._lights.get(change.id)
+                if light is None:
+                    continue
+                if light["is_on"] != change.is_on:
+                    light["is_on"] = change.is_on
+                    events.append({"type": "light_changed", **light})
+                updated.append(dict(light))
+        for event in events:
+            self._publish(event)
+        return updated
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Returns a queue that receives an event for every state change.
+        """
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self, event: dict):
+        for queue in self._subscribers:
+            if queue.full():
+                # Slow consumers lose the oldest events rather than blocking writers
+                queue.get_nowait()
+            queue.put_nowait(event)
 
 
 class LightsPlugin:
-    lights = [
-        {"id": 1, "name": "Table Lamp", "is_on": False},
-        {"id": 2, "name": "Porch light", "is_on": False},
-        {"id": 3, "name": "Chandelier", "is_on": True},
-    ]
+    def __init__(self, store: LightStateStore | None = None):
+        # Pass the same store to several plugins to share light state between them
+        self.store = store or LightStateStore()
+
+    @property
+    def lights(self) -> list[dict]:
+        return self.store.snapshot()
 
     @kernel_function(
         name="get_lights",
@@ -25,23 +112,30 @@ class LightsPlugin:
         self,
     ) -> str:
         """Gets a list of lights and their current state."""
-        return self.lights
+        return self.store.snapshot()
 
     @kernel_function(
         name="change_state",
         description="Changes the state of the light",
     )
-    def change_state(
+    async def change_state(
         self,
         id: int,
         is_on: bool,
     ) -> str:
         """Changes the state of the light."""
-        for light in self.lights:
-            if light["id"] == id:
-                light["is_on"] = is_on
-                return light
-        return None
+        return await self.store.set_state(id, is_on)
+
+    @kernel_function(
+        name="change_states",
+        description="Changes the state of several lights at once, e.g. to turn off every light",
+    )
+    async def change_states(
+        self,
+        changes: Annotated[list[LightChange], "The lights to change, each with its id and the new is_on state"],
+    ) -> str:
+        """Changes the state of several lights at once."""
+        return await self.store.set_states(changes)
 
 
 class WeatherPlugin:
@@ -49,9 +143,14 @@ class WeatherPlugin:
     A plugin for retrieving weather forecast information from the Japan Meteorological Agency (JMA).
     """
 
-    def __init__(self, area_codes_file="area_codes.json"):
-        self.area_codes_url = "https://www.jma.go.jp/bosai/common/const/area.json"
-        self.forecast_base_url = "https://www.jma.go.jp/bosai/forecast/data/forecast/"
+    def __init__(
+        self,
+        area_codes_file="area_codes.json",
+        area_codes_url="https://www.jma.go.jp/bosai/common/const/area.json",
+        forecast_base_url="https://www.jma.go.jp/bosai/forecast/data/forecast/",
+    ):
+        self.area_codes_url = area_codes_url
+        self.forecast_base_url = forecast_base_url
         self.area_codes_file = area_codes_file
         self.area_codes = {}
 
@@ -62,22 +161,8 @@ class WeatherPlugin:
         if os.path.exists(self.area_codes_file):
             print("Loading area codes from local file...")
             try:
-                with open(self.area_codes_file, "r", encoding="utf-8") as f:
-                    json_data = json.load(f)
-                    name_to_code = {}
-    
-                    # Process all sections in the JSON data without hardcoding section names
-                    for section_name, section_data in json_data.items():
-                        # Each section contains area codes as keys and area details as values
-                        for area_code, area_details in section_data.items():
-                            # Extract the name and add it to our mapping
-                            if "name" in area_details:
-                                area_name = area_details["name"]
-                                name_to_code[area_name] = area_code
-
-  
-                    # Merge all sections into self.area_codes
-                    self.area_codes = name_to_code
+                json_data = await json_offload.load_file(self.area_codes_file)
+                self.area_codes = self.build_name_to_code(json_data)
 
                 print("Area codes loaded from file.")
                 return
@@ -95,24 +180,37 @@ class WeatherPlugin:
             async with aiohttp.ClientSession() as session:
                 async with session.get(self.area_codes_url) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        self.area_codes.update(data.get("centers", {}))
-                        self.area_codes.update(data.get("offices", {}))
-                        self.area_codes.update(data.get("class10s", {}))
-                        self.area_codes.update(data.get("class15s", {}))
-                        self.save_area_codes(data)
+                        data = await json_offload.loads(await response.read())
+                        self.area_codes = self.build_name_to_code(data)
+                        await self.save_area_codes(data)
                     else:
                         print(f"Failed to load area codes: {response.status}")
         except Exception as e:
             print(f"An error occurred while loading area codes: {e}")
 
-    def save_area_codes(self, data):
+    @staticmethod
+    def build_name_to_code(json_data) -> dict:
+        """
+        Builds an area name to area code mapping from the JMA area.json data.
+        """
+        name_to_code = {}
+
+        # Process all sections in the JSON data without hardcoding section names
+        for section_name, section_data in json_data.items():
+            # Each section contains area codes as keys and area details as values
+            for area_code, area_details in section_data.items():
+                # Extract the name and add it to our mapping
+                if "name" in area_details:
+                    area_name = area_details["name"]
+                    name_to_code[area_name] = area_code
+        return name_to_code
+
+    async def save_area_codes(self, data):
         """
         Saves the area codes to a local file.
         """
         try:
-            with open(self.area_codes_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
+            await json_offload.dump_file(self.area_codes_file, data, ensure_ascii=False, indent=4)
             print(f"Area codes saved to {self.area_codes_file}")
         except Exception as e:
             print(f"An error occurred while saving area codes: {e}")
@@ -143,7 +241,7 @@ class WeatherPlugin:
             async with aiohttp.ClientSession() as session:
                 async with session.get(forecast_url) as response:
                     if response.status == 200:
-                        forecast_data = await response.json()
+                        forecast_data = await json_offload.loads(await response.read())
                         return self.extract_forecast(forecast_data, date)
                     else:
                         return f"Error: Failed to retrieve forecast data for {area_name} (code: {area_code}). Status code: {response.status}"
@@ -257,6 +355,71 @@ class TestFindAreaCode(unittest.TestCase):
         self.assertIsNone(self.weather_plugin.find_area_code("存在しない場所"))
 
 
+class TestLightsPlugin(unittest.TestCase):
+    def test_instances_do_not_share_state(self):
+        first, second = LightsPlugin(), LightsPlugin()
+        asyncio.run(first.change_state(1, True))
+        self.assertTrue(first.store.get(1)["is_on"])
+        self.assertFalse(second.store.get(1)["is_on"])
+
+    def test_empty_store(self):
+        self.assertEqual(LightStateStore([]).snapshot(), [])
+        self.assertEqual(len(LightStateStore().snapshot()), len(DEFAULT_LIGHTS))
+
+    def test_change_states_publishes_events(self):
+        async def run():
+            lights_plugin = LightsPlugin()
+            queue = lights_plugin.store.subscribe()
+            updated = await lights_plugin.change_states(
+                [LightChange(id=1, is_on=False), LightChange(id=3, is_on=False), LightChange(id=99, is_on=False)]
+            )
+            events = [queue.get_nowait() for _ in range(queue.qsize())]
+            return lights_plugin, updated, events
+
+        lights_plugin, updated, events = asyncio.run(run())
+        self.assertEqual([light["id"] for light in updated], [1, 3])
+        # Only the chandelier actually changed
+        self.assertEqual([(event["id"], event["is_on"]) for event in events], [(3, False)])
+        self.assertFalse(any(light["is_on"] for light in lights_plugin.get_state()))
+
+
+class TestWeatherForecast(unittest.TestCase):
+    """Runs WeatherPlugin against the local JMA stand-in (jma_stub_server.py)."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.area_codes_file = os.path.join(self.tmp_dir.name, "area_codes.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def _run_with_stub(self, **stub_options):
+        from jma_stub_server import JMAStubServer
+
+        async with JMAStubServer(**stub_options) as server:
+            weather_plugin = WeatherPlugin(
+                area_codes_file=self.area_codes_file,
+                area_codes_url=server.area_codes_url,
+                forecast_base_url=server.forecast_base_url,
+            )
+            await weather_plugin.load_area_codes()
+            forecast = await weather_plugin.get_weather_forecast("東京都", "2025-05-09")
+            return weather_plugin, forecast
+
+    def test_load_area_codes_from_url(self):
+        weather_plugin, _ = asyncio.run(self._run_with_stub())
+        self.assertEqual(weather_plugin.find_area_code("東京地方"), "130010")
+        self.assertTrue(os.path.exists(self.area_codes_file))
+
+    def test_get_weather_forecast(self):
+        _, forecast = asyncio.run(self._run_with_stub())
+        self.assertEqual(forecast, "The weather forecast for 2025-05-09 is: 晴れ　時々　くもり")
+
+    def test_get_weather_forecast_failure(self):
+        _, forecast = asyncio.run(self._run_with_stub(forecast_dir=self.tmp_dir.name))
+        self.assertIn("Status code: 404", forecast)
+
+
 # Run the tests if the script is executed directly
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,198 @@
+# チャット履歴からテキスト補完用のプロンプトを組み立てる (差分レンダリングとトークン上限つき)
+#
+# GitHubMCPClient は呼び出しのたびに履歴全体を "role: content" の行に変換していたため、
+# 会話が長くなるほど遅くなり、プロンプトの大きさにも上限がありませんでした。
+# ChatPromptBuilder は履歴ごとに変換済みの行とトークン数を覚えておき、増えたメッセージだけを変換します。
+# 上限を超える分は古いメッセージから削ります (system メッセージは残します)。
+#
+#   builder = ChatPromptBuilder(max_tokens=6000)
+#   prompt = builder.build(chat_history)
+#
+# トークン数は tiktoken があればそれで数え、なければ文字種から見積もります。
+
+import bisect
+import logging
+import unittest
+import weakref
+
+from semantic_kernel.contents.chat_history import ChatHistory
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+PINNED_ROLES = ("system", "developer")
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken when it is installed, otherwise estimates them.
+
+    The estimate counts about 4 ASCII characters per token and one token per
+    other character (e.g. Japanese), which errs on the high side for both.
+    """
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                # エンコーディングのファイルを取得できない環境では見積もりに切り替える
+                logger.warning("tiktoken encoding '%s' is unavailable, estimating tokens: %s", encoding, e)
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        ascii_chars = len(text.encode("ascii", "ignore"))
+        return (ascii_chars + 3) // 4 + len(text) - ascii_chars
+
+
+class _RenderedHistory:
+    """Rendered lines and token counts of one chat history."""
+
+    def __init__(self):
+        self.messages = []
+        self.lines = []
+        self.pinned = []
+        # 削れるメッセージのトークン数の累積和 (cumulative[i] は先頭 i 件分)
+        self.cumulative = [0]
+        self.pinned_tokens = 0
+        self.prompt = None
+        self.prompt_start = None
+        self.prompt_length = 0
+
+
+class ChatPromptBuilder:
+    """
+    Builds "role: content" prompts from chat histories, rendering only new messages.
+
+    Args:
+        max_tokens: Token budget of the prompt; None means no limit.
+        counter: The token counter; a TokenCounter by default.
+        suffix: Appended after the history for the model to continue.
+
+    A history is re-rendered from scratch when messages are removed or replaced;
+    call invalidate() after editing a message's content in place.
+    """
+
+    def __init__(self, max_tokens: int | None = None, counter: TokenCounter | None = None, suffix: str = "assistant: "):
+        self.max_tokens = max_tokens
+        self.counter = counter or TokenCounter()
+        self.suffix = suffix
+        self.suffix_tokens = self.counter.count(suffix)
+        self.stats = {"builds": 0, "rendered": 0, "rebuilds": 0, "trimmed": 0}
+        self._cache = {}
+
+    @staticmethod
+    def render(message) -> str:
+        role = "user" if message.role.lower() == "user" else "assistant"
+        return f"{role}: {message.content}\n"
+
+    def build(self, chat_history: ChatHistory) -> str:
+        self.stats["builds"] += 1
+        entry = self._entry(chat_history)
+        messages = chat_history.messages
+        for message in messages[len(entry.messages):]:
+            line = self.render(message)
+            tokens = self.counter.count(line)
+            entry.messages.append(message)
+            entry.lines.append(line)
+            pinned = message.role.lower() in PINNED_ROLES
+            entry.pinned.append(pinned)
+            if pinned:
+                entry.pinned_tokens += tokens
+                tokens = 0
+            entry.cumulative.append(entry.cumulative[-1] + tokens)
+            self.stats["rendered"] += 1
+        return self._assemble(entry)
+
+    def invalidate(self, chat_history: ChatHistory):
+        self._cache.pop(id(chat_history), None)
+
+    def _entry(self, chat_history: ChatHistory) -> _RenderedHistory:
+        key = id(chat_history)
+        cached = self._cache.get(key)
+        if cached is not None:
+            ref, entry = cached
+            messages = chat_history.messages
+            count = len(entry.messages)
+            # 追記だけなら先頭と最後に変換したメッセージは同じオブジェクトのまま残っている
+            if ref() is chat_history and len(messages) >= count and (
+                count == 0 or (messages[0] is entry.messages[0] and messages[count - 1] is entry.messages[-1])
+            ):
+                return entry
+            self.stats["rebuilds"] += 1
+        entry = _RenderedHistory()
+        self._cache[key] = (weakref.ref(chat_history, lambda _, key=key: self._cache.pop(key, None)), entry)
+        return entry
+
+    def _start_index(self, entry: _RenderedHistory) -> int:
+        """Index of the oldest message kept within the token budget."""
+        if self.max_tokens is None:
+            return 0
+        total = entry.cumulative[-1]
+        allowed = self.max_tokens - self.suffix_tokens - entry.pinned_tokens
+        if total <= allowed:
+            return 0
+        # total - cumulative[start] <= allowed となる最小の start
+        start = bisect.bisect_left(entry.cumulative, total - allowed)
+        # 最新のメッセージは上限を超えても残す
+        return min(start, len(entry.lines) - 1)
+
+    def _assemble(self, entry: _RenderedHistory) -> str:
+        start = self._start_index(entry)
+        if start > 0:
+            self.stats["trimmed"] += 1
+        if entry.prompt is not None and entry.prompt_start == start:
+            # 前回のプロンプトに増えた行だけを足す
+            entry.prompt += "".join(entry.lines[entry.prompt_length:])
+        else:
+            kept = [line for line, pinned in zip(entry.lines[:start], entry.pinned[:start]) if pinned]
+            entry.prompt = "".join(kept) + "".join(entry.lines[start:])
+            entry.prompt_start = start
+        entry.prompt_length = len(entry.lines)
+        return entry.prompt + self.suffix
+
+
+class TestChatPromptBuilder(unittest.TestCase):
+    def naive(self, chat_history):
+        prompt = ""
+        for message in chat_history.messages:
+            role = "user" if message.role.lower() == "user" else "assistant"
+            prompt += f"{role}: {message.content}\n"
+        return prompt + "assistant: "
+
+    def test_incremental_matches_full_render(self):
+        builder = ChatPromptBuilder()
+        chat_history = ChatHistory()
+        for i in range(20):
+            chat_history.add_user_message(f"question {i}")
+            chat_history.add_assistant_message(f"answer {i}")
+            self.assertEqual(builder.build(chat_history), self.naive(chat_history))
+        self.assertEqual(builder.stats["rendered"], 40)
+
+        # 履歴を削ると作り直す
+        del chat_history.messages[:4]
+        self.assertEqual(builder.build(chat_history), self.naive(chat_history))
+        self.assertEqual(builder.stats["rebuilds"], 1)
+
+    def test_trims_oldest_and_keeps_system(self):
+        builder = ChatPromptBuilder(max_tokens=60)
+        chat_history = ChatHistory()
+        chat_history.add_system_message("You are a helpful assistant.")
+        for i in range(50):
+            chat_history.add_user_message(f"question number {i} about fibonacci")
+            prompt = builder.build(chat_history)
+            self.assertLessEqual(builder.counter.count(prompt), 60)
+        self.assertTrue(prompt.startswith("assistant: You are a helpful assistant.\n"))
+        self.assertIn("question number 49 ", prompt)
+        self.assertNotIn("question number 0 ", prompt)
+        self.assertGreater(builder.stats["trimmed"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -32,6 +32,14 @@ async def list_mcp_tools():
         env=env,
         shell=False
     )
+    # 常駐サーバーを共有する場合 (python mcp_proxy.py --listen /tmp/mcp_github.sock で起動しておく)
+    mux_socket = os.getenv("MCP_MUX_SOCKET")
+    if mux_socket:
+        server_params = StdioServerParameters(
+            command=sys.executable,
+            args=[os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp_proxy.py"), "--connect", mux_socket],
+            env=env,
+        )
     
     try:
         print(f"GITHUB_TOKEN設定: {'設定済み' if env.get('GITHUB_TOKEN') else '未設定'}")
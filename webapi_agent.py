@@ -0,0 +1,272 @@
+# Web API の結果を LLM で文章にする非 AI エージェント (consoleapp_nonAIAgentGroupchat.py から分離)
+#
+# 以前は同期の AzureOpenAI クライアントを async def の中で呼んでいたため、生成が終わるまで
+# イベントループ全体が止まり、invoke_stream はチャンクごとにそれまでの全文を返していました。
+# AsyncAzureOpenAI を使い、ストリーミングでは増えた分 (delta) だけを StreamingChatMessageContent で返します。
+# API の応答は共有の ApiResponseCache から取得し、reducer で質問に関係する部分だけにしてからプロンプトに入れます。
+#
+#   agent = WebAPIAgent(name="Reporter", instructions="...", api_url="https://www.jma.go.jp/bosai/forecast/data/forecast/130000.json",
+#                       reducer=reduce_jma_forecast)
+#   async for chunk in agent.invoke_stream("明日の東京の天気を教えて"):
+#       print(chunk.content, end="", flush=True)
+
+import asyncio
+import os
+import time
+import unittest
+from collections.abc import AsyncIterable
+
+import aiohttp
+from openai import AsyncAzureOpenAI
+from semantic_kernel import Kernel
+from semantic_kernel.agents import Agent
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.streaming_chat_message_content import StreamingChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+
+from prompt_builder import TokenCounter
+from webapi_cache import ApiResponseCache, PayloadReducer
+
+_default_client = None
+_default_cache = None
+_token_counter = None
+
+
+def make_openai_client() -> AsyncAzureOpenAI:
+    """A new AsyncAzureOpenAI built from the environment; the caller closes it."""
+    return AsyncAzureOpenAI(
+        azure_deployment=os.environ.get("AZURE_DEPLOYMENT_NAME"),
+        api_key=os.environ.get("AZURE_API_KEY"),
+        azure_endpoint=os.environ.get("AZURE_ENDPOINT"),
+        api_version=os.environ.get("AZURE_API_VERSION"),
+    )
+
+
+def default_openai_client() -> AsyncAzureOpenAI:
+    """AsyncAzureOpenAI built from the environment, shared by every agent that isn't given a client."""
+    global _default_client
+    if _default_client is None:
+        _default_client = make_openai_client()
+    return _default_client
+
+
+def default_api_cache() -> ApiResponseCache:
+    """ApiResponseCache shared by every agent that isn't given a cache."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ApiResponseCache()
+    return _default_cache
+
+
+def _count_tokens(text: str) -> int:
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter()
+    return _token_counter.count(text)
+
+
+class WebAPIAgent(Agent):
+    def __init__(
+        self,
+        name: str,
+        instructions: str,
+        api_url: str,
+        client: AsyncAzureOpenAI = None,
+        model: str = None,
+        cache: ApiResponseCache = None,
+        reducer: PayloadReducer = None,
+        kernel: Kernel = None,
+    ):
+        # kernel を省略するとエージェントごとに Kernel が作られる (ApiAgentRegistry は1つを共有する)
+        options = {"kernel": kernel} if kernel is not None else {}
+        super().__init__(id=f"{name}-{hash(name)}", name=name, description=instructions, **options)
+        # カスタムプロパティをメタデータに保存
+        self._api_url = api_url
+        self._client = client
+        self._model = model
+        self._cache = cache
+        self._reducer = reducer
+        # 応答の縮小とキャッシュでどれだけ減ったか
+        self._stats = {"calls": 0, "api_failures": 0, "api_seconds": 0.0, "raw_tokens": 0, "prompt_tokens": 0}
+
+    @property
+    def api_url(self):
+        return self._api_url
+
+    @property
+    def client(self) -> AsyncAzureOpenAI:
+        return self._client or default_openai_client()
+
+    @property
+    def model(self) -> str:
+        return self._model or os.environ.get("AZURE_DEPLOYMENT_NAME")
+
+    @property
+    def cache(self) -> ApiResponseCache:
+        return self._cache or default_api_cache()
+
+    @property
+    def stats(self) -> dict:
+        return self._stats
+
+    async def _call_api(self, question: str) -> str:
+        # Web API を呼び出し (TTL の間はキャッシュから)
+        started = time.perf_counter()
+        try:
+            api_result = await self.cache.get(self.api_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self._stats["api_failures"] += 1
+            raise
+        finally:
+            self._stats["api_seconds"] += time.perf_counter() - started
+        payload = self._reducer(api_result, question) if self._reducer else api_result
+        self._stats["calls"] += 1
+        self._stats["raw_tokens"] += _count_tokens(api_result)
+        self._stats["prompt_tokens"] += _count_tokens(payload)
+        return payload
+
+    def format_savings(self) -> str:
+        """Prompt tokens saved by the reducer and fetch time saved by the cache."""
+        stats = self._stats
+        cache_stats = self.cache.stats
+        saved_tokens = stats["raw_tokens"] - stats["prompt_tokens"]
+        saved_ratio = saved_tokens / stats["raw_tokens"] if stats["raw_tokens"] else 0.0
+        fetch_ms = cache_stats["fetch_seconds"] / cache_stats["misses"] * 1000 if cache_stats["misses"] else 0.0
+        return (
+            f"{self.name}: {stats['calls']} calls, API payload {stats['prompt_tokens']} of {stats['raw_tokens']} tokens "
+            f"({saved_ratio:.0%} saved), API wait {stats['api_seconds'] * 1000:.0f} ms; "
+            f"cache {cache_stats['hits']} hits / {cache_stats['misses']} fetches (~{cache_stats['hits'] * fetch_ms:.0f} ms saved)"
+        )
+
+    def _messages(self, api_result: str) -> list[dict]:
+        return [
+            {"role": "system", "content": self.description},  # instructionsをdescriptionに保存
+            {"role": "user", "content": f"以下のAPIレスポンスから天気予報を作成してください: {api_result}"}
+        ]
+
+    def _api_error(self, error: Exception) -> str:
+        return f"Web API の呼び出しに失敗しました ({self.api_url}): {error}"
+
+    async def invoke(self, input: str, **kwargs) -> AsyncIterable[ChatMessageContent]:
+        try:
+            api_result = await self._call_api(input)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # 失敗したページを LLM に渡さず、失敗したことを返す
+            yield ChatMessageContent(role=AuthorRole.ASSISTANT, name=self.name, content=self._api_error(e))
+            return
+        response = await self.client.chat.completions.create(model=self.model, messages=self._messages(api_result))
+        llm_content = response.choices[0].message.content
+
+        # APIの生JSONは非表示にします
+        yield ChatMessageContent(role=AuthorRole.ASSISTANT, name=self.name, content=llm_content)
+
+    async def get_response(self, chat_history, **kwargs):
+        # 最後のユーザーメッセージを取得
+        user_message = next((msg for msg in reversed(chat_history) if msg.role == AuthorRole.USER), None)
+        if user_message:
+            async for response in self.invoke(user_message.content, **kwargs):
+                return response
+        return ChatMessageContent(role=AuthorRole.ASSISTANT, name=self.name, content="申し訳ありませんが、ユーザーメッセージがありません。")
+
+    async def invoke_stream(self, input: str, **kwargs) -> AsyncIterable[StreamingChatMessageContent]:
+        """Yields each generated delta as it arrives; join the contents for the full text."""
+        try:
+            api_result = await self._call_api(input)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            yield StreamingChatMessageContent(
+                role=AuthorRole.ASSISTANT, name=self.name, choice_index=0, content=self._api_error(e)
+            )
+            return
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(api_result),
+            stream=True,
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield StreamingChatMessageContent(
+                        role=AuthorRole.ASSISTANT,
+                        name=self.name,
+                        choice_index=0,
+                        content=chunk.choices[0].delta.content,
+                    )
+        finally:
+            # 途中で反復をやめた場合も上流の接続を閉じる
+            await stream.close()
+
+
+class TestWebAPIAgent(unittest.TestCase):
+    class FakeStream:
+        def __init__(self, deltas, delay):
+            self.deltas = deltas
+            self.delay = delay
+            self.closed = False
+
+        def __aiter__(self):
+            return self._chunks()
+
+        async def _chunks(self):
+            from types import SimpleNamespace
+
+            for delta in self.deltas:
+                await asyncio.sleep(self.delay)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+        async def close(self):
+            self.closed = True
+
+    class FakeClient:
+        """Stands in for AsyncAzureOpenAI.chat.completions."""
+
+        def __init__(self, deltas, delay):
+            self.chat = self
+            self.completions = self
+            self.deltas = deltas
+            self.delay = delay
+            self.streams = []
+
+        async def create(self, model, messages, stream=False):
+            self.streams.append(TestWebAPIAgent.FakeStream(self.deltas, self.delay))
+            return self.streams[-1]
+
+    def test_agents_stream_deltas_concurrently(self):
+        from jma_stub_server import JMAStubServer
+
+        deltas = ["東京は", "晴れ", "時々", "くもり", "です。"]
+
+        from webapi_cache import reduce_jma_forecast
+
+        async def run():
+            async with JMAStubServer() as server, ApiResponseCache() as cache:
+                client = self.FakeClient(deltas, delay=0.1)
+                agents = [
+                    WebAPIAgent(
+                        f"Reporter{i}", "天気予報を作成してください。", f"{server.forecast_base_url}130000.json",
+                        client=client, model="test", cache=cache, reducer=reduce_jma_forecast,
+                    )
+                    for i in range(4)
+                ]
+
+                async def collect(agent):
+                    return [chunk async for chunk in agent.invoke_stream("東京の天気")]
+
+                started = time.perf_counter()
+                results = await asyncio.gather(*(collect(agent) for agent in agents))
+                return results, time.perf_counter() - started, client.streams, server.stats["requests"], agents[0]
+
+        results, elapsed, streams, api_requests, agent = asyncio.run(run())
+        for chunks in results:
+            self.assertEqual([chunk.content for chunk in chunks], deltas)
+            self.assertTrue(all(isinstance(chunk, StreamingChatMessageContent) for chunk in chunks))
+        # 1エージェント分 (5 x 0.1秒) とほぼ同じ時間で4つとも終わる
+        self.assertLess(elapsed, 0.5 * 2)
+        self.assertTrue(all(stream.closed for stream in streams))
+        # 同じ URL の取得は1回にまとまり、プロンプトには縮小した JSON が入る
+        self.assertEqual(api_requests, 1)
+        self.assertLess(agent.stats["prompt_tokens"], agent.stats["raw_tokens"] / 3)
+        self.assertIn("saved", agent.format_savings())
+
+
+if __name__ == "__main__":
+    unittest.main()
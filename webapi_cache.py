@@ -0,0 +1,339 @@
+# Web API の応答キャッシュと、LLM に渡す前に応答を小さくするリデューサー
+#
+# WebAPIAgent は質問のたびに新しい aiohttp.ClientSession で気象庁の予報 JSON 全体を取得し、
+# そのままプロンプトに貼っていました。
+# ApiResponseCache は1つのセッションを共有して URL ごとに応答を TTL の間だけ覚え、
+# 同じ URL への同時の取得は1回にまとめ、エンドポイント (scheme://host:port) ごとに同時取得数を制限できます。
+# reduce_jma_forecast は予報 JSON から質問に関係する地域の日付・天気・気温・降水確率だけを残します。
+#
+#   cache = ApiResponseCache(ttl=600)
+#   agent = WebAPIAgent(..., cache=cache, reducer=reduce_jma_forecast)
+#   ...
+#   print(agent.format_savings())
+#   await cache.close()
+
+import asyncio
+import json
+import time
+import unittest
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# (API の応答本文, 質問) -> LLM に渡す文字列
+PayloadReducer = Callable[[str, str], str]
+
+
+def endpoint_of(url: str) -> str:
+    """The endpoint a URL belongs to for concurrency limits: its scheme, host and port."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class _ConcurrencyLimit:
+    """A semaphore whose limit can be changed while fetches are waiting on it."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = deque()
+
+    def resize(self, limit: int):
+        self.limit = limit
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.active < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    async def __aenter__(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # 枠を受け取った直後にキャンセルされたら、次の待ち手に渡す
+            if waiter.done() and not waiter.cancelled():
+                self.active -= 1
+                self._wake()
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.active -= 1
+        self._wake()
+
+
+class ApiResponseCache:
+    """
+    Fetches URLs through one shared aiohttp session and caches 200 responses for `ttl` seconds.
+
+    Other statuses raise aiohttp.ClientResponseError and are not cached.
+
+    Args:
+        ttl: Seconds a response stays fresh.
+        max_entries: Least recently used URLs are dropped beyond this.
+        session: An existing session to use; it is not closed by close().
+        max_connections: Socket limit of the session created here (aiohttp's default 100).
+        max_connections_per_host: Per-host socket limit of that session; 0 means no limit.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_entries: int = 256,
+        session: aiohttp.ClientSession | None = None,
+        max_connections: int = 100,
+        max_connections_per_host: int = 0,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self._session = session
+        self._owns_session = session is None
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._limits = {}
+        self._active = {}
+        self.peak_in_flight = {}
+        self.stats = {"hits": 0, "misses": 0, "fetch_seconds": 0.0}
+
+    def set_concurrency(self, endpoint: str, limit: int):
+        """
+        Allows at most `limit` concurrent fetches to `endpoint` (a URL or its scheme://host:port).
+        Setting it again changes the limit in place, including for fetches already waiting.
+        """
+        endpoint = endpoint_of(endpoint)
+        if endpoint in self._limits:
+            self._limits[endpoint].resize(limit)
+        else:
+            self._limits[endpoint] = _ConcurrencyLimit(limit)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            # セッションはイベントループの中で作る必要があるので、最初に使うときに作る
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections_per_host)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._owns_session = True
+        return self._session
+
+    async def get(self, url: str) -> str:
+        entry = self._entries.get(url)
+        if entry is not None and time.monotonic() < entry[0]:
+            self._entries.move_to_end(url)
+            self.stats["hits"] += 1
+            return entry[1]
+        # 同じ URL を取得中なら、その結果を待つ
+        task = self._in_flight.get(url)
+        if task is not None:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            # 取得は独立したタスクで行い、最初の呼び出しがキャンセルされても他の待ち手は結果を受け取れる
+            task = asyncio.ensure_future(self._fetch(url))
+            self._in_flight[url] = task
+            task.add_done_callback(lambda done: self._fetch_done(url, done))
+        return await asyncio.shield(task)
+
+    def _fetch_done(self, url: str, task: asyncio.Task):
+        if self._in_flight.get(url) is task:
+            del self._in_flight[url]
+        # 待っている呼び出しがなくても "exception was never retrieved" を出さない
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, url: str) -> str:
+        endpoint = endpoint_of(url)
+        limit = self._limits.get(endpoint)
+        if limit is None:
+            return await self._fetch_now(url, endpoint)
+        async with limit:
+            return await self._fetch_now(url, endpoint)
+
+    async def _fetch_now(self, url: str, endpoint: str) -> str:
+        active = self._active[endpoint] = self._active.get(endpoint, 0) + 1
+        self.peak_in_flight[endpoint] = max(self.peak_in_flight.get(endpoint, 0), active)
+        try:
+            return await self._get(url)
+        finally:
+            self._active[endpoint] -= 1
+
+    async def _get(self, url: str) -> str:
+        started = time.perf_counter()
+        try:
+            async with self.session.get(url) as response:
+                # 404 や 503 のページを予報として LLM に渡さない
+                response.raise_for_status()
+                text = await response.text()
+        finally:
+            self.stats["fetch_seconds"] += time.perf_counter() - started
+        if response.status == 200:
+            self._entries[url] = (time.monotonic() + self.ttl, text)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+    def invalidate(self, url: str | None = None):
+        if url is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(url, None)
+
+    async def close(self):
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+def raw_payload(payload: str, question: str) -> str:
+    """The identity reducer: passes the response through unchanged."""
+    return payload
+
+
+def _area_matches(name: str, question: str) -> bool:
+    # "東京地方" は "東京" を含む質問に一致させる
+    return name in question or name.removesuffix("地方") in question
+
+
+def reduce_jma_forecast(payload: str, question: str) -> str:
+    """
+    Keeps the areas, dates, weathers, temps and pops of a JMA forecast JSON.
+
+    Only areas named in the question are kept; if none is named, all areas are.
+    Anything that isn't a JMA forecast is returned unchanged.
+    """
+    try:
+        reports = json.loads(payload)
+        series = [(s["timeDefines"], s["areas"]) for report in reports for s in report["timeSeries"]]
+        report_datetime = reports[0].get("reportDatetime")
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        return payload
+
+    areas = {}
+    for time_defines, series_areas in series:
+        for area in series_areas:
+            name = area["area"]["name"]
+            by_time = areas.setdefault(name, {})
+            for field, key in (("weathers", "weather"), ("temps", "temp"), ("pops", "pop")):
+                for time_define, value in zip(time_defines, area.get(field, [])):
+                    if value == "":
+                        continue
+                    # 日付と時刻だけにする (2025-05-09T06:00:00+09:00 -> 2025-05-09T06:00)
+                    by_time.setdefault(time_define[:16].removesuffix("T00:00"), {})[key] = value.replace("　", " ")
+
+    areas = {name: dict(sorted(by_time.items())) for name, by_time in areas.items()}
+    selected = {name: data for name, data in areas.items() if _area_matches(name, question)} or areas
+    reduced = {"reportDatetime": report_datetime, "areas": selected}
+    return json.dumps(reduced, ensure_ascii=False, separators=(",", ":"))
+
+
+class TestApiResponseCache(unittest.TestCase):
+    def test_caches_and_coalesces_fetches(self):
+        from jma_stub_server import JMAStubServer
+
+        async def run():
+            async with JMAStubServer(latency=0.05) as server, ApiResponseCache(ttl=0.3) as cache:
+                url = f"{server.forecast_base_url}130000.json"
+                first = await asyncio.gather(*(cache.get(url) for _ in range(5)))
+                await cache.get(url)
+                requests_before_expiry = server.stats["requests"]
+                await asyncio.sleep(0.35)
+                await cache.get(url)
+                return first, requests_before_expiry, server.stats["requests"], cache.stats
+
+        first, before, after, stats = asyncio.run(run())
+        self.assertEqual(len(set(first)), 1)
+        self.assertEqual(before, 1)
+        self.assertEqual(after, 2)
+        self.assertEqual(stats["hits"], 5)
+
+    def test_cancelled_caller_does_not_fail_other_waiters(self):
+        from jma_stub_server import JMAStubServer
+
+        async def run():
+            async with JMAStubServer(latency=0.1) as server, ApiResponseCache() as cache:
+                url = f"{server.forecast_base_url}130000.json"
+                first = asyncio.create_task(cache.get(url))
+                await asyncio.sleep(0.02)
+                others = [asyncio.create_task(cache.get(url)) for _ in range(3)]
+                await asyncio.sleep(0.02)
+                first.cancel()
+                results = await asyncio.gather(*others, return_exceptions=True)
+                return first.cancelled(), results, server.stats["requests"]
+
+        first_cancelled, results, requests = asyncio.run(run())
+        self.assertTrue(first_cancelled)
+        self.assertTrue(all(isinstance(result, str) and result.startswith("[") for result in results))
+        self.assertEqual(requests, 1)
+
+    def test_error_status_raises_and_is_not_cached(self):
+        from jma_stub_server import JMAStubServer
+
+        async def run():
+            async with JMAStubServer() as server, ApiResponseCache() as cache:
+                url = f"{server.forecast_base_url}999999.json"
+                errors = []
+                for _ in range(2):
+                    try:
+                        await cache.get(url)
+                    except aiohttp.ClientResponseError as e:
+                        errors.append(e.status)
+                return errors, server.stats["requests"]
+
+        errors, requests = asyncio.run(run())
+        self.assertEqual(errors, [404, 404])
+        self.assertEqual(requests, 2)
+
+    def test_concurrency_limit_is_resized_in_place(self):
+        from jma_stub_server import JMAStubServer
+
+        async def run():
+            async with JMAStubServer(latency=0.1) as server, ApiResponseCache() as cache:
+                urls = [server.area_codes_url] + [f"{server.forecast_base_url}{code}.json" for code in ("130000", "270000")]
+                cache.set_concurrency(server.base_url, 1)
+                fetches = [asyncio.create_task(cache.get(url)) for url in urls]
+                await asyncio.sleep(0.05)
+                # 待っている取得にも新しい上限が効く (置き換えると古い上限の待ち手が抜け出す)
+                cache.set_concurrency(urls[0], 2)
+                await asyncio.gather(*fetches)
+                return cache.peak_in_flight[server.base_url]
+
+        self.assertEqual(asyncio.run(run()), 2)
+
+    def test_reduce_jma_forecast(self):
+        import os
+
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "jma", "forecast", "130000.json")
+        with open(path, encoding="utf-8") as f:
+            payload = f.read()
+        reduced = reduce_jma_forecast(payload, "今日の東京の朝の天気教えて")
+        data = json.loads(reduced)
+        self.assertLess(len(reduced), len(payload) / 3)
+        self.assertEqual(sorted(data["areas"]), ["東京", "東京地方"])
+        self.assertEqual(data["areas"]["東京地方"]["2025-05-09"]["weather"], "晴れ 時々 くもり")
+        self.assertEqual(data["areas"]["東京"]["2025-05-09T09:00"]["temp"], "23")
+        # 地域名がなければ全地域を残す / 予報以外はそのまま
+        self.assertIn("小笠原諸島", json.loads(reduce_jma_forecast(payload, "天気は?"))["areas"])
+        self.assertEqual(reduce_jma_forecast("not json", "東京"), "not json")
+
+
+if __name__ == "__main__":
+    unittest.main()
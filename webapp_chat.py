@@ -1,7 +1,10 @@
 from typing import Annotated, AsyncGenerator
 import os
-import json
+import time
 import uuid
+import json_offload
+from intent_router import IntentRouter
+from direct_return import DirectReturnCollector, DirectReturnFilter, direct_return
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from starlette.websockets import WebSocketState  # starlette.websocketsからインポート
 from fastapi.responses import StreamingResponse
@@ -25,7 +28,8 @@ from semantic_kernel.exceptions import (
 from semantic_kernel.memory.volatile_memory_store import VolatileMemoryStore
 
 # MemoryRecordのインポートを追加 (履歴保存に必要)
-from semantic_kernel.agents import ChatCompletionAgent
+from semantic_kernel.agents import ChatCompletionAgent, ChatHistoryAgentThread
+from semantic_kernel.contents import AuthorRole, ChatMessageContent
 from semantic_kernel.functions import KernelArguments, kernel_function
 from semantic_kernel.connectors.ai import FunctionChoiceBehavior
 import uvicorn
@@ -45,6 +49,8 @@ class MenuPlugin:
         Special Drink: Chai Tea
         """
 
+    # The price is the whole answer, so skip the LLM call that would restate it
+    @direct_return
     @kernel_function(description="Provides the price of the requested menu item.")
     def get_item_price(
         self, menu_item: Annotated[str, "The name of the menu item."]
@@ -79,6 +85,7 @@ app.add_middleware(
 
 # Global variables
 agent = None
+router = None  # Optional fast-path router (FAST_PATH_ROUTER=1)
 volatile_store = None  # Initialize volatile_store globally
 connections = {}  # Store WebSocket connections and their associated threads/history
 
@@ -163,12 +170,25 @@ async def stream_chat_response(
         yield "Error: Agent not initialized."
         return
 
+    if router:
+        answer = await router.try_answer(user_input)
+        if answer is not None:
+            yield answer
+            chat_history.add_assistant_message(answer)
+            await save_chat_history(conversationid, chat_history)
+            return
+
     full_response = ""
+    started = time.perf_counter()
+    # Tool results that ended the function-calling loop are not streamed by the agent
+    direct_results = DirectReturnCollector()
+
     try:
         # Use agent.invoke_stream with the full history in messages
         # The agent should handle context and function calling based on this
         async for response_chunk in agent.invoke_stream(
             messages=chat_history.messages,  # Pass the list of messages
+            on_intermediate_message=direct_results,
             # thread=None, # Explicitly not using a persistent thread object here
             # arguments=... # Usually not needed if agent is initialized with settings
         ):
@@ -184,12 +204,21 @@ async def stream_chat_response(
                 chunk_content = str(response_chunk.text)
             else:
                 chunk_content = str(response_chunk)
+            chunk_content += direct_results.take()
 
             if chunk_content:
                 # Yield only the content part for simple text streaming
                 yield chunk_content
                 full_response += chunk_content
 
+        text = direct_results.take()
+        if text:
+            yield text
+            full_response += text
+
+        if router:
+            router.record_fallthrough(time.perf_counter() - started)
+
         # Save the updated history (user input + full assistant response)
         if full_response:
             # Ensure the role added matches what ChatHistory expects (e.g., AuthorRole.ASSISTANT or "assistant")
@@ -232,12 +261,13 @@ async def chat(request: Request, message: str):
 
 # Agent setup function
 async def setup_agent():
-    global agent
+    global agent, router
 
     # Kernel setup
     service_id = "agent_chat_service"  # Use a distinct service ID if needed
     kernel = Kernel()
     kernel.add_plugin(MenuPlugin(), plugin_name="menu")
+    kernel.add_filter("auto_function_invocation", DirectReturnFilter())
 
     # Configure Azure Chat Completion service
     try:
@@ -283,6 +313,10 @@ async def setup_agent():
     )
     print("ChatCompletionAgent created successfully.")
 
+    if os.environ.get("FAST_PATH_ROUTER") == "1":
+        router = IntentRouter(kernel)
+        print(f"Fast-path router enabled for: {[rule.name for rule in router.rules]}")
+
 
 # --- html と html2 変数を削除 ---
 
@@ -302,6 +336,12 @@ async def startup_event():
     print("Startup finished.")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # JSON デコード用のプロセスプールを使っていれば停止する
+    json_offload.shutdown()
+
+
 # --- ルートエンドポイントを修正 ---
 @app.get("/")
 async def get(request: Request):  # requestを追加
@@ -309,6 +349,14 @@ async def get(request: Request):  # requestを追加
     return templates.TemplateResponse("websocket_chat.html", {"request": request})
 
 
+# ファストパスのバイパス率と削減できたレイテンシ
+@app.get("/stats/fast-path")
+async def get_fast_path_stats():
+    if not router:
+        return {"enabled": False}
+    return {"enabled": True, **router.report()}
+
+
 # --- /stream エンドポイントを修正 ---
 @app.get("/stream")
 async def get_stream_page(request: Request):  # requestを追加
@@ -327,7 +375,7 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         while True:
             data_text = await websocket.receive_text()
-            data = json.loads(data_text)
+            data = await json_offload.loads(data_text)
             print(f"WS Received from {client_id}: {data}")  # Log received data
 
             if data["type"] == "init":
@@ -377,8 +425,27 @@ async def websocket_endpoint(websocket: WebSocket):
                 #     'message': user_input
                 # })
 
+                if router:
+                    answer = await router.try_answer(user_input)
+                    if answer is not None:
+                        await websocket.send_json(
+                            {"type": "stream_chunk", "sender": "Host", "message": answer}
+                        )
+                        chat_history.add_assistant_message(answer)
+                        # エージェントは thread の履歴しか見ないので、続きの質問のために thread にも残す
+                        fast_path_thread = current_connection.get("thread") or ChatHistoryAgentThread()
+                        await fast_path_thread.on_new_message(
+                            ChatMessageContent(role=AuthorRole.USER, content=user_input)
+                        )
+                        await fast_path_thread.on_new_message(
+                            ChatMessageContent(role=AuthorRole.ASSISTANT, content=answer)
+                        )
+                        current_connection["thread"] = fast_path_thread
+                        continue
+
                 # Invoke agent and stream response
                 full_response = ""
+                started = time.perf_counter()
                 agent_thread = current_connection.get("thread")  # Get thread if exists
 
                 if not agent:
@@ -394,8 +461,12 @@ async def websocket_endpoint(websocket: WebSocket):
                     # Pass the current history explicitly if needed by the agent implementation
                     # Note: ChatCompletionAgent might implicitly use history if passed via messages/thread
                     # Let's rely on the agent managing state via thread, passing only new message
+                    # Tool results that ended the function-calling loop, rendered as in /chat
+                    direct_results = DirectReturnCollector()
                     async for response_chunk in agent.invoke(
-                        messages=user_input, thread=agent_thread
+                        messages=user_input,
+                        thread=agent_thread,
+                        on_intermediate_message=direct_results,
                     ):
                         # response_chunk is likely a ChatMessageContent or similar
                         chunk_content = ""
@@ -409,6 +480,7 @@ async def websocket_endpoint(websocket: WebSocket):
                             chunk_content = str(response_chunk.text)
                         else:
                             chunk_content = str(response_chunk)
+                        chunk_content += direct_results.take()
 
                         if hasattr(response_chunk, "name") and response_chunk.name:
                             sender_name = response_chunk.name
@@ -433,6 +505,9 @@ async def websocket_endpoint(websocket: WebSocket):
                                 response_chunk.thread
                             )  # Update local variable too
 
+                    if router:
+                        router.record_fallthrough(time.perf_counter() - started)
+
                     # After streaming, add the full assistant message to history
                     if full_response:
                         chat_history.add_assistant_message(full_response)